@@ -2,7 +2,7 @@
 
 from qcdata import CalcType, ProgramInput, Structure
 
-from bigchem import compute, group
+from bigchem.algos import parallel_compute
 
 # Create the structures
 # Can also open a structure from a file
@@ -31,17 +31,18 @@ structures = [
     ),
 ]
 
-# Submit a group of computations to BigChem
-future_output = group(
-    compute.s(
-        "psi4",
+# Submit a group of computations to BigChem. The most expensive calculations are
+# submitted first so the group isn't held up by a large molecule started last.
+future_output = parallel_compute(
+    "psi4",
+    [
         ProgramInput(
             structure=structure,
             calctype=CalcType.energy,
             model={"method": "b3lyp", "basis": "6-31g"},  # type: ignore
-        ),
-    )
-    for structure in structures
+        )
+        for structure in structures
+    ],
 ).delay()
 
 # Check if group is ready (optional)
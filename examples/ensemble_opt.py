@@ -0,0 +1,38 @@
+"""Optimize many conformers of a molecule with a cheap method, then refine only the
+unique low energy conformers with more expensive methods"""
+
+from qcdata import CalcType, ProgramArgsSub, Structure
+
+from bigchem import ensemble_opt
+
+# Open the conformers, e.g., generated with RDKit or CREST
+structures = Structure.open_multi("path/to/conformers.xyz")
+
+# Define the program for each optimization step. The first step screens all conformers.
+programs = ["geometric", "geometric"]
+
+# Define the parameters for each program
+program_args = [
+    ProgramArgsSub(
+        subprogram="xtb",
+        subprogram_args={"model": {"method": "GFN2xTB"}},  # type: ignore
+    ),
+    ProgramArgsSub(
+        subprogram="terachem",
+        subprogram_args={"model": {"method": "b3lyp", "basis": "6-31g"}},  # type: ignore # noqa: E501
+    ),
+]
+
+# Only refine unique conformers within 5 kcal/mol (in Hartree) of the lowest one
+future_result = ensemble_opt(
+    structures,
+    CalcType.optimization,
+    programs,
+    program_args,
+    energy_window=5 / 627.5,
+).delay()
+outputs = future_result.get()
+future_result.forget()
+
+for output in outputs:
+    print(output.data.final_energy)
@@ -0,0 +1,25 @@
+"""Transition state search starting from an exact hessian computed in parallel"""
+
+from qcdata import DualProgramInput, Structure
+
+from bigchem import parallel_hessian_opt
+
+# Guess of the transition state structure
+structure = Structure.open("path/to/ts_guess.xyz")
+
+# Define the transition state search. The hessian is computed with the subprogram.
+prog_input = DualProgramInput(
+    structure=structure,
+    calctype="transition_state",  # type: ignore
+    keywords={"maxiter": 100},
+    subprogram="terachem",
+    subprogram_args={"model": {"method": "b3lyp", "basis": "6-31g"}},  # type: ignore
+)
+
+# Recompute the hessian in parallel every 10 steps
+future_output = parallel_hessian_opt(prog_input, hessian_every=10).delay()
+output = future_output.get()
+future_output.forget()
+
+print(output.data.final_structure)
+print(f"Hessians computed: {output.data.extras['n_hessians']}")
@@ -0,0 +1,34 @@
+"""Two-body expansion energy and gradient of a water trimer"""
+
+from qcdata import ProgramInput, Structure
+
+from bigchem.algos import parallel_mbe
+
+structure = Structure(
+    symbols=["O", "H", "H"] * 3,
+    geometry=[  # type: ignore
+        [-2.75, 1.59, 0.0],
+        [-1.07, 0.93, 0.0],
+        [-3.66, 0.0, 0.0],
+        [2.75, 1.59, 0.0],
+        [2.18, -0.12, 0.0],
+        [4.52, 1.43, 0.0],
+        [0.0, -3.18, 0.0],
+        [-1.11, -4.59, 0.0],
+        [1.11, -1.82, 0.0],
+    ],
+)
+
+prog_input = ProgramInput(
+    structure=structure,
+    calctype="gradient",  # type: ignore
+    model={"method": "b3lyp", "basis": "6-31g"},  # type: ignore
+)
+
+# The three water molecules are found from their bonds
+future_output = parallel_mbe("psi4", prog_input, order=2).delay()
+output = future_output.get()
+future_output.forget()
+
+print(output.data.extras["mbe_energies"])
+print(output.data.gradient)
@@ -0,0 +1,46 @@
+"""Run independent molecular dynamics trajectories in parallel"""
+
+from uuid import uuid4
+
+from qcdata import ProgramInput, Structure
+
+from bigchem.accumulator import read_trajectory
+from bigchem.algos import parallel_md
+
+structure = Structure(
+    symbols=["O", "H", "H"],
+    geometry=[  # type: ignore
+        [0.0, 0.0, 0.0],
+        [0.52421003, 1.68733646, 0.48074633],
+        [1.14668581, -0.45032174, -1.35474466],
+    ],
+)
+
+prog_input = ProgramInput(
+    structure=structure,
+    calctype="gradient",  # type: ignore
+    model={"method": "b3lyp", "basis": "6-31g"},  # type: ignore
+)
+
+# 16 trajectories of 1000 steps (0.5 fs) with initial velocities sampled at 300 K
+key = str(uuid4())
+future_output = parallel_md(
+    "terachem",
+    prog_input,
+    key,
+    n_steps=1000,
+    n_replicas=16,
+    temperature=300,
+    seed=0,
+    frame_every=10,
+    reuse_wfn=True,
+).delay()
+
+# Frames are available while the trajectories run
+print(read_trajectory(f"{key}-0")["time"])
+
+outputs = future_output.get()
+future_output.forget()
+
+trajectory = read_trajectory(f"{key}-0")
+print(trajectory["potential_energy"] + trajectory["kinetic_energy"])
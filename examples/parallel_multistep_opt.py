@@ -0,0 +1,40 @@
+"""Funnel-style optimization of many structures: every stage optimizes all remaining
+structures in parallel and only the lowest energy structures move on to the next,
+more expensive stage."""
+
+from qcdata import CalcType, ProgramArgsSub, Structure
+
+from bigchem import parallel_multistep_opt
+
+# Open the structures to compare, e.g., conformers of a molecule
+structures = Structure.open_multi("path/to/conformers.xyz")
+
+# Define the program for each optimization step
+programs = ["geometric", "geometric", "geometric"]
+
+# Define the parameters for each program
+program_args = [
+    ProgramArgsSub(
+        subprogram="xtb",
+        subprogram_args={"model": {"method": "GFN2xTB"}},  # type: ignore
+    ),
+    ProgramArgsSub(
+        subprogram="terachem",
+        subprogram_args={"model": {"method": "b3lyp", "basis": "6-31g"}},  # type: ignore # noqa: E501
+    ),
+    ProgramArgsSub(
+        subprogram="psi4",
+        subprogram_args={"model": {"method": "CCSD(T)", "basis": "cc-PVQZ"}},  # type: ignore # noqa: E501
+    ),
+]
+
+# Only keep structures within 3 kcal/mol (in Hartree) of the lowest one after each stage
+future_result = parallel_multistep_opt(
+    structures,
+    CalcType.optimization,
+    programs,
+    program_args,  # type: ignore
+    energy_window=3 / 627.5,
+).delay()
+results = future_result.get()
+future_result.forget()
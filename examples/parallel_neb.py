@@ -0,0 +1,42 @@
+from qcdata import ProgramInput, Structure
+
+from bigchem.algos import parallel_neb
+
+# Create the endpoints of the reaction path: the inversion of ammonia
+reactant = Structure(
+    symbols=["N", "H", "H", "H"],
+    geometry=[  # type: ignore
+        [0.0, 0.0, 0.0],
+        [1.77, 0.0, -0.72],
+        [-0.885, 1.533, -0.72],
+        [-0.885, -1.533, -0.72],
+    ],
+)
+product = Structure(
+    symbols=reactant.symbols,
+    geometry=reactant.geometry * [1, 1, -1],  # type: ignore
+)
+
+# Create ProgramInput defining the model used for every image
+my_input = ProgramInput(
+    structure=reactant,
+    calctype="gradient",  # type: ignore
+    model={"method": "b3lyp", "basis": "6-31g"},  # type: ignore
+)
+
+# Submit computation to BigChem. The gradients of all images are computed in parallel
+# on every iteration and the path is optimized on the workers until convergence
+future_output = parallel_neb("psi4", my_input, [reactant, product], n_images=9).delay()
+
+# Check status (optional)
+print(future_output.status)
+
+# Get result from BigChem
+path = future_output.get()
+
+# Remove result from backend
+future_output.forget()
+
+for image in path:
+    print(image.data.energy, image.data.extras["neb_climbing"])
+print(f"Converged: {path[0].data.extras['neb_converged']}")
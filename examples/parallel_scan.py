@@ -0,0 +1,41 @@
+"""Relaxed scan of the H-O-O-H dihedral of hydrogen peroxide"""
+
+from qcdata import DualProgramInput, Structure
+
+from bigchem.algos import parallel_scan
+
+structure = Structure(
+    symbols=["H", "O", "O", "H"],
+    geometry=[  # type: ignore
+        [1.5, 1.2, 0.3],
+        [0.0, 1.3, 0.0],
+        [0.0, -1.3, 0.0],
+        [1.5, -1.2, -0.5],
+    ],
+)
+
+prog_input = DualProgramInput(
+    structure=structure,
+    calctype="optimization",  # type: ignore
+    keywords={},
+    subprogram="psi4",
+    subprogram_args={"model": {"method": "b3lyp", "basis": "6-31g"}},  # type: ignore
+)
+
+# Dihedral from -180 to 165 degrees in 15 degree steps
+scans = [
+    {
+        "type": "dihedral",
+        "indices": [0, 1, 2, 3],
+        "start": -180,
+        "stop": 165,
+        "steps": 24,
+    }
+]
+
+future_result = parallel_scan("geometric", prog_input, scans).delay()
+result = future_result.get()
+future_result.forget()
+
+for dihedral, energy in zip(result["values"][0], result["energies"]):
+    print(f"{dihedral:7.1f} {energy:.8f}")
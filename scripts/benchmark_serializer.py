@@ -0,0 +1,107 @@
+"""Compare message sizes and encode/decode times of the pickle and bigchem serializers.
+
+Messages mimic a parallel_hessian: one displaced gradient input per task and one
+gradient output (with logs) per result. Run with:
+
+    python scripts/benchmark_serializer.py --atoms 50 --repeat 20
+"""
+
+import argparse
+import pickle
+import time
+from typing import Any, Callable
+
+import numpy as np
+from qcdata import ProgramInput, ProgramOutput, Structure
+
+from bigchem.serializers import dumps, loads
+from bigchem.utils import _gradient_inputs
+
+
+def build_messages(n_atoms: int) -> tuple[list[ProgramInput], list[ProgramOutput]]:
+    """Create the task messages and results of a parallel_hessian for n_atoms"""
+    rng = np.random.default_rng(0)
+    structure = Structure(
+        symbols=["C"] * n_atoms, geometry=rng.random((n_atoms, 3)) * n_atoms
+    )
+    prog_input = ProgramInput(
+        structure=structure,
+        calctype="gradient",
+        model={"method": "b3lyp", "basis": "6-31g"},
+        keywords={"convthre": 1e-8},
+    )
+    inputs = _gradient_inputs(prog_input, 5.0e-3)
+    outputs = [
+        ProgramOutput(
+            input_data=inp,
+            success=True,
+            logs="SCF iteration output...\n" * 200,
+            data={
+                "energy": -40.0 * n_atoms,
+                "gradient": rng.random((n_atoms, 3)),
+            },
+            provenance={"program": "terachem"},
+        )
+        for inp in inputs
+    ]
+    return inputs, outputs
+
+
+def benchmark(
+    messages: list[Any],
+    encode: Callable[[Any], bytes],
+    decode: Callable[[bytes], Any],
+    repeat: int,
+) -> tuple[int, float, float]:
+    """Return total bytes and mean encode and decode time (s) per message"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        encoded = [encode(message) for message in messages]
+    encode_time = (time.perf_counter() - start) / (repeat * len(messages))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for data in encoded:
+            decode(data)
+    decode_time = (time.perf_counter() - start) / (repeat * len(messages))
+    return sum(len(data) for data in encoded), encode_time, decode_time
+
+
+def with_zstd(
+    encode: Callable[[Any], bytes], decode: Callable[[bytes], Any]
+) -> tuple[Callable[[Any], bytes], Callable[[bytes], Any]]:
+    """Wrap encode and decode functions with zstd compression"""
+    import zstandard
+
+    compressor = zstandard.ZstdCompressor()
+    decompressor = zstandard.ZstdDecompressor()
+    return (
+        lambda obj: compressor.compress(encode(obj)),
+        lambda data: decode(decompressor.decompress(data)),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--atoms", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    inputs, outputs = build_messages(args.atoms)
+    serializers = {
+        "pickle": (pickle.dumps, pickle.loads),
+        "bigchem": (dumps, loads),
+        "pickle+zstd": with_zstd(pickle.dumps, pickle.loads),
+        "bigchem+zstd": with_zstd(dumps, loads),
+    }
+
+    print(f"{args.atoms} atoms, {len(inputs)} messages")
+    print(f"{'':14}{'':>10}{'bytes':>12}{'encode (us)':>14}{'decode (us)':>14}")
+    for kind, messages in (("inputs", inputs), ("outputs", outputs)):
+        for name, (encode, decode) in serializers.items():
+            size, enc, dec = benchmark(messages, encode, decode, args.repeat)
+            print(f"{name:14}{kind:>10}{size:>12}{enc * 1e6:>14.1f}{dec * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Shared stores that collect arrays from many tasks as they complete.
+
+Used by the accumulator mode of parallel_hessian: every gradient task writes its
+result under a job key instead of returning it, so the result backend never holds all
+gradient outputs at once and the progress of a job can be observed while it runs.
+Molecular dynamics trajectories (see algos.parallel_md) stream their frames to it.
+"""
+
+import io
+import os
+import shutil
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional, Union
+
+import numpy as np
+
+from .config import settings
+
+
+def _to_bytes(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _from_bytes(data: bytes) -> np.ndarray:
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+class Accumulator(ABC):
+    """Base class for stores of indexed arrays grouped under a job key"""
+
+    def add(self, key: str, index: int, array: np.ndarray) -> None:
+        """Store array at position index of job key"""
+        self._add(key, index, _to_bytes(np.asarray(array)))
+
+    def read(self, key: str) -> dict[int, np.ndarray]:
+        """Return all arrays stored for job key by index"""
+        return {index: _from_bytes(data) for index, data in self._read(key).items()}
+
+    @abstractmethod
+    def progress(self, key: str) -> int:
+        """Number of arrays stored for job key"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove all arrays stored for job key"""
+
+    @abstractmethod
+    def _add(self, key: str, index: int, value: bytes) -> None:
+        """Backend specific storage"""
+
+    @abstractmethod
+    def _read(self, key: str) -> dict[int, bytes]:
+        """Backend specific lookup"""
+
+
+class DiskAccumulator(Accumulator):
+    """Store arrays as files in a local (or shared) directory, one directory per job
+
+    Params:
+        directory: Directory holding the job directories
+        ttl: Seconds after the last write before a job's arrays expire. None for no
+            expiration. Expired jobs, e.g., of failed or abandoned jobs, are removed
+            by the next write to any job.
+    """
+
+    def __init__(self, directory: Union[str, Path], ttl: Optional[int] = None):
+        self.directory = Path(directory)
+        self.ttl = ttl
+
+    def _expired(self, job_dir: Path) -> bool:
+        try:
+            mtime = job_dir.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        return self.ttl is not None and time.time() - mtime > self.ttl
+
+    def _job_dir(self, key: str) -> Path:
+        """Directory of job key, removed first if it expired"""
+        job_dir = self.directory / key
+        if self._expired(job_dir):
+            shutil.rmtree(job_dir, ignore_errors=True)
+        return job_dir
+
+    def _add(self, key: str, index: int, value: bytes) -> None:
+        job_dir = self._job_dir(key)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        # Write then rename so readers never see partial files
+        tmp_path = job_dir / f".{index}.{time.time_ns()}.tmp"
+        tmp_path.write_bytes(value)
+        tmp_path.replace(job_dir / f"{index}.npy")
+        # The mtime of the job directory is the time of its last write
+        os.utime(job_dir)
+        if self.ttl is not None:
+            for other in self.directory.iterdir():
+                if other.is_dir() and self._expired(other):
+                    shutil.rmtree(other, ignore_errors=True)
+
+    def _read(self, key: str) -> dict[int, bytes]:
+        return {
+            int(path.stem): path.read_bytes()
+            for path in self._job_dir(key).glob("*.npy")
+        }
+
+    def progress(self, key: str) -> int:
+        return len(list(self._job_dir(key).glob("*.npy")))
+
+    def delete(self, key: str) -> None:
+        shutil.rmtree(self.directory / key, ignore_errors=True)
+
+
+class RedisAccumulator(Accumulator):
+    """Store arrays as the fields of a Redis hash per job, e.g., in the result backend
+
+    Params:
+        url: Redis connection url
+        ttl: Seconds after the last write before a job's arrays expire. None for no
+            expiration.
+        prefix: Prefix for all keys written by the accumulator
+    """
+
+    def __init__(
+        self,
+        url: str = settings.bigchem_backend_url,
+        ttl: Optional[int] = None,
+        prefix: str = "bigchem:accumulator:",
+    ):
+        # Import here so the redis client is only required when the accumulator is used
+        import redis
+
+        self.client: Any = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _add(self, key: str, index: int, value: bytes) -> None:
+        name = f"{self.prefix}{key}"
+        pipeline = self.client.pipeline()
+        pipeline.hset(name, str(index), value)
+        if self.ttl is not None:
+            pipeline.expire(name, self.ttl)
+        pipeline.execute()
+
+    def _read(self, key: str) -> dict[int, bytes]:
+        fields = self.client.hgetall(f"{self.prefix}{key}")
+        return {int(index): value for index, value in fields.items()}
+
+    def progress(self, key: str) -> int:
+        return int(self.client.hlen(f"{self.prefix}{key}"))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(f"{self.prefix}{key}")
+
+
+@lru_cache(maxsize=None)
+def get_accumulator() -> Accumulator:
+    """Return the accumulator for BigChem algorithms
+
+    Arrays are kept in bigchem_accumulator_dir if set, otherwise in the result
+    backend. Either way they expire with the same lifetime as regular results.
+    """
+    if settings.bigchem_accumulator_dir is not None:
+        return DiskAccumulator(
+            settings.bigchem_accumulator_dir, ttl=settings.bigchem_result_expires
+        )
+    return RedisAccumulator(
+        settings.bigchem_backend_url, ttl=settings.bigchem_result_expires
+    )
+
+
+def _pack_frame(
+    time: float,
+    potential_energy: float,
+    kinetic_energy: float,
+    geometry: np.ndarray,
+    velocity: np.ndarray,
+) -> np.ndarray:
+    """Pack a molecular dynamics frame into one (2N + 1, 3) array
+
+    The first row holds the time and energies, followed by the geometry and velocity.
+    """
+    header = np.array([[time, potential_energy, kinetic_energy]])
+    return np.concatenate([header, geometry, velocity])
+
+
+def read_trajectory(
+    key: str, accumulator: Optional[Accumulator] = None
+) -> dict[str, np.ndarray]:
+    """Read the frames of a molecular dynamics trajectory written by tasks.md_trajectory
+
+    Frames can be read while the trajectory is still running.
+
+    Params:
+        key: Key of the trajectory, e.g., f"{key}-{i}" for replica i of parallel_md
+        accumulator: Store holding the frames. Defaults to get_accumulator().
+
+    Returns:
+        Arrays over the frames in order: "time" (fs), "potential_energy" and
+            "kinetic_energy" (Hartree), "geometry" (Bohr, shape (n_frames, N, 3)), and
+            "velocity" (Bohr per atomic time unit, shape (n_frames, N, 3))
+    """
+    frames = (accumulator or get_accumulator()).read(key)
+    stacked = np.array([frames[i] for i in sorted(frames)]).reshape(len(frames), -1, 3)
+    n_atoms = (stacked.shape[1] - 1) // 2
+    return {
+        "time": stacked[:, 0, 0],
+        "potential_energy": stacked[:, 0, 1],
+        "kinetic_energy": stacked[:, 0, 2],
+        "geometry": stacked[:, 1 : n_atoms + 1],
+        "velocity": stacked[:, n_atoms + 1 :],
+    }
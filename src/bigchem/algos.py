@@ -1,26 +1,122 @@
 """Top level functions for parallelized BigChem algorithms"""
 
-from typing import Union
+import itertools
+from typing import Any, Optional, Union
 
+import numpy as np
 from qcdata import (
     CalcType,
     DualProgramInput,
     ProgramArgs,
     ProgramArgsSub,
     ProgramInput,
+    ProgramOutput,
     Structure,
 )
 
+from .cache import get_checkpoint_store, input_hash
 from .canvas import Signature, group
 from .config import settings
-from .tasks import assemble_hessian, compute, frequency_analysis, output_to_input
-from .utils import _gradient_inputs
+from .cost import estimated_runtime
+from .routing import _prioritized
+from .tasks import (
+    assemble_accumulated_hessian,
+    assemble_energy_hessian,
+    assemble_gradient,
+    assemble_hessian,
+    assemble_mbe,
+    assemble_scan,
+    compute,
+    compute_accumulated,
+    compute_batch,
+    compute_checkpointed,
+    compute_with_guess,
+    continue_hessian_opt,
+    frequency_analysis,
+    md_trajectory,
+    merge_checkpoints,
+    neb_step,
+    output_to_input,
+    prune_stage,
+    restore_order,
+    scan_wavefront,
+    select_conformers,
+    store_wfn,
+)
+from .utils import (
+    _active_atoms,
+    _batch_size,
+    _batches,
+    _check_logs,
+    _constrained_input,
+    _energy_hessian_inputs,
+    _fragments,
+    _gradient_inputs,
+    _interpolate_path,
+    _longest_first,
+    _mbe_subsystems,
+    _program_input,
+    _scan_seed,
+    _scan_values,
+    _set_coordinates,
+    _supports_wfn_reuse,
+    _symmetry_operations,
+    _symmetry_unique_atoms,
+    _unique_geometries,
+    _vibrational_basis,
+)
+
+
+def parallel_compute(
+    program: str,
+    prog_inputs: list[ProgramInput],
+    logs: str = "keep",
+    batch_size: Optional[int] = None,
+    priority: Optional[int] = None,
+    **kwargs,
+) -> Signature:
+    """Create a signature computing independent calculations in parallel
+
+    Unlike a plain group of compute tasks the calculations are submitted longest
+    first by estimated runtime (see cost.py), so a group of mixed-size calculations
+    finishes when its most expensive calculation does rather than when the last
+    submitted one does.
+
+    Params:
+        program: Program to use for all calculations
+        prog_inputs: Inputs to compute
+        logs: Keep, drop, or offload the logs of the outputs. See compute.
+        batch_size: If set, run this many calculations of similar cost sequentially
+            in each task. See parallel_hessian.
+        priority: Priority of the calculations. See parallel_hessian.
+        kwargs: Keyword arguments passed to compute
+
+    Returns:
+        Signature returning the list of outputs in the order of prog_inputs
+    """
+    _check_logs(logs)
+    return _prioritized(
+        _compute_group(program, prog_inputs, batch_size, logs=logs, **kwargs),
+        priority,
+    )
 
 
 def parallel_hessian(
     program: str,
     prog_input: ProgramInput,
     dh: float = settings.bigchem_default_hessian_dh,
+    symmetry: bool = False,
+    symmetry_tol: float = settings.bigchem_symmetry_tolerance,
+    stencil: str = "central",
+    projected: bool = False,
+    active_atoms: Optional[list[int]] = None,
+    checkpoint: bool = False,
+    logs: str = "keep",
+    batch_size: Optional[Union[int, str]] = None,
+    reuse_wfn: bool = False,
+    symmetrize: bool = False,
+    accumulator_key: Optional[str] = None,
+    priority: Optional[int] = None,
 ) -> Signature:
     """Create parallel hessian signature
 
@@ -28,27 +124,269 @@ def parallel_hessian(
         program: Compute engine to use for gradient calculations
         prog_input: ProgramInput with driver=hessian
         dh: Displacement for finite difference computation
+        symmetry: If True, detect the point group of the structure and only displace
+            symmetry-unique atoms. The rest of the hessian is reconstructed by applying
+            the symmetry operations in assemble_hessian. Requires that the program
+            returns gradients in the input frame (no reorientation).
+        symmetry_tol: Max distance (Bohr) between an atom and the image of an
+            equivalent atom for a symmetry operation to be accepted
+        stencil: "central" for O(dh^2) central differences using 2 gradients per
+            coordinate. "forward" for O(dh) forward differences using 1 gradient per
+            coordinate plus a single reference gradient, about half the cost.
+            "five-point" for O(dh^4) differences using 4 gradients per coordinate
+            (displaced by dh and 2 * dh), equivalent to Richardson extrapolation of
+            central differences with two step sizes. All displacements are computed
+            concurrently in one group. The change made by the extrapolation is
+            reported in .data.extras["hessian_richardson_error"].
+        projected: If True, displace along the 3N-6 (3N-5 for linear structures)
+            directions orthogonal to rigid-body translations and rotations instead of
+            along all 3N Cartesian coordinates. The hessian is back-transformed to
+            Cartesian coordinates with translations and rotations projected out,
+            which is exact at stationary points.
+        active_atoms: Indices of the atoms to displace. Only 6k gradients are computed
+            for k active atoms and the result is a partial hessian with zeros in the
+            block between inactive atoms. Useful for the reactive site of large
+            systems.
+        checkpoint: If True, every completed gradient is saved to the checkpoint
+            store. Resubmitting the same hessian reuses the saved gradients and only
+            dispatches the missing ones, e.g., after a worker failed part of the chord.
+        logs: "keep" to store the full program logs with every gradient, "drop" to
+            remove them, or "offload" to write them to bigchem_logs_dir and store only
+            the file path. Since assemble_hessian discards the logs of the gradients,
+            "drop" or "offload" greatly reduce result backend memory for large
+            molecules. The returned hessian carries the (handled) logs of the
+            calculation on the original geometry.
+        batch_size: If set, run this many gradients sequentially in each task instead
+            of one task per gradient, which reduces broker round trips and program
+            startup overhead for small molecules. "auto" picks the batch size from the
+            number of atoms (see bigchem_batch_atoms).
+        reuse_wfn: If True, first run the calculation on the original geometry, then
+            start the SCF of every displaced gradient from its converged wavefunction,
+            which cuts the SCF iterations per gradient. Requires a program whose
+            qccompute adapter supports wavefunction propagation (e.g., TeraChem).
+            The wavefunction is shared through the checkpoint store instead of being
+            sent with every task. Cannot be combined with checkpoint.
+        symmetrize: If True, return the symmetrized hessian (H + H^T) / 2. The
+            asymmetry of the finite difference hessian is reported in
+            .data.extras["hessian_asymmetry"] either way.
+        accumulator_key: If set, every gradient task writes its gradient to the
+            accumulator (a Redis hash in the result backend or bigchem_accumulator_dir)
+            under this key instead of returning its output, so the backend never holds
+            all gradient outputs at once. The number of completed gradients can be
+            observed with get_accumulator().progress(accumulator_key). Use a unique
+            key per job, e.g., a uuid. Cannot be combined with checkpoint, reuse_wfn,
+            or batch_size.
+        priority: Priority of the gradient calculations from 0 to
+            bigchem_max_priority (higher first), e.g., to run an interactive job
+            ahead of queued batch work. Requires bigchem_priorities. Defaults to a
+            priority from the estimated runtime of each calculation. Reducers always
+            run at the highest priority. See routing.py.
 
     Note: Creates a Celery Chord where gradients are computed in parallel, then the
         list of gradients is passed as the first argument to the hessian celery task.
         If called asynchronously, this function will return an AsyncResult with a
         .parent attribute referencing the group of gradient computations. The last
         computation in the gradient list is a basic energy calculation of the original
-        geometry. It is used to create the final AtomicResult object for the hessian.
+        geometry (a gradient calculation for the "forward" stencil). It is used to
+        create the final AtomicResult object for the hessian.
     """
     assert prog_input.calctype == CalcType.hessian, (
         f"input_data.driver should be '{CalcType.hessian}', got '{prog_input.calctype}'"
     )
 
-    gradients = _gradient_inputs(prog_input, dh)
-    # Perform basic energy computation on original structure as final item in group
+    if sum([symmetry, projected, active_atoms is not None]) > 1:
+        raise ValueError("Only one of symmetry, projected, or active_atoms may be set.")
+    _check_logs(logs)
+    if reuse_wfn and checkpoint:
+        raise ValueError("reuse_wfn cannot be combined with checkpoint.")
+    if accumulator_key is not None and (checkpoint or reuse_wfn or batch_size):
+        raise ValueError(
+            "accumulator_key cannot be combined with checkpoint, reuse_wfn, or "
+            "batch_size."
+        )
+    if reuse_wfn and not _supports_wfn_reuse(program):
+        raise ValueError(
+            f"The qccompute adapter for {program} can't reuse wavefunctions."
+        )
+
+    if active_atoms is not None:
+        active_atoms = _active_atoms(active_atoms, len(prog_input.structure.symbols))
+    atoms, directions = active_atoms, None
+    if symmetry:
+        atoms = _symmetry_unique_atoms(
+            _symmetry_operations(prog_input.structure, symmetry_tol)
+        )
+    if projected:
+        directions = _vibrational_basis(prog_input.structure.geometry)
+    gradients = _gradient_inputs(prog_input, dh, atoms, stencil, directions)
+    # Perform basic energy computation on original structure as final item in group.
+    # Forward differences need the gradient there too, which includes the energy.
     energy_calc = prog_input.model_dump()
-    energy_calc["calctype"] = "energy"
+    energy_calc["calctype"] = "gradient" if stencil == "forward" else "energy"
     gradients.append(ProgramInput(**energy_calc))
 
+    hessian = assemble_hessian.s(
+        dh,
+        symmetry_tol if symmetry else None,
+        stencil,
+        projected,
+        active_atoms,
+        symmetrize,
+    )
+    if batch_size is not None:
+        batch_size = _batch_size(
+            batch_size, len(prog_input.structure.symbols), len(gradients)
+        )
+    if accumulator_key is not None:
+        reference = gradients.pop()
+        accumulated = group(
+            *(
+                compute_accumulated.s(program, p_inp, accumulator_key, i, logs=logs)
+                for i, p_inp in enumerate(gradients)
+            ),
+            compute.s(program, reference, logs=logs),
+        )
+        return _prioritized(
+            accumulated
+            | assemble_accumulated_hessian.s(
+                accumulator_key,
+                len(gradients),
+                dh,
+                symmetry_tol if symmetry else None,
+                stencil,
+                projected,
+                active_atoms,
+                symmetrize,
+            ),
+            priority,
+        )
+    if reuse_wfn:
+        # The wavefunction files are stored once and loaded by every task of the
+        # group, which only receives the reference calculation without its files
+        reference_inp = gradients.pop()
+        wfn_key = f"{input_hash(program, reference_inp, collect_wfn=True)}-wfn"
+        reference = compute.s(program, reference_inp, logs=logs, collect_wfn=True)
+        items = gradients if batch_size is None else _batches(gradients, batch_size)
+        guessed = group(
+            *(
+                compute_with_guess.s(program, item, logs=logs, wfn_key=wfn_key)
+                for item in items
+            ),
+            compute_with_guess.s(program),  # Pass reference on to assemble_hessian
+        )
+        return _prioritized(
+            reference | store_wfn.s(wfn_key) | guessed | hessian, priority
+        )
+    if checkpoint:
+        dispatched = _checkpointed_group(program, gradients, batch_size, logs=logs)
+        return _prioritized(dispatched | hessian, priority)
+    # | is chain operator in celery
+    return _prioritized(
+        _compute_group(program, gradients, batch_size, logs=logs) | hessian, priority
+    )
+
+
+def parallel_gradient(
+    program: str,
+    prog_input: ProgramInput,
+    dh: float = settings.bigchem_default_hessian_dh,
+    stencil: str = "central",
+    logs: str = "keep",
+    batch_size: Optional[Union[int, str]] = None,
+    priority: Optional[int] = None,
+) -> Signature:
+    """Create parallel numerical gradient signature from energy calculations
+
+    For methods that only provide energies. The returned ProgramOutput can be used
+    like the output of a gradient calculation.
+
+    Params:
+        program: Compute engine to use for energy calculations
+        prog_input: ProgramInput with calctype=gradient
+        dh: Displacement for finite difference computation
+        stencil: "central" for O(dh^2) central differences using 6N energies.
+            "forward" for O(dh) forward differences using 3N energies. "five-point"
+            for O(dh^4) differences using 12N energies (see parallel_hessian).
+        logs: Keep, drop, or offload the logs of the displaced energies. See
+            parallel_hessian.
+        batch_size: Energies per task or "auto". See parallel_hessian.
+        priority: Priority of the energy calculations. See parallel_hessian.
+
+    Note: Creates a Celery Chord where energies are computed in parallel, then the
+        list of energies is passed as the first argument to the assemble_gradient task.
+        The last computation in the list is an energy calculation of the original
+        geometry used to create the final ProgramOutput.
+    """
+    assert prog_input.calctype == CalcType.gradient, (
+        f"input_data.calctype should be '{CalcType.gradient}', got "
+        f"'{prog_input.calctype}'"
+    )
+    _check_logs(logs)
+
+    energies = _gradient_inputs(
+        prog_input, dh, stencil=stencil, calctype=CalcType.energy
+    )
+    energies.append(prog_input.model_copy(update={"calctype": CalcType.energy}))
+    if batch_size is not None:
+        batch_size = _batch_size(
+            batch_size, len(prog_input.structure.symbols), len(energies)
+        )
+    # | is chain operator in celery
+    return _prioritized(
+        _compute_group(program, energies, batch_size, logs=logs)
+        | assemble_gradient.s(dh, stencil),
+        priority,
+    )
+
+
+def parallel_hessian_from_energies(
+    program: str,
+    prog_input: ProgramInput,
+    dh: float = settings.bigchem_default_hessian_dh,
+    logs: str = "keep",
+    batch_size: Optional[Union[int, str]] = "auto",
+    priority: Optional[int] = None,
+) -> Signature:
+    """Create parallel hessian signature from energy calculations only
+
+    For methods that only provide energies. Uses double finite differences that
+    exploit the symmetry of mixed second derivatives, requiring 9N^2 + 3N + 1 energies
+    (see utils._energy_hessian_inputs) instead of the 18N^2 of the full 4-point
+    stencil. The central difference gradient is also returned.
+
+    Params:
+        program: Compute engine to use for energy calculations
+        prog_input: ProgramInput with calctype=hessian
+        dh: Displacement for finite difference computation
+        logs: Keep, drop, or offload the logs of the displaced energies. See
+            parallel_hessian.
+        batch_size: Energies per task or "auto". See parallel_hessian. Batched by
+            default since the number of (usually small) energy calculations grows
+            quadratically with the number of atoms.
+        priority: Priority of the energy calculations. See parallel_hessian.
+
+    Note: Creates a Celery Chord where energies are computed in parallel, then the
+        list of energies is passed as the first argument to the assemble_energy_hessian
+        task. The last computation in the list is an energy calculation of the
+        original geometry used to create the final ProgramOutput.
+    """
+    assert prog_input.calctype == CalcType.hessian, (
+        f"input_data.calctype should be '{CalcType.hessian}', got "
+        f"'{prog_input.calctype}'"
+    )
+    _check_logs(logs)
+
+    energies = _energy_hessian_inputs(prog_input, dh)
+    energies.append(prog_input.model_copy(update={"calctype": CalcType.energy}))
+    if batch_size is not None:
+        batch_size = _batch_size(
+            batch_size, len(prog_input.structure.symbols), len(energies)
+        )
     # | is chain operator in celery
-    return group(compute.s(program, p_inp) for p_inp in gradients) | assemble_hessian.s(
-        dh
+    return _prioritized(
+        _compute_group(program, energies, batch_size, logs=logs)
+        | assemble_energy_hessian.s(dh),
+        priority,
     )
 
 
@@ -56,6 +394,17 @@ def parallel_frequency_analysis(
     program: str,
     prog_input: ProgramInput,
     dh: float = settings.bigchem_default_hessian_dh,
+    symmetry: bool = False,
+    stencil: str = "central",
+    projected: bool = False,
+    active_atoms: Optional[list[int]] = None,
+    checkpoint: bool = False,
+    logs: str = "keep",
+    batch_size: Optional[Union[int, str]] = None,
+    reuse_wfn: bool = False,
+    symmetrize: bool = False,
+    accumulator_key: Optional[str] = None,
+    priority: Optional[int] = None,
     **kwargs,
 ) -> Signature:
     """Create frequency_analysis signature leveraging parallel hessian
@@ -64,6 +413,22 @@ def parallel_frequency_analysis(
         program: Program to use for gradient calculations to generate hessian
         prog_input: ProgramInput object.
         dh: Displacement for finite difference computation of hessian
+        symmetry: Only compute gradients for symmetry-unique atoms. See
+            parallel_hessian.
+        stencil: Finite difference stencil for the hessian. See parallel_hessian.
+        projected: Displace along vibrational directions only. See parallel_hessian.
+        active_atoms: Only displace these atoms and perform a partial hessian
+            vibrational analysis (PHVA) treating all other atoms as frozen.
+        checkpoint: Save completed gradients and reuse them on resubmission. See
+            parallel_hessian.
+        logs: Keep, drop, or offload the logs of the gradients. See parallel_hessian.
+        batch_size: Gradients per task or "auto". See parallel_hessian.
+        reuse_wfn: Start displaced gradients from the wavefunction of the original
+            geometry. See parallel_hessian.
+        symmetrize: Symmetrize the hessian before the frequency analysis.
+        accumulator_key: Accumulate gradients under this key instead of returning
+            them. See parallel_hessian.
+        priority: Priority of the gradient calculations. See parallel_hessian.
         kwargs: Keywords passed to geomeTRIC's frequency_analysis function
             temperature: float - Temperature passed to the harmonic free energy module;
                 default: 300.0
@@ -72,12 +437,387 @@ def parallel_frequency_analysis(
                 default: 1.0
 
     """
+    if active_atoms is not None:
+        active_atoms = _active_atoms(active_atoms, len(prog_input.structure.symbols))
     hessian_inp = prog_input.model_dump()
     # So parallel_hessian doesn't raise error
     hessian_inp["calctype"] = CalcType.hessian
-    hessian_sig = parallel_hessian(program, ProgramInput(**hessian_inp), dh)
+    hessian_sig = parallel_hessian(
+        program,
+        ProgramInput(**hessian_inp),
+        dh,
+        symmetry=symmetry,
+        stencil=stencil,
+        projected=projected,
+        active_atoms=active_atoms,
+        checkpoint=checkpoint,
+        logs=logs,
+        batch_size=batch_size,
+        reuse_wfn=reuse_wfn,
+        symmetrize=symmetrize,
+        accumulator_key=accumulator_key,
+        priority=priority,
+    )
     # | is celery chain operator
-    return hessian_sig | frequency_analysis.s(**kwargs)
+    return hessian_sig | frequency_analysis.s(active_atoms=active_atoms, **kwargs)
+
+
+def parallel_hessian_opt(
+    prog_input: DualProgramInput,
+    dh: float = settings.bigchem_default_hessian_dh,
+    hessian_every: Optional[int] = None,
+    stencil: str = "central",
+    logs: str = "keep",
+    batch_size: Optional[Union[int, str]] = None,
+    priority: Optional[int] = None,
+) -> Signature:
+    """Create a geomeTRIC optimization signature starting from a parallel hessian
+
+    The hessian of the initial structure is computed with parallel_hessian and passed
+    to geomeTRIC as its initial hessian (see output_to_input), which greatly reduces
+    the number of steps of transition state searches in particular.
+
+    Params:
+        prog_input: DualProgramInput with calctype=optimization or transition_state.
+            Its subprogram and subprogram_args are used for the hessian gradients.
+        dh: Displacement for finite difference computation of the hessian
+        hessian_every: If set, recompute the hessian in parallel every this many
+            optimization steps. The optimization runs in segments of hessian_every
+            steps that each start from a new hessian, up to the total maxiter keyword
+            (default 300) of prog_input.
+        stencil: Finite difference stencil for the hessian. See parallel_hessian.
+        logs: Keep, drop, or offload the logs of the hessian gradients. See
+            parallel_hessian.
+        batch_size: Hessian gradients per task or "auto". See parallel_hessian.
+        priority: Priority of the hessian gradients and optimizations. See
+            parallel_hessian.
+
+    Returns:
+        Signature returning the optimization output. With hessian_every, its
+            trajectory contains the steps of all segments and .data.extras["n_hessians"]
+            the number of computed hessians.
+    """
+    assert prog_input.calctype in {CalcType.optimization, CalcType.transition_state}, (
+        "input_data.calctype should be 'optimization' or 'transition_state', got "
+        f"'{prog_input.calctype}'"
+    )
+    if hessian_every is not None and hessian_every < 1:
+        raise ValueError("hessian_every must be a positive number of steps.")
+
+    program_args = ProgramArgsSub(
+        **prog_input.model_dump(exclude={"structure", "structures", "calctype"})
+    )
+    return _hessian_opt_segment(
+        prog_input.structure,
+        prog_input.calctype,
+        program_args,
+        hessian_every,
+        program_args.keywords.get("maxiter", 300),
+        dh,
+        stencil,
+        logs,
+        batch_size,
+        priority,
+    )
+
+
+def parallel_mbe(
+    program: str,
+    prog_input: ProgramInput,
+    order: int = 2,
+    fragments: Optional[list[list[int]]] = None,
+    charges: Optional[list[int]] = None,
+    logs: str = "keep",
+    batch_size: Optional[Union[int, str]] = None,
+    priority: Optional[int] = None,
+) -> Signature:
+    """Create parallel many-body expansion (MBE) signature for a fragmented structure
+
+    Computes every subsystem of up to order fragments (monomers, dimers, trimers,
+    ...) as one group and sums the truncated expansion in the assemble_mbe task.
+    Subsystems whose geometries are identical up to rotation, translation, or
+    reflection (e.g., the waters of an ideal cluster) are computed once and their
+    gradient is rotated onto each copy. Basis set superposition corrections are not
+    applied.
+
+    Params:
+        program: Compute engine to use for the subsystem calculations
+        prog_input: ProgramInput with calctype=energy or calctype=gradient for the
+            full structure, defining the model and keywords of every subsystem
+        order: Truncation order of the expansion. Clipped to the number of fragments.
+        fragments: Atom indices of every fragment. Defaults to the covalently bonded
+            molecules of the structure (from structure.connectivity or covalent
+            radii).
+        charges: Charge of every fragment. Defaults to neutral fragments. Subsystems
+            get the lowest multiplicity allowed by their number of electrons.
+        logs: Keep, drop, or offload the logs of the subsystem calculations. See
+            parallel_hessian.
+        batch_size: Subsystem calculations per task or "auto". See parallel_hessian.
+        priority: Priority of the subsystem calculations. See parallel_hessian.
+
+    Returns:
+        Signature returning a ProgramOutput for prog_input with the MBE energy (and
+            gradient). See tasks.assemble_mbe for the data in .data.extras.
+    """
+    assert prog_input.calctype in {CalcType.energy, CalcType.gradient}, (
+        f"input_data.calctype should be '{CalcType.energy}' or "
+        f"'{CalcType.gradient}', got '{prog_input.calctype}'"
+    )
+    _check_logs(logs)
+    if fragments is None:
+        fragments = _fragments(prog_input.structure)
+    order = min(order, len(fragments))
+    subsystems, structures = _mbe_subsystems(
+        prog_input.structure, fragments, order, charges
+    )
+    unique, matches, transforms = _unique_geometries(structures)
+    prog_inputs = [
+        prog_input.model_copy(update={"structure": structures[i]}) for i in unique
+    ]
+    if batch_size is not None:
+        n_atoms = max(len(structure.symbols) for structure in structures)
+        batch_size = _batch_size(batch_size, n_atoms, len(prog_inputs))
+    mbe = assemble_mbe.s(
+        prog_input,
+        fragments,
+        [list(subsystem) for subsystem in subsystems],
+        matches,
+        transforms,
+        order,
+    )
+    # | is chain operator in celery
+    return _prioritized(
+        _compute_group(program, prog_inputs, batch_size, logs=logs) | mbe, priority
+    )
+
+
+def parallel_neb(
+    program: str,
+    prog_input: ProgramInput,
+    structures: list[Structure],
+    n_images: Optional[int] = None,
+    spring_constant: float = 0.01,
+    climbing: bool = True,
+    force_tol: float = 1.0e-3,
+    max_iter: int = 100,
+    time_step: float = 1.0,
+    max_step: float = 0.2,
+    logs: str = "keep",
+    priority: Optional[int] = None,
+) -> Signature:
+    """Create parallel nudged elastic band (NEB) signature for a reaction path
+
+    Every iteration computes the gradients of all interior images as one group. The
+    reducer (tasks.neb_step) applies the NEB force projection, moves the images with
+    the FIRE minimizer, and dispatches the next iteration itself, so the whole path
+    optimization runs on the workers from a single submission.
+
+    Params:
+        program: Compute engine to use for the image calculations
+        prog_input: ProgramInput with calctype=gradient defining the model and
+            keywords of every image. Its structure is replaced by the images.
+        structures: Images of the initial path including both (fixed) endpoints. Atoms
+            must be in the same order in every structure.
+        n_images: If set, instead linearly interpolate this many images (including
+            the endpoints) between the first and last structure
+        spring_constant: Spring constant between neighboring images (Hartree/Bohr^2)
+        climbing: If True, the highest energy image climbs to the saddle point
+            (climbing image NEB) instead of being held by the springs
+        force_tol: Converged once the NEB force on every atom of every image is below
+            this value (Hartree/Bohr)
+        max_iter: Maximum number of iterations (rounds of gradients). The final path
+            is returned with .data.extras["neb_converged"] = False if reached.
+        time_step: Initial time step of the FIRE minimizer
+        max_step: Largest displacement (Bohr) of any atom in one iteration
+        logs: Keep, drop, or offload the logs of the image calculations. See
+            parallel_hessian.
+        priority: Priority of the image calculations. See parallel_hessian.
+
+    Returns:
+        Signature returning the list of outputs of all images of the final path. The
+            endpoints are energy calculations, all other images gradient calculations.
+            See tasks.neb_step for the convergence data in .data.extras.
+    """
+    assert prog_input.calctype == CalcType.gradient, (
+        f"input_data.calctype should be '{CalcType.gradient}', got "
+        f"'{prog_input.calctype}'"
+    )
+    _check_logs(logs)
+    if n_images is not None:
+        structures = _interpolate_path(structures, n_images)
+    if len(structures) < 3:
+        raise ValueError("A path needs at least 3 images including the endpoints.")
+
+    images = [prog_input.model_copy(update={"structure": s}) for s in structures]
+    for i in (0, -1):
+        images[i] = images[i].model_copy(update={"calctype": CalcType.energy})
+    step = neb_step.s(
+        program,
+        None,
+        spring_constant,
+        climbing,
+        force_tol,
+        max_iter,
+        time_step,
+        max_step,
+        logs,
+        priority=priority,
+    )
+    # | is chain operator in celery
+    return _prioritized(_compute_group(program, images, logs=logs) | step, priority)
+
+
+def parallel_md(
+    program: str,
+    prog_input: ProgramInput,
+    key: str,
+    n_steps: int,
+    time_step: float = 0.5,
+    structures: Optional[list[Structure]] = None,
+    velocities: Optional[list[np.ndarray]] = None,
+    n_replicas: int = 1,
+    temperature: float = 0.0,
+    seed: Optional[int] = None,
+    frame_every: int = 1,
+    reuse_wfn: bool = False,
+    logs: str = "drop",
+    priority: Optional[int] = None,
+) -> Signature:
+    """Create signature running independent Born-Oppenheimer molecular dynamics
+    trajectories (replicas) in parallel
+
+    Every trajectory runs as one long-lived task (tasks.md_trajectory) that computes
+    the gradients of all its steps without a broker round trip per step and streams
+    its frames to the accumulator (a Redis hash in the result backend or
+    bigchem_accumulator_dir). The trajectories are fanned out across the workers as
+    one group. Read the frames, also while running, with
+    accumulator.read_trajectory(f"{key}-{i}") for replica i.
+
+    Params:
+        program: Compute engine to use for the gradients
+        prog_input: ProgramInput with calctype=gradient defining the model and
+            keywords of every trajectory
+        key: Unique key for the job, e.g., a uuid. Replica i is stored under
+            f"{key}-{i}".
+        n_steps: Number of time steps of every trajectory
+        time_step: Time step in femtoseconds
+        structures: Initial structure of every replica, e.g., from Wigner sampling.
+            Defaults to n_replicas copies of prog_input.structure.
+        velocities: Initial (N, 3) velocities of every replica in atomic units. If
+            None, each replica draws velocities from the Maxwell-Boltzmann
+            distribution at temperature.
+        n_replicas: Number of replicas if structures is not given
+        temperature: Temperature (K) of the sampled initial velocities
+        seed: Seed for the sampled initial velocities. Replica i uses seed + i.
+        frame_every: Store every this many steps
+        reuse_wfn: Start the SCF of every step from the wavefunction of the previous
+            step. See tasks.md_trajectory.
+        logs: Keep, drop, or offload the logs of the last step of every trajectory.
+            See compute.
+        priority: Priority of the trajectories. See parallel_hessian.
+
+    Returns:
+        Signature returning the gradient calculation of the last step of every
+            replica
+    """
+    assert prog_input.calctype == CalcType.gradient, (
+        f"input_data.calctype should be '{CalcType.gradient}', got "
+        f"'{prog_input.calctype}'"
+    )
+    _check_logs(logs)
+    if reuse_wfn and not _supports_wfn_reuse(program):
+        raise ValueError(
+            f"The qccompute adapter for {program} can't reuse wavefunctions."
+        )
+    structures = structures or [prog_input.structure] * n_replicas
+    if velocities is not None and len(velocities) != len(structures):
+        raise ValueError("Give one set of velocities for every structure.")
+
+    trajectories = group(
+        md_trajectory.s(
+            program,
+            prog_input.model_copy(update={"structure": structure}),
+            f"{key}-{i}",
+            n_steps,
+            time_step,
+            velocity=None if velocities is None else velocities[i],
+            temperature=temperature,
+            seed=None if seed is None else seed + i,
+            frame_every=frame_every,
+            reuse_wfn=reuse_wfn,
+            logs=logs,
+        )
+        for i, structure in enumerate(structures)
+    )
+    return _prioritized(trajectories, priority)
+
+
+def parallel_scan(
+    program: str,
+    prog_input: Union[ProgramInput, DualProgramInput],
+    scans: list[dict[str, Any]],
+    priority: Optional[int] = None,
+    **kwargs,
+) -> Signature:
+    """Create parallel potential energy surface scan signature
+
+    Rigid scans (any calctype but optimization) move the atoms of prog_input.structure
+    to every grid point and compute all points as one group. The fragment on the side
+    of the last atom of each coordinate is moved (found from structure.connectivity or
+    covalent radii); inside rings only the last atom is moved.
+
+    Relaxed scans (calctype=optimization) run constrained geomeTRIC optimizations in
+    wavefronts: the grid point closest to prog_input.structure is optimized first,
+    then all points one step further away in parallel, each starting from the lowest
+    energy final structure of its converged neighbors, and so on (see
+    tasks.scan_wavefront). A 1D scan runs two points at a time, a 2D scan a whole
+    anti-diagonal of the grid.
+
+    Params:
+        program: Program to use for the calculations, e.g., "geometric" for relaxed
+            scans
+        prog_input: Calculation defining the model and keywords of every grid point.
+            A DualProgramInput for relaxed scans, whose constraints are kept.
+        scans: One geomeTRIC style scan per grid axis, e.g., {"type": "dihedral",
+            "indices": [0, 1, 2, 3], "start": -180, "stop": 150, "steps": 12}. Types
+            are "distance" (Bohr), "angle", and "dihedral" (degrees). Indices start
+            at 0.
+        priority: Priority of the calculations. See parallel_hessian.
+        kwargs: Keyword arguments passed to compute, e.g., raise_exc=False to keep
+            failed points of a relaxed scan
+
+    Returns:
+        Signature returning a dict with the grid "values" of every coordinate, the
+            "energies" (shape (n_1, ..., n_k), NaN for failed points), the
+            (final) "geometries" (shape (n_1, ..., n_k, N, 3)), and the "outputs" (an
+            object array shaped like energies) of the scan
+    """
+    values = _scan_values(scans)
+    if prog_input.calctype != CalcType.optimization:
+        structures = [
+            _set_coordinates(prog_input.structure, scans, point)
+            for point in itertools.product(*values)
+        ]
+        prog_inputs = [
+            prog_input.model_copy(update={"structure": s}) for s in structures
+        ]
+        # | is chain operator in celery
+        return _prioritized(
+            _compute_group(program, prog_inputs, **kwargs) | assemble_scan.s(values),
+            priority,
+        )
+
+    if not isinstance(prog_input, DualProgramInput):
+        raise ValueError("Relaxed scans need a DualProgramInput, e.g., for geomeTRIC.")
+    seed = list(_scan_seed(prog_input.structure, scans, values))
+    point = [axis_values[i] for axis_values, i in zip(values, seed)]
+    first = _constrained_input(prog_input, prog_input.structure, scans, point)
+    wavefront = scan_wavefront.s(
+        program, prog_input, scans, seed, priority=priority, **kwargs
+    )
+    return _prioritized(
+        group([compute.s(program, first, **kwargs)]) | wavefront, priority
+    )
 
 
 def multistep_opt(
@@ -85,6 +825,7 @@ def multistep_opt(
     calctype: CalcType,
     programs: list[str],
     program_args: list[Union[ProgramArgs, ProgramArgsSub]],
+    priority: Optional[int] = None,
     **kwargs,
 ) -> Signature:
     """Use multiple steps to sequentially optimize a structure
@@ -92,17 +833,11 @@ def multistep_opt(
     Params:
         program: The name of the program use for optimization
         prog_inputs: Program inputs for each optimization step.
+        priority: Priority of the optimizations. See parallel_hessian.
         kwargs: All kwargs for qccompute.compute() function
     """
     # Create first optimization in the chain
-    if isinstance(program_args[0], ProgramArgs):
-        first_opt = ProgramInput(
-            calctype=calctype, structure=structure, **program_args[0].model_dump()
-        )
-    else:  # is ProgramArgsSub
-        first_opt = DualProgramInput(
-            calctype=calctype, structure=structure, **program_args[0].model_dump()
-        )
+    first_opt = _program_input(structure, calctype, program_args[0])
     task_chain = compute.s(programs[0], first_opt, **kwargs)
 
     # Add subsequent optimizations to the chain
@@ -112,4 +847,279 @@ def multistep_opt(
             | output_to_input.s(calctype, prog_args)
             | compute.s(program, **kwargs)
         )
-    return task_chain
+    return _prioritized(task_chain, priority)
+
+
+def parallel_multistep_opt(
+    structures: list[Structure],
+    calctype: CalcType,
+    programs: list[str],
+    program_args: list[Union[ProgramArgs, ProgramArgsSub]],
+    energy_window: Optional[float] = None,
+    max_structures: Optional[int] = None,
+    priority: Optional[int] = None,
+    **kwargs,
+) -> Signature:
+    """Optimize many structures in stages, pruning by energy between the stages
+
+    Unlike a group of multistep_opt chains, every stage optimizes all remaining
+    structures as one group followed by a barrier (tasks.prune_stage) that waits for
+    the whole stage, discards failed optimizations, and only passes the lowest energy
+    structures on to the next, more expensive stage. Useful for funnel workflows,
+    e.g., xtb -> DFT -> DFT with a large basis set.
+
+    Params:
+        structures: Structures to optimize, e.g., conformers or isomers of a molecule
+            so their energies can be compared
+        calctype: Calculation type of all optimizations, e.g., CalcType.optimization
+        programs: Program for each stage
+        program_args: Program arguments for each stage
+        energy_window: If set, discard structures more than this much (Hartree) above
+            the lowest energy structure after every stage
+        max_structures: If set, only pass this many of the lowest energy structures
+            on after every stage
+        priority: Priority of the optimizations. See parallel_hessian.
+        kwargs: All kwargs for qccompute.compute() function
+
+    Returns:
+        Signature returning the optimizations of the last stage ordered by energy
+    """
+    if len(programs) != len(program_args):
+        raise ValueError("programs and program_args must have the same length.")
+
+    first_stage = group(
+        compute.s(
+            programs[0],
+            _program_input(structure, calctype, program_args[0]),
+            # Failed optimizations are discarded at the barrier
+            raise_exc=False,
+            **kwargs,
+        )
+        for structure in structures
+    )
+    barrier = prune_stage.s(
+        calctype,
+        programs[1:],
+        program_args[1:],
+        energy_window,
+        max_structures,
+        priority=priority,
+        **kwargs,
+    )
+    # | is chain operator in celery
+    return _prioritized(first_stage | barrier, priority)
+
+
+def ensemble_opt(
+    structures: list[Structure],
+    calctype: CalcType,
+    programs: list[str],
+    program_args: list[Union[ProgramArgs, ProgramArgsSub]],
+    rmsd_tol: float = 0.25,
+    energy_tol: float = 1.0e-4,
+    energy_window: Optional[float] = None,
+    max_conformers: Optional[int] = None,
+    priority: Optional[int] = None,
+    **kwargs,
+) -> Signature:
+    """Optimize an ensemble of conformers, only refining the unique low energy ones
+
+    All structures are first optimized in parallel with the first (cheap) program.
+    A reducer then removes failed optimizations and duplicates and keeps the lowest
+    energy conformers. Only these survivors are optimized further with the remaining
+    programs using multistep_opt, so expensive calculations are never spent on
+    duplicates. Two conformers are duplicates if both their aligned RMSD is below
+    rmsd_tol and their energy difference is below energy_tol; only the lowest energy
+    one is kept.
+
+    Params:
+        structures: Conformers to optimize
+        calctype: Calculation type of all optimizations, e.g., CalcType.optimization
+        programs: Program for each optimization step. The first step is the
+            screening optimization of all structures.
+        program_args: Program arguments for each optimization step
+        rmsd_tol: Aligned RMSD (Bohr) between optimized structures below which
+            conformers may be duplicates
+        energy_tol: Energy difference (Hartree) below which conformers may be
+            duplicates
+        energy_window: If set, discard conformers more than this much (Hartree) above
+            the lowest energy conformer after screening
+        max_conformers: If set, only refine this many of the lowest energy conformers
+        priority: Priority of the optimizations. See parallel_hessian.
+        kwargs: All kwargs for qccompute.compute() function
+
+    Returns:
+        Signature returning the final optimization of every surviving conformer ordered
+            by screening energy. If only one program is given, the screening
+            optimizations of the survivors are returned.
+    """
+    if len(programs) != len(program_args):
+        raise ValueError("programs and program_args must have the same length.")
+
+    screening = group(
+        compute.s(
+            programs[0],
+            _program_input(structure, calctype, program_args[0]),
+            # Keep the ensemble going if some conformers fail to optimize
+            raise_exc=False,
+            **kwargs,
+        )
+        for structure in structures
+    )
+    selection = select_conformers.s(
+        calctype,
+        programs[1:],
+        program_args[1:],
+        rmsd_tol,
+        energy_tol,
+        energy_window,
+        max_conformers,
+        priority=priority,
+        **kwargs,
+    )
+    # | is chain operator in celery
+    return _prioritized(screening | selection, priority)
+
+
+def _hessian_opt_segment(
+    structure: Structure,
+    calctype: CalcType,
+    program_args: ProgramArgsSub,
+    hessian_every: Optional[int],
+    max_steps: int,
+    dh: float,
+    stencil: str,
+    logs: str,
+    batch_size: Optional[Union[int, str]],
+    priority: Optional[int] = None,
+    previous: Optional[ProgramOutput] = None,
+    n_hessians: int = 1,
+) -> Signature:
+    """Create the signature of a parallel hessian followed by a geomeTRIC optimization
+
+    If hessian_every is set, the optimization stops after hessian_every steps
+    (successfully, with geomeTRIC's "converge maxiter" option) and is followed by
+    continue_hessian_opt, which merges the segment with the previous ones and starts
+    the next segment if the optimization has not converged. See parallel_hessian_opt.
+
+    Params:
+        max_steps: Optimization steps left for this and all following segments
+        previous: Output of the previous segments
+        n_hessians: Number of hessians computed including this segment's
+    """
+    hessian_input = ProgramInput(
+        structure=structure,
+        calctype=CalcType.hessian,
+        **program_args.subprogram_args.model_dump(),
+    )
+    hessian = parallel_hessian(
+        program_args.subprogram,
+        hessian_input,
+        dh,
+        stencil=stencil,
+        logs=logs,
+        batch_size=batch_size,
+        priority=priority,
+    )
+    keywords = dict(program_args.keywords)
+    last_segment = hessian_every is None or max_steps <= hessian_every
+    if last_segment:
+        keywords["maxiter"] = max_steps
+    else:
+        keywords["maxiter"] = hessian_every
+        keywords["converge"] = [*keywords.get("converge", []), "maxiter"]
+    segment_args = program_args.model_copy(update={"keywords": keywords})
+    # | is chain operator in celery
+    optimization = (
+        hessian | output_to_input.s(calctype, segment_args) | compute.s("geometric")
+    )
+    if hessian_every is None:
+        return _prioritized(optimization, priority)
+    next_segment = continue_hessian_opt.s(
+        calctype,
+        program_args,
+        hessian_every,
+        max_steps,
+        dh,
+        stencil,
+        logs,
+        batch_size,
+        priority,
+        previous,
+        n_hessians,
+    )
+    return _prioritized(optimization | next_segment, priority)
+
+
+def _compute_group(
+    program: str,
+    prog_inputs: list[ProgramInput],
+    batch_size: Optional[int] = None,
+    **kwargs,
+) -> Signature:
+    """Create a group computing prog_inputs with one task per input or per batch
+
+    Tasks are submitted longest first by estimated runtime (see cost.py) so the most
+    expensive calculations start first and do not delay the end of the group. With
+    bigchem_priorities enabled every task keeps the priority route_task gives it, so
+    the order applies among tasks of equal priority.
+
+    Params:
+        program: Program to use for all calculations
+        prog_inputs: Inputs to compute
+        batch_size: If set, compute this many inputs of similar cost sequentially in
+            each task
+        kwargs: Keyword arguments passed to compute or compute_batch
+
+    Returns:
+        A group whose results (flattened by _flatten_outputs if batched) are the
+        outputs for prog_inputs in order, followed by restore_order if the tasks were
+        reordered
+    """
+    runtimes = [estimated_runtime(program, p_inp) for p_inp in prog_inputs]
+    batches = _longest_first(runtimes, batch_size)
+    if batch_size is None:
+        tasks = [compute.s(program, prog_inputs[i], **kwargs) for (i,) in batches]
+    else:
+        tasks = [
+            compute_batch.s(program, [prog_inputs[i] for i in batch], **kwargs)
+            for batch in batches
+        ]
+    fan_out = group(tasks)
+    order = [i for batch in batches for i in batch]
+    if order == sorted(order):
+        return fan_out
+    return fan_out | restore_order.s(order)
+
+
+def _checkpointed_group(
+    program: str,
+    prog_inputs: list[ProgramInput],
+    batch_size: Optional[int] = None,
+    logs: str = "keep",
+) -> Signature:
+    """Create a signature computing prog_inputs that reuses checkpointed outputs
+
+    Only inputs without a checkpointed output are dispatched, batch_size at a time if
+    set. The signature returns the list of outputs for all prog_inputs in order, like
+    a group of compute tasks. logs is passed to compute (see compute).
+    """
+    store = get_checkpoint_store()
+    keys = [input_hash(program, prog_input) for prog_input in prog_inputs]
+    missing = [i for i, key in enumerate(keys) if key not in store]
+    if not missing:
+        return merge_checkpoints.s([], keys, missing)
+    if batch_size is None:
+        dispatched = group(
+            compute_checkpointed.s(program, prog_inputs[i], logs=logs) for i in missing
+        )
+    else:
+        dispatched = _compute_group(
+            program,
+            [prog_inputs[i] for i in missing],
+            batch_size,
+            logs=logs,
+            checkpoint=True,
+        )
+    # | is chain operator in celery
+    return dispatched | merge_checkpoints.s(keys, missing)
@@ -2,8 +2,14 @@ import ssl
 from datetime import timedelta
 
 from celery import Celery
+from kombu import Exchange, Queue
 
 from .config import settings
+from .routing import _broker_priority, route_task
+from .serializers import SERIALIZER_NAME, register_serializer
+
+if settings.bigchem_serializer == SERIALIZER_NAME:
+    register_serializer()
 
 bigchem = Celery(
     # Name of top-level module is first argument
@@ -18,17 +24,58 @@ bigchem.conf.update(
     # https://docs.celeryq.dev/en/stable/userguide/configuration.html
     # NOTE: Using pickle serializer so that chords receive python objects.
     # Can use JSON serializer json_dumps from qcdata.utils if JSON is preferred.
+    # The "bigchem" serializer also returns python objects but produces much smaller
+    # messages for array-heavy inputs and outputs.
     broker_connection_retry_on_startup=True,
-    task_serializer="pickle",
-    accept_content=["pickle"],
-    result_serializer="pickle",
+    task_serializer=settings.bigchem_serializer,
+    accept_content=sorted({"pickle", settings.bigchem_serializer}),
+    result_serializer=settings.bigchem_serializer,
+    result_accept_content=sorted({"pickle", settings.bigchem_serializer}),
+    task_compression=settings.bigchem_compression,
+    result_compression=settings.bigchem_compression,
     task_track_started=True,
     task_acks_late=True,
     worker_prefetch_multiplier=settings.bigchem_prefetch_multiplier,
     worker_concurrency=settings.bigchem_worker_concurrency,
     result_expires=timedelta(seconds=settings.bigchem_result_expires),
+    task_default_queue=settings.bigchem_queue,
 )
 
+# Opt-in reducer, large calculation, and priority queues. See routing.py
+_queues = {
+    name
+    for name in (
+        settings.bigchem_queue,
+        settings.bigchem_reducer_queue,
+        settings.bigchem_large_queue
+        if settings.bigchem_large_cost is not None
+        else None,
+    )
+    if name is not None
+}
+if settings.bigchem_priorities or len(_queues) > 1:
+    bigchem.conf.update(
+        task_queues=[
+            Queue(name, Exchange(name), routing_key=name) for name in sorted(_queues)
+        ],
+        task_routes=(route_task,),
+    )
+if settings.bigchem_priorities:
+    bigchem.conf.update(
+        task_queue_max_priority=settings.bigchem_max_priority,
+        task_default_priority=_broker_priority(settings.bigchem_default_priority),
+    )
+    # Redis emulates priorities with one list per priority level
+    # https://docs.celeryq.dev/en/stable/userguide/routing.html#redis-message-priorities
+    if settings.bigchem_broker_url.startswith("redis"):
+        bigchem.conf.update(
+            broker_transport_options={
+                "queue_order_strategy": "priority",
+                "priority_steps": list(range(settings.bigchem_max_priority + 1)),
+                "sep": ":",
+            },
+        )
+
 # NOTE: If using SSL secured connection to broker, by default I am disabling
 # client-side certificate verification. This makes things easier when running the
 # broker behind a reverse proxy (like traefik) that dynamically provisions certificates.
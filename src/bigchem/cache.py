@@ -0,0 +1,319 @@
+"""Content-addressed cache for results of the compute task.
+
+Identical program + input pairs hash to the same key so repeated calculations, e.g.,
+from resubmitted parallel_hessian chords or different users computing the same
+structure, are read from the cache instead of being recomputed.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional, Union
+
+import numpy as np
+from qcdata import Inputs, ProgramOutput
+
+from .config import settings
+
+# qccompute.compute keyword arguments that do not change the output
+_UNHASHED_KWARGS = {
+    "scratch_dir",
+    "rm_scratch_dir",
+    "print_logs",
+    "update_func",
+    "update_interval",
+}
+
+
+def input_hash(
+    program: str,
+    inp_obj: Inputs,
+    decimals: int = settings.bigchem_cache_geometry_decimals,
+    **kwargs,
+) -> str:
+    """Canonical hash of a program and its input
+
+    Params:
+        program: Name of the program that will run the calculation
+        inp_obj: The input object for the calculation
+        decimals: Geometries are rounded to this many decimal places (Bohr) before
+            hashing so numerically identical structures share a key
+        kwargs: Keyword arguments passed to qccompute.compute. Included in the hash
+            since they may change the output (e.g., collect_wfn), except for those
+            only controlling scratch directories and printing.
+
+    Returns:
+        Hex digest of the sha256 hash
+    """
+    as_dict = inp_obj.model_dump(mode="json")
+    structures = [as_dict.get("structure")] + list(
+        as_dict.get("structures", {}).values()
+    )
+    for structure in filter(None, structures):
+        # + 0.0 normalizes -0.0 produced by rounding tiny negative values
+        geometry = np.round(np.asarray(structure["geometry"], dtype=float), decimals)
+        structure["geometry"] = (geometry + 0.0).tolist()
+
+    kwargs = {k: v for k, v in kwargs.items() if k not in _UNHASHED_KWARGS}
+    payload = json.dumps(
+        {"program": program, "input": as_dict, "kwargs": kwargs},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache(ABC):
+    """Base class for result cache backends
+
+    Params:
+        ttl: Seconds an entry stays valid. None for no expiration.
+        max_size: Backend specific size limit after which the least recently used
+            entries are evicted. None for no limit.
+    """
+
+    def __init__(self, ttl: Optional[int] = None, max_size: Optional[int] = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[ProgramOutput]:
+        """Return the cached output for key or None, counting hits and misses"""
+        output = self._get(key)
+        if output is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return output
+
+    def set(self, key: str, output: ProgramOutput) -> None:
+        """Store an output under key"""
+        self._set(key, pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Hit and miss counters"""
+        return {"hits": self.hits, "misses": self.misses}
+
+    @abstractmethod
+    def __contains__(self, key: str) -> bool:
+        """Check if key is in the cache without counting a hit or miss"""
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[ProgramOutput]:
+        """Backend specific lookup"""
+
+    @abstractmethod
+    def _set(self, key: str, value: bytes) -> None:
+        """Backend specific storage"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove all entries from the cache"""
+
+
+class DiskCache(ResultCache):
+    """Cache results as files in a local (or shared) directory
+
+    Hit and miss counters are also kept in the directory, one byte appended to a
+    counter file per lookup, so they are shared by all worker processes using it and
+    survive worker restarts.
+
+    Params:
+        directory: Directory holding the cached results
+        ttl: Seconds an entry stays valid. None for no expiration.
+        max_size: Max total size of the cache in bytes. None for no limit.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        ttl: Optional[int] = None,
+        max_size: Optional[int] = None,
+    ):
+        super().__init__(ttl, max_size)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.pkl"
+
+    def get(self, key: str) -> Optional[ProgramOutput]:
+        output = super().get(key)
+        # Appends are atomic, so concurrent processes never lose a count
+        with open(
+            self.directory / f".{'misses' if output is None else 'hits'}", "ab"
+        ) as f:
+            f.write(b".")
+        return output
+
+    @property
+    def stats(self) -> dict[str, int]:
+        counts = {}
+        for name in ("hits", "misses"):
+            try:
+                counts[name] = (self.directory / f".{name}").stat().st_size
+            except FileNotFoundError:
+                counts[name] = 0
+        return counts
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            mtime = self._path(key).stat().st_mtime
+        except FileNotFoundError:
+            return False
+        return self.ttl is None or time.time() - mtime <= self.ttl
+
+    def _get(self, key: str) -> Optional[ProgramOutput]:
+        path = self._path(key)
+        try:
+            # mtime is the write time and atime the last access time
+            stat = path.stat()
+            if self.ttl is not None and time.time() - stat.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                return None
+            value = pickle.loads(path.read_bytes())
+            os.utime(path, (time.time(), stat.st_mtime))
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        return value
+
+    def _set(self, key: str, value: bytes) -> None:
+        # Write then rename so concurrent readers never see partial files
+        tmp_path = self.directory / f".{key}.{time.time_ns()}.tmp"
+        tmp_path.write_bytes(value)
+        tmp_path.replace(self._path(key))
+        if self.max_size is not None:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache fits in max_size"""
+        entries = []
+        for path in self.directory.glob("*.pkl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # Removed by another worker
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:  # type: ignore
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*.pkl"):
+            path.unlink(missing_ok=True)
+        for name in ("hits", "misses"):
+            (self.directory / f".{name}").unlink(missing_ok=True)
+
+
+class RedisCache(ResultCache):
+    """Cache results in Redis, e.g., the BigChem result backend
+
+    Hit and miss counters are also kept in Redis so they are shared by all workers.
+
+    Params:
+        url: Redis connection url
+        ttl: Seconds an entry stays valid. None for no expiration.
+        max_size: Max number of entries. None for no limit.
+        prefix: Prefix for all keys written by the cache
+    """
+
+    def __init__(
+        self,
+        url: str = settings.bigchem_backend_url,
+        ttl: Optional[int] = None,
+        max_size: Optional[int] = None,
+        prefix: str = "bigchem:cache:",
+    ):
+        # Import here so the redis client is only required when the cache is used
+        import redis
+
+        super().__init__(ttl, max_size)
+        self.client: Any = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._index = f"{prefix}index"
+
+    def get(self, key: str) -> Optional[ProgramOutput]:
+        output = super().get(key)
+        self.client.incr(f"{self.prefix}{'misses' if output is None else 'hits'}")
+        return output
+
+    @property
+    def stats(self) -> dict[str, int]:
+        hits, misses = self.client.mget(f"{self.prefix}hits", f"{self.prefix}misses")
+        return {"hits": int(hits or 0), "misses": int(misses or 0)}
+
+    def __contains__(self, key: str) -> bool:
+        return bool(self.client.exists(f"{self.prefix}{key}"))
+
+    def _get(self, key: str) -> Optional[ProgramOutput]:
+        value: Any = self.client.get(f"{self.prefix}{key}")
+        if value is None:
+            return None
+        if self.max_size is not None:
+            self.client.zadd(self._index, {key: time.time()})
+        return pickle.loads(value)
+
+    def _set(self, key: str, value: bytes) -> None:
+        self.client.set(f"{self.prefix}{key}", value, ex=self.ttl)
+        if self.max_size is not None:
+            self.client.zadd(self._index, {key: time.time()})
+            # Evict least recently used entries beyond max_size
+            stale = self.client.zrange(self._index, 0, -self.max_size - 1)
+            if stale:
+                self.client.delete(*(f"{self.prefix}{k.decode()}" for k in stale))
+                self.client.zrem(self._index, *stale)
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(f"{self.prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+@lru_cache(maxsize=None)
+def get_cache() -> Optional[ResultCache]:
+    """Return the result cache configured in settings or None if caching is off"""
+    backend = settings.bigchem_cache_backend
+    if backend is None:
+        return None
+    if backend == "disk":
+        return DiskCache(
+            settings.bigchem_cache_dir,
+            settings.bigchem_cache_ttl,
+            settings.bigchem_cache_max_size,
+        )
+    if backend == "redis":
+        return RedisCache(
+            settings.bigchem_cache_url or settings.bigchem_backend_url,
+            settings.bigchem_cache_ttl,
+            settings.bigchem_cache_max_size,
+        )
+    raise ValueError(f"Unknown cache backend '{backend}'. Use 'disk' or 'redis'.")
+
+
+@lru_cache(maxsize=None)
+def get_checkpoint_store() -> ResultCache:
+    """Return the store for checkpointed results of BigChem algorithms
+
+    Checkpoints are kept in bigchem_checkpoint_dir if set, otherwise in the result
+    backend. They expire with the same lifetime as regular results.
+    """
+    if settings.bigchem_checkpoint_dir is not None:
+        return DiskCache(
+            settings.bigchem_checkpoint_dir, ttl=settings.bigchem_result_expires
+        )
+    return RedisCache(
+        settings.bigchem_backend_url,
+        ttl=settings.bigchem_result_expires,
+        prefix="bigchem:checkpoint:",
+    )
@@ -29,8 +29,62 @@ class Settings(BaseSettings):  # type: ignore
     # Set concurrent number of worker processes. If None defaults to # of logical cores
     # https://docs.celeryq.dev/en/stable/userguide/configuration.html#std-setting-worker_concurrency
     bigchem_worker_concurrency: Optional[int] = 1
+    # Queue of calculation tasks. See routing.py
+    bigchem_queue: str = "celery"
+    # Queue of reducers and other short tasks. None to keep them on bigchem_queue. If
+    # set, make sure workers consume it, e.g., dedicated workers with -Q <queue>
+    bigchem_reducer_queue: Optional[str] = None
+    # Calculations with a larger estimated cost (cost.estimated_cost) go to
+    # bigchem_large_queue. None to keep all calculations on bigchem_queue
+    bigchem_large_cost: Optional[float] = None
+    bigchem_large_queue: str = "bigchem.large"
+    # Declare queues with priorities and prioritize tasks (reducers first, then
+    # calculations by estimated runtime). Delete existing queues on RabbitMQ brokers
+    # before enabling, since they are redeclared with x-max-priority
+    bigchem_priorities: bool = False
+    # Task priorities range from 0 to bigchem_max_priority (at most 9 for Redis)
+    bigchem_max_priority: int = 9
+    # Priority of calculations whose cost can't be estimated
+    bigchem_default_priority: int = 4
+    # Seconds per unit of cost.estimated_cost for programs without recorded runtimes
+    bigchem_seconds_per_cost: float = 1.0e-4
+    # History of calculation runtimes per program used to estimate runtimes. One of
+    # None (off), "disk", "redis". "redis" uses bigchem_cache_url if set
+    bigchem_runtime_history: Optional[str] = None
+    bigchem_runtime_history_file: Path = (
+        Path.home() / ".cache" / "bigchem" / "runtimes.json"
+    )
     bigchem_default_hessian_dh: float = 5.0e-3
+    # Max deviation (Bohr) for atoms to be considered symmetry equivalent
+    bigchem_symmetry_tolerance: float = 1.0e-3
     bigchem_result_expires: int = 86400
+    # Structures with at least this many atoms run one calculation per task when
+    # batch_size="auto"; smaller structures batch calculations of similar total cost
+    bigchem_batch_atoms: int = 20
+    # Serializer for task messages and results. "pickle" or "bigchem" (compact msgpack
+    # encoding, requires pip install bigchem[msgpack]). See serializers.py
+    bigchem_serializer: str = "pickle"
+    # Compression for task messages and results, e.g., "zstd" or "gzip". None for off
+    bigchem_compression: Optional[str] = None
+    # Content-addressed cache for compute results. One of None (off), "disk", "redis"
+    bigchem_cache_backend: Optional[str] = None
+    bigchem_cache_dir: Path = Path.home() / ".cache" / "bigchem"
+    # Redis url for the "redis" cache. Defaults to bigchem_backend_url if None
+    bigchem_cache_url: Optional[str] = None
+    # Seconds before cached results expire. None to never expire
+    bigchem_cache_ttl: Optional[int] = None
+    # Max bytes for "disk" or max entries for "redis" before evicting LRU entries
+    bigchem_cache_max_size: Optional[int] = None
+    # Geometries are rounded to this many decimals (Bohr) when computing cache keys
+    bigchem_cache_geometry_decimals: int = 8
+    # Directory for checkpointed algorithm results. Uses the result backend if None
+    bigchem_checkpoint_dir: Optional[Path] = None
+    # Directory for the accumulator mode of parallel_hessian. Uses the result backend
+    # if None
+    bigchem_accumulator_dir: Optional[Path] = None
+    # Directory for logs offloaded from intermediate results (e.g., logs="offload" in
+    # parallel_hessian). Use a shared filesystem to read them from any node
+    bigchem_logs_dir: Path = Path.home() / ".cache" / "bigchem" / "logs"
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -0,0 +1,279 @@
+"""Cost model for BigChem calculations
+
+estimated_cost gives the relative cost of a calculation from its number of basis
+functions, method, and calctype. estimated_runtime converts it to seconds with the
+seconds per unit of cost recorded for the program in the runtime history (see
+bigchem_runtime_history in config.py), or bigchem_seconds_per_cost if the program
+has no recorded runtimes. The estimates are used to order the calculations of a
+fan-out longest first (see algos._compute_group) and to prioritize them (see
+routing.py).
+"""
+
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from math import exp, log
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from .config import settings
+
+# Exponent of the cost of a method with the number of basis functions. Other methods
+# scale like DFT.
+METHOD_SCALING = {
+    "gfn1xtb": 2,
+    "gfn2xtb": 2,
+    "hf": 3,
+    "mp2": 5,
+    "ccsd": 6,
+    "ccsd(t)": 7,
+}
+DEFAULT_SCALING = 3
+# Cost of a calculation type relative to an energy
+CALCTYPE_COSTS = {
+    "energy": 1.0,
+    "gradient": 2.0,
+    "hessian": 10.0,
+    "optimization": 40.0,
+    "transition_state": 80.0,
+}
+# Basis functions per atom for H-He, Li-Ne, and heavier elements
+BASIS_FUNCTIONS = {
+    "sto-3g": (1, 5, 9),
+    "3-21g": (2, 9, 13),
+    "6-31g": (2, 9, 13),
+    "6-31g*": (2, 15, 19),
+    "6-31g**": (5, 15, 19),
+    "6-31+g*": (2, 19, 23),
+    "6-311g**": (6, 18, 22),
+    "cc-pvdz": (5, 14, 18),
+    "cc-pvtz": (14, 30, 34),
+    "cc-pvqz": (30, 55, 59),
+    "aug-cc-pvdz": (9, 23, 27),
+    "aug-cc-pvtz": (23, 46, 50),
+    "def2-svp": (5, 14, 18),
+    "def2-tzvp": (6, 31, 37),
+    "def2-tzvpp": (14, 31, 37),
+    "def2-qzvp": (30, 57, 64),
+}
+_BASIS_ALIASES = {
+    "6-31g(d)": "6-31g*",
+    "6-31g(d,p)": "6-31g**",
+    "6-31+g(d)": "6-31+g*",
+    "6-311g(d,p)": "6-311g**",
+}
+# Basis without a name (e.g., semiempirical methods) and unknown basis sets
+MINIMAL_BASIS = "sto-3g"
+DEFAULT_BASIS = "cc-pvdz"
+
+_ROW_ONE = {"H", "He"}
+_ROW_TWO = {"Li", "Be", "B", "C", "N", "O", "F", "Ne"}
+
+
+def _model(prog_input: Any) -> Any:
+    """Model of a ProgramInput or the subprogram model of a DualProgramInput"""
+    model = getattr(prog_input, "model", None)
+    if model is None and hasattr(prog_input, "subprogram_args"):
+        model = prog_input.subprogram_args.model
+    return model
+
+
+def basis_functions(symbols: list[str], basis: Optional[str]) -> int:
+    """Approximate number of basis functions of a structure
+
+    Params:
+        symbols: Element symbols of the structure
+        basis: Name of the basis set (case insensitive). None or "" for a minimal
+            basis. Unknown basis sets count like cc-pVDZ.
+
+    Returns:
+        Number of basis functions from the per-row counts in BASIS_FUNCTIONS
+    """
+    name = (basis or MINIMAL_BASIS).lower().replace(" ", "")
+    name = _BASIS_ALIASES.get(name, name)
+    per_row = BASIS_FUNCTIONS.get(name, BASIS_FUNCTIONS[DEFAULT_BASIS])
+    return sum(
+        per_row[0 if symbol in _ROW_ONE else 1 if symbol in _ROW_TWO else 2]
+        for symbol in symbols
+    )
+
+
+def estimated_cost(prog_input: Any) -> float:
+    """Estimated relative cost of a calculation from its size, method, and calctype
+
+    Params:
+        prog_input: ProgramInput or DualProgramInput. The model of a DualProgramInput
+            is read from its subprogram_args.
+
+    Returns:
+        n_basis_functions ** scaling * calctype cost, with scaling from METHOD_SCALING
+            and the calctype cost from CALCTYPE_COSTS
+    """
+    model = _model(prog_input)
+    method = str(getattr(model, "method", "")).lower()
+    scaling = METHOD_SCALING.get(method, DEFAULT_SCALING)
+    n_basis = basis_functions(
+        prog_input.structure.symbols, getattr(model, "basis", None)
+    )
+    calctype = getattr(prog_input.calctype, "value", prog_input.calctype)
+    return n_basis**scaling * CALCTYPE_COSTS.get(calctype, 1.0)
+
+
+def estimated_runtime(program: Optional[str], prog_input: Any) -> float:
+    """Estimated wall time of a calculation in seconds
+
+    Params:
+        program: Program running the calculation. None if unknown.
+        prog_input: ProgramInput or DualProgramInput
+
+    Returns:
+        estimated_cost times the seconds per unit of cost recorded for program in the
+            runtime history, or times bigchem_seconds_per_cost if there is none
+    """
+    history = get_runtime_history()
+    rate = None
+    if history is not None and program is not None:
+        rate = history.seconds_per_cost(program)
+    return estimated_cost(prog_input) * (rate or settings.bigchem_seconds_per_cost)
+
+
+class RuntimeHistory(ABC):
+    """Base class for runtime history backends
+
+    Keeps the number of recorded calculations and the sum of log(seconds / cost) for
+    each program, so the seconds per unit of cost is the geometric mean over all
+    recorded calculations of the program.
+
+    Params:
+        refresh: Seconds to reuse rates read from the backend before reading them
+            again. Estimates are needed for every task submitted, so they are not
+            read from the backend each time.
+    """
+
+    def __init__(self, refresh: float = 60.0):
+        self.refresh = refresh
+        self._rates: dict[str, tuple[float, Optional[float]]] = {}
+
+    def record(self, program: str, prog_input: Any, seconds: Optional[float]) -> None:
+        """Record the wall time of a calculation. Ignores missing wall times."""
+        if seconds is None or seconds <= 0:
+            return
+        self._add(program, log(seconds / estimated_cost(prog_input)))
+
+    def seconds_per_cost(self, program: str) -> Optional[float]:
+        """Seconds per unit of estimated_cost for program or None if not recorded"""
+        read_at, rate = self._rates.get(program, (-float("inf"), None))
+        if time.monotonic() - read_at > self.refresh:
+            count, total = self._stats(program)
+            rate = exp(total / count) if count else None
+            self._rates[program] = (time.monotonic(), rate)
+        return rate
+
+    @abstractmethod
+    def _add(self, program: str, log_rate: float) -> None:
+        """Backend specific update of the count and sum for program"""
+
+    @abstractmethod
+    def _stats(self, program: str) -> tuple[int, float]:
+        """Backend specific count and sum of log(seconds / cost) for program"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove all recorded runtimes"""
+
+
+class DiskRuntimeHistory(RuntimeHistory):
+    """Keep runtimes in a JSON file in a local (or shared) directory
+
+    Updates replace the file atomically, but concurrent updates from several workers
+    may drop a few samples, which only slightly changes the averages.
+
+    Params:
+        path: JSON file holding the runtimes
+        refresh: See RuntimeHistory
+    """
+
+    def __init__(self, path: Union[str, Path], refresh: float = 60.0):
+        super().__init__(refresh)
+        self.path = Path(path)
+
+    def _read(self) -> dict[str, list[float]]:
+        try:
+            return json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _add(self, program: str, log_rate: float) -> None:
+        runtimes = self._read()
+        count, total = runtimes.get(program, (0, 0.0))
+        runtimes[program] = [count + 1, total + log_rate]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(runtimes))
+        os.replace(tmp, self.path)
+
+    def _stats(self, program: str) -> tuple[int, float]:
+        count, total = self._read().get(program, (0, 0.0))
+        return int(count), float(total)
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
+        self._rates.clear()
+
+
+class RedisRuntimeHistory(RuntimeHistory):
+    """Keep runtimes in Redis, e.g., the BigChem result backend, shared by all workers
+
+    Params:
+        url: Redis connection url
+        refresh: See RuntimeHistory
+        key: Hash holding the counts and sums of all programs
+    """
+
+    def __init__(
+        self,
+        url: str = settings.bigchem_backend_url,
+        refresh: float = 60.0,
+        key: str = "bigchem:runtimes",
+    ):
+        # Import here so the redis client is only required when the history is used
+        import redis
+
+        super().__init__(refresh)
+        self.client: Any = redis.Redis.from_url(url)
+        self.key = key
+
+    def _add(self, program: str, log_rate: float) -> None:
+        pipeline = self.client.pipeline()
+        pipeline.hincrby(self.key, f"{program}:count", 1)
+        pipeline.hincrbyfloat(self.key, f"{program}:total", log_rate)
+        pipeline.execute()
+
+    def _stats(self, program: str) -> tuple[int, float]:
+        count, total = self.client.hmget(
+            self.key, f"{program}:count", f"{program}:total"
+        )
+        return int(count or 0), float(total or 0.0)
+
+    def clear(self) -> None:
+        self.client.delete(self.key)
+        self._rates.clear()
+
+
+@lru_cache(maxsize=None)
+def get_runtime_history() -> Optional[RuntimeHistory]:
+    """Return the runtime history configured in settings or None if it is off"""
+    backend = settings.bigchem_runtime_history
+    if backend is None:
+        return None
+    if backend == "disk":
+        return DiskRuntimeHistory(settings.bigchem_runtime_history_file)
+    if backend == "redis":
+        return RedisRuntimeHistory(
+            settings.bigchem_cache_url or settings.bigchem_backend_url
+        )
+    raise ValueError(
+        f"Unknown runtime history backend '{backend}'. Use 'disk' or 'redis'."
+    )
@@ -0,0 +1,171 @@
+"""Queues and priorities of BigChem tasks
+
+All tasks go to bigchem_queue by default. Routing is opt-in through settings:
+
+- bigchem_reducer_queue sends reducers (e.g., assemble_hessian) and other short tasks
+  to their own queue so a reducer never waits behind the calculations of another
+  job. Run dedicated workers for it, e.g., with
+  `celery -A bigchem.app:bigchem worker -Q bigchem.reducers`.
+- bigchem_large_cost sends calculations estimated to cost more to
+  bigchem_large_queue, e.g., for workers on larger nodes.
+- bigchem_priorities declares the queues with priorities. Reducers and other short
+  tasks get the highest priority; calculations get a priority from their estimated
+  runtime (see cost.py) so short calculations overtake long ones. Calculations of
+  equal priority run in the order they were submitted, which is longest first for
+  the fan-out of the algorithms (see algos._compute_group).
+
+Priorities range from 0 to bigchem_max_priority, higher values first. They are
+translated for Redis brokers, which serve lower values first.
+"""
+
+from math import floor, log10
+from typing import Any, Callable, Iterator, Optional
+
+from celery.canvas import Signature, _chain, chord, group
+
+from .config import settings
+from .cost import estimated_cost, estimated_runtime
+
+# Tasks running quantum chemistry calculations. All other tasks are short reducers.
+CALCULATION_TASKS = {
+    "compute",
+    "compute_accumulated",
+    "compute_batch",
+    "compute_checkpointed",
+    "compute_with_guess",
+    "md_trajectory",
+}
+
+
+def _calculation_inputs(args: Any) -> Iterator[Any]:
+    """Inputs (objects with a structure and calctype) in the arguments of a task"""
+    for arg in args:
+        if isinstance(arg, (list, tuple)):
+            yield from _calculation_inputs(arg)
+        elif hasattr(arg, "structure") and hasattr(arg, "calctype"):
+            yield arg
+
+
+def _program(args: Any) -> Optional[str]:
+    """Program in the arguments of a calculation task (the first string)"""
+    return next((arg for arg in args if isinstance(arg, str)), None)
+
+
+def task_cost(name: str, args: Any, kwargs: Optional[dict] = None) -> Optional[float]:
+    """Estimated cost of a calculation task from the inputs in its arguments
+
+    Returns None if the task is not a calculation or its inputs are unknown, e.g.,
+    a compute_with_guess task passing on its reference calculation.
+    """
+    return _task_estimate(name, args, kwargs, lambda _, inp: estimated_cost(inp))
+
+
+def task_runtime(
+    name: str, args: Any, kwargs: Optional[dict] = None
+) -> Optional[float]:
+    """Estimated runtime (seconds) of a calculation task, or None like task_cost"""
+    return _task_estimate(name, args, kwargs, estimated_runtime)
+
+
+def _task_estimate(
+    name: str,
+    args: Any,
+    kwargs: Optional[dict],
+    estimate: Callable[[Optional[str], Any], float],
+) -> Optional[float]:
+    """Sum of estimate(program, input) over the inputs of a calculation task"""
+    if name.rsplit(".", 1)[-1] not in CALCULATION_TASKS:
+        return None
+    program = _program(args)
+    estimates = [estimate(program, inp) for inp in _calculation_inputs(args)]
+    if not estimates:
+        return None
+    total = sum(estimates)
+    if name.endswith("md_trajectory"):
+        n_steps = (kwargs or {}).get("n_steps", args[3] if len(args) > 3 else 1)
+        total *= n_steps
+    return total
+
+
+def calculation_priority(runtime: Optional[float]) -> int:
+    """Priority of a calculation: one level lower for every factor of 10 in estimated
+    runtime above one second
+
+    The highest priority is reserved for reducers. Calculations of unknown runtime get
+    bigchem_default_priority.
+    """
+    if runtime is None:
+        return settings.bigchem_default_priority
+    highest = settings.bigchem_max_priority - 1
+    return max(0, min(highest, highest - floor(log10(max(runtime, 1.0)))))
+
+
+def _broker_priority(priority: int) -> int:
+    """Priority as understood by the broker (Redis serves lower values first)"""
+    if settings.bigchem_broker_url.startswith("redis"):
+        return settings.bigchem_max_priority - priority
+    return priority
+
+
+def route_task(
+    name: str,
+    args: Any,
+    kwargs: Optional[dict],
+    options: dict,
+    task: Any = None,
+    **kw,
+) -> dict[str, Any]:
+    """Celery router (see task_routes) sending tasks to their queue and priority
+
+    Reducers go to bigchem_reducer_queue (or bigchem_queue if not set) with the
+    highest priority. Calculations go to bigchem_queue, or bigchem_large_queue if their
+    estimated cost is above bigchem_large_cost, with a priority from their estimated
+    runtime. Priorities are only set if bigchem_priorities is enabled. A priority
+    passed when submitting a task (e.g., with the priority argument of the algorithms)
+    takes precedence.
+    """
+    if name.rsplit(".", 1)[-1] not in CALCULATION_TASKS:
+        route: dict[str, Any] = {
+            "queue": settings.bigchem_reducer_queue or settings.bigchem_queue
+        }
+        if settings.bigchem_priorities:
+            route["priority"] = _broker_priority(settings.bigchem_max_priority)
+        return route
+    cost = task_cost(name, args, kwargs)
+    large = settings.bigchem_large_cost is not None and (cost or 0.0) > (
+        settings.bigchem_large_cost
+    )
+    route = {"queue": settings.bigchem_large_queue if large else settings.bigchem_queue}
+    if settings.bigchem_priorities:
+        route["priority"] = _broker_priority(
+            calculation_priority(task_runtime(name, args, kwargs))
+        )
+    return route
+
+
+def _prioritized(signature: Signature, priority: Optional[int]) -> Signature:
+    """Set the priority of every calculation task in signature (in place)
+
+    Params:
+        signature: Task, group, chain, or chord
+        priority: Priority from 0 to bigchem_max_priority. None to keep the priorities
+            of route_task.
+    """
+    if priority is None:
+        return signature
+    if not settings.bigchem_priorities:
+        raise ValueError("priority requires bigchem_priorities to be enabled.")
+    if not 0 <= priority <= settings.bigchem_max_priority:
+        raise ValueError(
+            f"priority must be between 0 and {settings.bigchem_max_priority}."
+        )
+    if isinstance(signature, chord):
+        for task in signature.tasks:
+            _prioritized(task, priority)
+        _prioritized(signature.body, priority)
+    elif isinstance(signature, (group, _chain)):
+        for task in signature.tasks:
+            _prioritized(task, priority)
+    elif signature.task.rsplit(".", 1)[-1] in CALCULATION_TASKS:
+        signature.set(priority=_broker_priority(priority))
+    return signature
@@ -0,0 +1,130 @@
+"""Compact binary serializer for Celery messages and results.
+
+Encodes messages with msgpack. qcdata (pydantic) models are encoded as their set
+fields, numpy arrays as raw little-endian buffers, and anything else msgpack cannot
+represent natively (e.g., exceptions) falls back to pickle. This avoids the base64
+and nested-list overhead of model dumps and the per-object class metadata of pickle
+for large fan-outs like parallel_hessian.
+
+Requires the msgpack package: pip install bigchem[msgpack]
+"""
+
+import importlib
+import pickle
+import warnings
+from pathlib import Path, PurePath
+from typing import Any
+
+import numpy as np
+from pydantic import BaseModel
+
+SERIALIZER_NAME = "bigchem"
+CONTENT_TYPE = "application/x-bigchem-msgpack"
+
+# msgpack ExtType codes
+_ARRAY = 1
+_MODEL = 2
+_PATH = 3
+_PICKLE = 4
+
+
+def _class_path(cls: type) -> str:
+    return f"{cls.__module__}:{cls.__name__}"
+
+
+def _resolve_class(path: str) -> type[BaseModel]:
+    module, name = path.split(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _default(obj: Any) -> Any:
+    """Convert objects msgpack does not support natively"""
+    import msgpack
+
+    if isinstance(obj, np.ndarray) and obj.dtype.kind in "biufc":
+        array = np.ascontiguousarray(obj, dtype=obj.dtype.newbyteorder("<"))
+        payload = [array.dtype.str, list(array.shape), array.tobytes()]
+        return msgpack.ExtType(_ARRAY, _packb(payload))
+    if isinstance(obj, np.generic) and obj.dtype.kind in "biufc":
+        return obj.item()
+    if isinstance(obj, BaseModel):
+        cls = type(obj)
+        # Parametrized generics (e.g., ProgramOutput[ProgramInput, SinglePointData])
+        # must be registered on their module to be found again when decoding
+        module = importlib.import_module(cls.__module__)
+        if getattr(module, cls.__name__, None) is cls:
+            fields = {name: getattr(obj, name) for name in obj.model_fields_set}
+            return msgpack.ExtType(_MODEL, _packb([_class_path(cls), fields]))
+    if isinstance(obj, PurePath):
+        return msgpack.ExtType(_PATH, str(obj).encode())
+    return msgpack.ExtType(_PICKLE, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    """Rebuild objects encoded by _default"""
+    if code == _ARRAY:
+        dtype, shape, buffer = _unpackb(data)
+        # Copy so the array is writable and does not reference the message buffer
+        return np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape).copy()
+    if code == _MODEL:
+        path, fields = _unpackb(data)
+        return _resolve_class(path).model_validate(fields)
+    if code == _PATH:
+        return Path(data.decode())
+    if code == _PICKLE:
+        return pickle.loads(data)
+    raise ValueError(f"Unknown msgpack extension type {code}")
+
+
+def _packb(obj: Any) -> bytes:
+    import msgpack
+
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+
+def _unpackb(data: bytes) -> Any:
+    import msgpack
+
+    return msgpack.unpackb(
+        data, ext_hook=_ext_hook, raw=False, strict_map_key=False, use_list=True
+    )
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize obj to bytes"""
+    return _packb(obj)
+
+
+def loads(data: bytes) -> Any:
+    """Deserialize bytes created by dumps"""
+    if isinstance(data, str):  # Some transports decode message bodies
+        data = data.encode("latin-1")
+    return _unpackb(data)
+
+
+def register_serializer() -> None:
+    """Register the serializer with kombu so Celery can use it by name"""
+    from celery.backends import base
+    from kombu.serialization import register
+
+    register(
+        SERIALIZER_NAME,
+        dumps,
+        loads,
+        content_type=CONTENT_TYPE,
+        content_encoding="binary",
+    )
+    # Exceptions round trip through the pickle fallback, so let result backends store
+    # them as objects rather than dicts. This preserves QCComputeBaseError.prog_output.
+    # EXCEPTION_ABLE_CODECS is not public Celery API (see test_serializers.py), so
+    # warn instead of failing if it is removed; exceptions are then stored as dicts.
+    codecs = getattr(base, "EXCEPTION_ABLE_CODECS", None)
+    if codecs is None:
+        warnings.warn(
+            "celery.backends.base.EXCEPTION_ABLE_CODECS not found. Exceptions stored "
+            f"with the {SERIALIZER_NAME} serializer lose their prog_output.",
+            RuntimeWarning,
+            stacklevel=2,
+        )
+        return
+    base.EXCEPTION_ABLE_CODECS = frozenset(codecs) | {SERIALIZER_NAME}
@@ -1,5 +1,5 @@
-from itertools import zip_longest
-from typing import Union
+from tempfile import TemporaryDirectory
+from typing import Any, Optional, Union
 
 import numpy as np
 from qccompute import compute as qccompute_compute
@@ -18,12 +18,46 @@ from qcdata import (
     StructuredInputs,
 )
 
+from .accumulator import _pack_frame, get_accumulator
 from .app import bigchem
+from .cache import get_cache, get_checkpoint_store, input_hash
+from .canvas import group
+from .cost import get_runtime_history
+from .routing import _prioritized
+from .utils import (
+    FS_TO_AU,
+    INITIAL_HESSIAN_FILE,
+    _atomic_masses,
+    _constrained_input,
+    _derived_output,
+    _energy_window,
+    _finite_difference_hessian,
+    _fire_step,
+    _flatten_outputs,
+    _handle_logs,
+    _hessian_file,
+    _maxwell_boltzmann_velocities,
+    _mbe_coefficients,
+    _neb_forces,
+    _optimization_converged,
+    _partial_frequency_analysis,
+    _program_input,
+    _scan_neighbors,
+    _scan_result,
+    _scan_values,
+    _stencil_derivatives,
+    _supports_wfn_reuse,
+    _unique_conformers,
+    _wavefront,
+    _wfn_guess_input,
+    _without_files,
+)
 
 __all__ = [
     "compute",
     # "output_to_input",
     "assemble_hessian",
+    "assemble_gradient",
     "frequency_analysis",
 ]
 
@@ -32,6 +66,7 @@ __all__ = [
 def compute(
     program: Union[str, Inputs],
     inp_obj: Union[Inputs, str],
+    logs: str = "keep",
     **kwargs,
 ) -> ProgramOutput[Inputs, Data]:
     """Wrapper around qccompute.compute.
@@ -41,11 +76,203 @@ def compute(
     as the first argument. Chains can only pass the output object as the first argument
     to the next task in the chain. This wrapper allows the user to pass the program
     first or second.
+
+    If a result cache is configured (see bigchem_cache_backend in config.py) the
+    cache is checked for an identical program + input before computing and successful
+    outputs are stored in it. If a runtime history is configured (see
+    bigchem_runtime_history) the wall times of successful calculations are recorded
+    to estimate the runtimes of future calculations (see cost.py).
+
+    Params:
+        logs: "keep" to return the program's logs, "drop" to remove them, or "offload"
+            to write them to bigchem_logs_dir and return the file path instead. Used
+            to keep large stdout out of the result backend for intermediate results.
     """
     if isinstance(inp_obj, str):
         # If the first argument is a string, then the second argument is the input
         program, inp_obj = inp_obj, program
-    return qccompute_compute(program, inp_obj, **kwargs)
+
+    cache = get_cache()
+    history = get_runtime_history()
+    if cache is None and history is None and logs == "keep":
+        return qccompute_compute(program, inp_obj, **kwargs)
+
+    key = input_hash(program, inp_obj, **kwargs)  # type: ignore
+    output = cache.get(key) if cache is not None else None
+    if output is not None:
+        # Return the exact input requested, which may differ within rounding tolerance
+        output = output.model_copy(update={"input_data": inp_obj})
+    else:
+        output = qccompute_compute(program, inp_obj, **kwargs)  # type: ignore
+        if cache is not None and output.success:
+            cache.set(key, output)
+        if history is not None and output.success:
+            history.record(program, inp_obj, output.provenance.wall_time)  # type: ignore
+    return _handle_logs(output, logs, key)
+
+
+@bigchem.task
+def compute_checkpointed(
+    program: str, inp_obj: Inputs, logs: str = "keep", **kwargs
+) -> ProgramOutput[Inputs, Data]:
+    """Compute and save the output to the checkpoint store
+
+    If the output for this program + input is already checkpointed (e.g., it completed
+    after the signature was created) it is returned without recomputing. logs is
+    passed to compute, so the checkpointed output already has its logs handled.
+    """
+    store = get_checkpoint_store()
+    key = input_hash(program, inp_obj, **kwargs)
+    output = store.get(key)
+    if output is None:
+        output = compute(program, inp_obj, logs=logs, **kwargs)
+        store.set(key, output)
+    return output
+
+
+@bigchem.task
+def compute_batch(
+    program: str,
+    inp_objs: list[Inputs],
+    logs: str = "keep",
+    checkpoint: bool = False,
+    **kwargs,
+) -> list[ProgramOutput[Inputs, Data]]:
+    """Compute several inputs sequentially in a single task
+
+    Avoids a broker round trip per calculation for small, fast calculations. All
+    calculations share one scratch directory unless scratch_dir is passed in kwargs.
+
+    Params:
+        program: Program to use for all calculations
+        inp_objs: Inputs to compute in order
+        logs: See compute
+        checkpoint: If True, use compute_checkpointed for each input
+        kwargs: Keyword arguments passed to compute
+
+    Returns:
+        Outputs in the same order as inp_objs
+    """
+    single = compute_checkpointed if checkpoint else compute
+    with TemporaryDirectory(prefix="bigchem-batch-") as scratch_dir:
+        batch_kwargs = {"scratch_dir": scratch_dir, "rm_scratch_dir": False, **kwargs}
+        return [
+            single(program, inp_obj, logs=logs, **batch_kwargs) for inp_obj in inp_objs
+        ]
+
+
+@bigchem.task
+def store_wfn(reference: ProgramOutput, key: str) -> ProgramOutput:
+    """Save a calculation with its wavefunction files to the checkpoint store
+
+    Used before a group of compute_with_guess tasks so the wavefunction files go
+    through the broker once instead of once per task.
+
+    Params:
+        reference: Output of a calculation run with collect_wfn=True
+        key: Key under which the output is stored
+
+    Returns:
+        The reference output without its wavefunction files
+    """
+    get_checkpoint_store().set(key, reference)
+    return _without_files(reference)
+
+
+@bigchem.task
+def compute_with_guess(
+    reference: ProgramOutput,
+    program: str,
+    inp_obj: Union[Inputs, list[Inputs], None] = None,
+    logs: str = "keep",
+    wfn_key: Optional[str] = None,
+    **kwargs,
+) -> Union[ProgramOutput, list[ProgramOutput]]:
+    """Compute inputs starting from the wavefunction of a reference calculation
+
+    Used for the tasks of a group chained after the reference calculation, whose
+    output Celery passes as the first argument. The returned outputs reference the
+    original inputs so the guess files aren't stored with every result.
+
+    Params:
+        reference: Output of a calculation run with collect_wfn=True, or without its
+            files if wfn_key is set
+        program: Program to use. Its qccompute adapter must support propagate_wfn.
+        inp_obj: Input or list of inputs (computed sequentially like compute_batch).
+            If None, the reference output is returned without its wavefunction files
+            so it can be passed on to the reducer of a chord.
+        logs: See compute
+        wfn_key: Key of the reference with its wavefunction files in the checkpoint
+            store (see store_wfn)
+        kwargs: Keyword arguments passed to compute
+    """
+    if inp_obj is None:
+        return _without_files(reference)
+    if wfn_key is not None:
+        reference = get_checkpoint_store().get(wfn_key)  # type: ignore
+        if reference is None:
+            raise RuntimeError(
+                f"Wavefunction {wfn_key} expired before it could be used. Resubmit "
+                "the job."
+            )
+
+    inp_objs = inp_obj if isinstance(inp_obj, list) else [inp_obj]
+    guessed = [_wfn_guess_input(program, reference, inp) for inp in inp_objs]
+    if isinstance(inp_obj, list):
+        outputs = compute_batch(program, guessed, logs=logs, **kwargs)
+    else:
+        outputs = [compute(program, guessed[0], logs=logs, **kwargs)]
+    outputs = [
+        output.model_copy(update={"input_data": inp})
+        for output, inp in zip(outputs, inp_objs)
+    ]
+    return outputs if isinstance(inp_obj, list) else outputs[0]
+
+
+@bigchem.task
+def merge_checkpoints(
+    outputs: list[ProgramOutput], keys: list[str], missing: list[int]
+) -> list[ProgramOutput]:
+    """Merge newly computed outputs with outputs loaded from the checkpoint store
+
+    Params:
+        outputs: Outputs of the calculations that had to be computed. Lists of outputs
+            from batched tasks are flattened.
+        keys: Checkpoint keys (see cache.input_hash) for every calculation in order
+        missing: Positions in keys of the calculations in outputs
+
+    Returns:
+        Outputs for every key in order
+    """
+    store = get_checkpoint_store()
+    computed = dict(zip(missing, _flatten_outputs(outputs)))
+    merged = []
+    for i, key in enumerate(keys):
+        output = computed.get(i) or store.get(key)
+        if output is None:
+            raise RuntimeError(
+                f"Checkpoint {key} expired before it could be used. Resubmit the job."
+            )
+        merged.append(output)
+    return merged
+
+
+@bigchem.task
+def restore_order(outputs: list[Any], order: list[int]) -> list[Any]:
+    """Return the outputs of a group submitted longest first in input order
+
+    Params:
+        outputs: Outputs of the group (see algos._compute_group). Lists of outputs
+            from batched tasks are flattened.
+        order: Position in the original inputs of every flattened output
+
+    Returns:
+        Outputs in the order of the original inputs
+    """
+    restored: list[Any] = [None] * len(order)
+    for position, output in zip(order, _flatten_outputs(outputs)):
+        restored[position] = output
+    return restored
 
 
 @bigchem.task
@@ -53,49 +280,107 @@ def output_to_input(
     output: ProgramOutput[StructuredInputs, Data],
     calctype: CalcType,
     program_args: Union[ProgramArgs, ProgramArgsSub],
+    wfn_program: Optional[str] = None,
+    initial_hessian: bool = True,
 ) -> Union[ProgramInput, DualProgramInput]:
     """Propagate output values from a calculation onto a new input object.
 
+    The new input uses the final structure of optimizations and transition state
+    searches and the input structure of any other calculation.
+
     Args:
         output: ProgramOutput or ProgramFailure object
-        program_args: QCProgramArgs or SubProgramArgs object
         calctype: Calculation type for the new input
-
-    NOTE: This task requires additional work to cover more general cases. This skeleton
-        is primarily to give an initial example of basic multi-package geometry
-        optimization.
+        program_args: QCProgramArgs or SubProgramArgs object
+        wfn_program: If set, start the SCF of the new input (of its subprogram for
+            SubProgramArgs) from the wavefunction of output, which must have been
+            computed by this program with collect_wfn=True (for optimizations, the
+            wavefunction of the last step is used). The program's qccompute adapter
+            must support wavefunction propagation (e.g., TeraChem).
+        initial_hessian: If True and output has a hessian (e.g., from parallel_hessian)
+            and the new input is a geomeTRIC optimization or transition state search,
+            start the optimizer from that hessian instead of computing or guessing
+            one. Skipped if program_args already sets the hessian keyword.
     """
-    input_model = (
-        ProgramInput if isinstance(program_args, ProgramArgs) else DualProgramInput
-    )
-    if output.input_data.calctype in {CalcType.optimization, CalcType.transition_state}:
-        assert isinstance(output.data, (OptimizationData, OptimizationResults))  # mypy
-        # Take final geometry from optimization and pass to next input
-        return input_model(
-            structure=output.data.final_structure,
-            calctype=calctype,
-            **program_args.model_dump(),
-        )
-    else:
-        # TODO: Add wavefunction passing for TeraChem somewhere? Not here...
+    input_data = getattr(output, "input_data", None)
+    if not hasattr(input_data, "structure"):
         raise NotImplementedError(
-            f"No implementation for transforming {output.__class__.__name__} objects "
-            f"into {input_model.__name__} objects yet."
+            f"No implementation for transforming outputs of "
+            f"{input_data.__class__.__name__} objects into new inputs yet."
         )
+    is_optimization = isinstance(output.data, (OptimizationData, OptimizationResults))
+    structure = (
+        output.data.final_structure  # type: ignore
+        if is_optimization
+        else input_data.structure  # type: ignore
+    )
+    new_input = _program_input(structure, calctype, program_args)
+
+    if wfn_program is not None:
+        if not _supports_wfn_reuse(wfn_program):
+            raise ValueError(
+                f"The qccompute adapter for {wfn_program} can't reuse wavefunctions."
+            )
+        reference = output.data.trajectory[-1] if is_optimization else output  # type: ignore
+        if isinstance(new_input, DualProgramInput):
+            guessed = _wfn_guess_input(
+                wfn_program, reference, new_input.subprogram_args
+            )
+            new_input = new_input.model_copy(update={"subprogram_args": guessed})
+        else:
+            new_input = _wfn_guess_input(wfn_program, reference, new_input)
+
+    hessian = getattr(output.data, "hessian", None)
+    if (
+        initial_hessian
+        and hessian is not None
+        and isinstance(new_input, DualProgramInput)
+        and calctype in {CalcType.optimization, CalcType.transition_state}
+        and "hessian" not in new_input.keywords
+    ):
+        # geomeTRIC reads the initial hessian from a file in its working directory
+        new_input.files[INITIAL_HESSIAN_FILE] = _hessian_file(hessian)
+        new_input.keywords["hessian"] = f"file:{INITIAL_HESSIAN_FILE}"
+    return new_input
 
 
 @bigchem.task
 def assemble_hessian(
-    gradients: list[ProgramOutput[ProgramInput, SinglePointResults]], dh: float
+    gradients: list[ProgramOutput[ProgramInput, SinglePointResults]],
+    dh: float,
+    symmetry_tol: Optional[float] = None,
+    stencil: str = "central",
+    projected: bool = False,
+    active_atoms: Optional[list[int]] = None,
+    symmetrize: bool = False,
 ) -> ProgramOutput[ProgramInput, SinglePointResults]:
     """Assemble hessian from an array of gradient computations
 
     Params:
         gradients: List of gradient AtomicResult objects alternating between a
             "forward" and "backward" computation. NOTE: The last computation on the
-            list is a basic energy calculation of the original geometry.
+            list is a basic energy calculation of the original geometry. Lists of
+            outputs from batched tasks (see compute_batch) are flattened.
         dh: The displacement used for finite difference displacements of gradient
             geometries
+        symmetry_tol: If set, gradients were only computed for the symmetry-unique
+            atoms of the structure (as found with this tolerance) and the remaining
+            rows of the hessian are generated by applying the symmetry operations.
+        stencil: "central" for the layout described above. "forward" if gradients
+            contains only "forward" computations and the last computation on the list
+            is a gradient calculation of the original geometry. Its gradient is the
+            reference for the forward differences and its energy is used for the
+            final output. "five-point" if each "forward" and "backward" pair is
+            followed by a pair displaced by 2 * dh.
+        projected: If True, gradients were displaced along vibrational directions
+            rather than Cartesian coordinates (see parallel_hessian). The directions
+            are recovered from the input geometries and the hessian is
+            back-transformed to Cartesian coordinates.
+        active_atoms: If set, gradients were only computed for displacements of these
+            atoms. The returned (3N, 3N) partial hessian has the rows and columns of
+            the active atoms filled and zeros in the inactive-inactive block.
+        symmetrize: If True, return (H + H^T) / 2. The largest asymmetry of the
+            computed hessian is always reported in .data.extras["hessian_asymmetry"].
 
     Note:
         Another way I've tested this algorithm is to compute the hessian using psi4
@@ -105,35 +390,707 @@ def assemble_hessian(
         of rotation on their matrix, so the eigenvalues are a better mechanism for
         comparison.
     """
-    # Pop energy calculation of original geometry from gradients (last value in
-    # gradients list)
-    energy_output = gradients.pop()
+    gradients = _flatten_outputs(gradients)
+    # Pop energy (or reference gradient) calculation of original geometry from
+    # gradients (last value in gradients list)
+    reference_output = gradients.pop()
+    grads = np.array([gradient.data.gradient for gradient in gradients])
+    geoms = np.array([gradient.input_data.structure.geometry for gradient in gradients])
+    hessian, extras = _finite_difference_hessian(
+        grads,
+        geoms,
+        reference_output,
+        dh,
+        symmetry_tol,
+        stencil,
+        projected,
+        active_atoms,
+        symmetrize,
+    )
+    return _derived_output(
+        reference_output, CalcType.hessian, {"hessian": hessian}, extras
+    )
+
+
+@bigchem.task
+def assemble_gradient(
+    energies: list[ProgramOutput[ProgramInput, SinglePointResults]],
+    dh: float,
+    stencil: str = "central",
+) -> ProgramOutput[ProgramInput, SinglePointResults]:
+    """Assemble a numerical gradient from an array of energy computations
+
+    Params:
+        energies: List of energy outputs alternating between a "forward" and
+            "backward" displacement of each Cartesian coordinate ("forward" only for
+            the "forward" stencil). NOTE: The last computation on the list is an energy
+            calculation of the original geometry. Lists of outputs from batched tasks
+            (see compute_batch) are flattened.
+        dh: The displacement used for the finite differences
+        stencil: "central", "forward", or "five-point". See parallel_gradient.
+
+    Returns:
+        The energy calculation of the original geometry with the gradient added
+    """
+    energies = _flatten_outputs(energies)
+    reference_output = energies.pop()
+    values = np.array([energy.data.energy for energy in energies])
+    gradient, error = _stencil_derivatives(
+        values, reference_output.data.energy, dh, stencil
+    )
+    extras = {} if error is None else {"gradient_richardson_error": error}
+    n_atoms = len(reference_output.input_data.structure.symbols)
+    return _derived_output(
+        reference_output,
+        CalcType.gradient,
+        {"gradient": gradient.reshape(n_atoms, 3)},
+        extras,
+    )
+
+
+@bigchem.task
+def assemble_energy_hessian(
+    energies: list[ProgramOutput[ProgramInput, SinglePointResults]],
+    dh: float,
+) -> ProgramOutput[ProgramInput, SinglePointResults]:
+    """Assemble a numerical hessian (and gradient) from an array of energy computations
+
+    Params:
+        energies: List of energy outputs in the order of the inputs created by
+            utils._energy_hessian_inputs. NOTE: The last computation on the list is an
+            energy calculation of the original geometry. Lists of outputs from batched
+            tasks (see compute_batch) are flattened.
+        dh: The displacement used for the finite differences
+
+    Returns:
+        The energy calculation of the original geometry with the hessian and the
+            central difference gradient added
+    """
+    energies = _flatten_outputs(energies)
+    reference_output = energies.pop()
+    e0: float = reference_output.data.energy  # type: ignore
+    values = np.array([energy.data.energy for energy in energies])
+
+    n_atoms = len(reference_output.input_data.structure.symbols)
+    n = n_atoms * 3
+    plus, minus = values[0 : 2 * n : 2], values[1 : 2 * n : 2]
+    pair_plus, pair_minus = values[2 * n :: 2], values[2 * n + 1 :: 2]
+
+    hessian = np.diag((plus - 2 * e0 + minus) / dh**2)
+    rows, cols = np.triu_indices(n, 1)
+    mixed = pair_plus + pair_minus - plus[rows] - minus[rows] - plus[cols]
+    mixed = (mixed - minus[cols] + 2 * e0) / (2 * dh**2)
+    hessian[rows, cols] = mixed
+    hessian[cols, rows] = mixed
+
+    gradient = ((plus - minus) / (dh * 2)).reshape(n_atoms, 3)
+    return _derived_output(
+        reference_output, CalcType.hessian, {"hessian": hessian, "gradient": gradient}
+    )
+
+
+@bigchem.task
+def compute_accumulated(
+    program: str, inp_obj: ProgramInput, key: str, index: int, **kwargs
+) -> None:
+    """Compute a gradient and add it to the accumulator instead of returning it
+
+    The gradient and the geometry it was computed at are stored as one (2, N, 3) array
+    at position index of job key (see accumulator.get_accumulator).
+
+    Params:
+        program: Program to use for the calculation
+        inp_obj: Gradient calculation
+        key: Job key shared by all calculations of the hessian
+        index: Position of inp_obj in the list of displaced calculations
+        kwargs: Keyword arguments passed to compute
+    """
+    output = compute(program, inp_obj, **kwargs)
+    geometry = output.input_data.structure.geometry
+    get_accumulator().add(key, index, np.stack([output.data.gradient, geometry]))
+
+
+@bigchem.task
+def assemble_accumulated_hessian(
+    outputs: list[Optional[ProgramOutput[ProgramInput, SinglePointResults]]],
+    key: str,
+    n_calcs: int,
+    dh: float,
+    symmetry_tol: Optional[float] = None,
+    stencil: str = "central",
+    projected: bool = False,
+    active_atoms: Optional[list[int]] = None,
+    symmetrize: bool = False,
+) -> ProgramOutput[ProgramInput, SinglePointResults]:
+    """Assemble hessian from gradients collected by compute_accumulated tasks
+
+    Params:
+        outputs: Results of the group. compute_accumulated tasks return None and the
+            last item is the calculation of the original geometry.
+        key: Job key the gradients were accumulated under. Deleted once assembled.
+        n_calcs: Number of accumulated gradients
+        dh, symmetry_tol, stencil, projected, active_atoms, symmetrize: See
+            assemble_hessian
+    """
+    reference_output = outputs[-1]
+    assert reference_output is not None  # mypy
+    accumulator = get_accumulator()
+    arrays = accumulator.read(key)
+    if len(arrays) != n_calcs:
+        raise RuntimeError(
+            f"Found {len(arrays)} of {n_calcs} gradients for accumulator key {key}. "
+            "They may have expired. Resubmit the job."
+        )
+    stacked = np.array([arrays[i] for i in range(n_calcs)])
+    hessian, extras = _finite_difference_hessian(
+        stacked[:, 0],
+        stacked[:, 1],
+        reference_output,
+        dh,
+        symmetry_tol,
+        stencil,
+        projected,
+        active_atoms,
+        symmetrize,
+    )
+    accumulator.delete(key)
+    return _derived_output(
+        reference_output, CalcType.hessian, {"hessian": hessian}, extras
+    )
+
+
+@bigchem.task(bind=True)
+def neb_step(
+    self,
+    outputs: list[ProgramOutput[ProgramInput, SinglePointResults]],
+    program: str,
+    endpoints: Optional[list[ProgramOutput[ProgramInput, SinglePointResults]]] = None,
+    spring_constant: float = 0.01,
+    climbing: bool = True,
+    force_tol: float = 1.0e-3,
+    max_iter: int = 100,
+    time_step: float = 1.0,
+    max_step: float = 0.2,
+    logs: str = "keep",
+    state: Optional[dict] = None,
+    iteration: int = 1,
+    priority: Optional[int] = None,
+) -> list[ProgramOutput[ProgramInput, SinglePointResults]]:
+    """Take one nudged elastic band step and dispatch the next iteration
+
+    Computes the NEB forces from the gradients of the interior images and moves them
+    with the FIRE minimizer. If the path has not converged, this task is replaced by a
+    group computing the moved images chained to the next neb_step, so the loop runs
+    on the workers without a round trip to the client.
+
+    Params:
+        outputs: Gradient calculations of the interior images. On the first iteration
+            (endpoints=None) the list also holds the energy calculations of the two
+            endpoints as its first and last items.
+        program: Program to use for the gradient calculations
+        endpoints: Energy calculations of the fixed endpoints
+        spring_constant, climbing, force_tol, max_iter, time_step, max_step, logs,
+            priority: See algos.parallel_neb
+        state: FIRE minimizer state from the previous iteration
+        iteration: Number of this iteration, starting from 1
+
+    Returns:
+        Outputs of all images of the final path including the endpoints. Every
+            .data.extras holds "neb_converged", "neb_iterations", "neb_max_force"
+            (largest NEB force on any atom in Hartree/Bohr), and "neb_climbing"
+            (True only for the climbing image).
+    """
+    if endpoints is None:
+        endpoints, outputs = [outputs[0], outputs[-1]], outputs[1:-1]
+    path = [endpoints[0], *outputs, endpoints[1]]
+    geometries = np.array([output.input_data.structure.geometry for output in path])
+    energies = np.array([output.data.energy for output in path])
+    climbing_image = int(np.argmax(energies[1:-1])) + 1 if climbing else None
+    forces = _neb_forces(
+        geometries,
+        energies,
+        np.array([output.data.gradient for output in outputs]),
+        spring_constant,
+        climbing_image,
+    )
+    max_force = float(np.max(np.linalg.norm(forces, axis=-1)))
+    converged = max_force < force_tol
+
+    if converged or iteration >= max_iter:
+        final = []
+        for i, output in enumerate(path):
+            extras = {
+                **output.data.extras,
+                "neb_converged": converged,
+                "neb_iterations": iteration,
+                "neb_max_force": max_force,
+                "neb_climbing": i == climbing_image,
+            }
+            data = output.data.model_copy(update={"extras": extras})
+            final.append(output.model_copy(update={"data": data}))
+        return final
+
+    positions, state = _fire_step(geometries[1:-1], forces, state, time_step, max_step)
+    images = group(
+        compute.s(
+            program,
+            output.input_data.model_copy(
+                update={
+                    "structure": output.input_data.structure.model_copy(
+                        update={"geometry": position}
+                    )
+                }
+            ),
+            logs=logs,
+        )
+        for output, position in zip(outputs, positions)
+    )
+    next_step = neb_step.s(
+        program,
+        endpoints,
+        spring_constant,
+        climbing,
+        force_tol,
+        max_iter,
+        time_step,
+        max_step,
+        logs,
+        state,
+        iteration + 1,
+        priority,
+    )
+    return self.replace(_prioritized(images | next_step, priority))
+
+
+@bigchem.task(bind=True)
+def select_conformers(
+    self,
+    outputs: list[ProgramOutput[StructuredInputs, OptimizationData]],
+    calctype: CalcType,
+    programs: list[str],
+    program_args: list[Union[ProgramArgs, ProgramArgsSub]],
+    rmsd_tol: float = 0.25,
+    energy_tol: float = 1.0e-4,
+    energy_window: Optional[float] = None,
+    max_conformers: Optional[int] = None,
+    priority: Optional[int] = None,
+    **kwargs,
+) -> list[ProgramOutput[StructuredInputs, OptimizationData]]:
+    """Remove duplicate and high energy conformers and optimize the survivors further
+
+    Reducer of the screening optimizations of algos.ensemble_opt. If programs is not
+    empty this task is replaced by a group of multistep_opt chains starting from the
+    final structure of every surviving conformer.
+
+    Params:
+        outputs: Screening optimizations. Failed optimizations are discarded.
+        calctype: Calculation type of the following optimizations
+        programs: Programs of the following optimization steps. May be empty.
+        program_args: Program arguments of the following optimization steps
+        rmsd_tol, energy_tol, energy_window, max_conformers, priority: See
+            algos.ensemble_opt
+        kwargs: Keyword arguments passed to compute for the following steps
+
+    Returns:
+        The final optimization of each surviving conformer ordered by the energy of its
+            screening optimization
+    """
+    # Import here since algos imports the tasks
+    from .algos import multistep_opt
 
-    # # Verify data integrity of gradients
-    # for gradient in gradients:
+    outputs = [output for output in outputs if output.success]
+    energies: list[float] = [o.data.final_energy for o in outputs]  # type: ignore
+    structures = [output.data.final_structure for output in outputs]
+    unique = _unique_conformers(structures, energies, rmsd_tol, energy_tol)
+    selected = _energy_window(
+        [energies[i] for i in unique], energy_window, max_conformers
+    )
+    survivors = [outputs[unique[i]] for i in selected]
+    if not programs or not survivors:
+        return survivors
+    return self.replace(
+        group(
+            multistep_opt(
+                survivor.data.final_structure,
+                calctype,
+                programs,
+                program_args,
+                priority=priority,
+                **kwargs,
+            )
+            for survivor in survivors
+        )
+    )
+
+
+@bigchem.task(bind=True)
+def prune_stage(
+    self,
+    outputs: list[ProgramOutput[StructuredInputs, OptimizationData]],
+    calctype: CalcType,
+    programs: list[str],
+    program_args: list[Union[ProgramArgs, ProgramArgsSub]],
+    energy_window: Optional[float] = None,
+    max_structures: Optional[int] = None,
+    priority: Optional[int] = None,
+    **kwargs,
+) -> list[ProgramOutput[StructuredInputs, OptimizationData]]:
+    """Barrier between the stages of algos.parallel_multistep_opt
 
-    dim = len(gradients[0].input_data.structure.symbols) * 3
-    hessian = np.zeros((dim, dim), dtype=float)
+    Discards failed optimizations and prunes the rest by energy. If programs is not
+    empty this task is replaced by a group optimizing the final structures of the
+    survivors with the next program, chained to prune_stage for the remaining stages.
 
-    for i, (forward, backward) in enumerate(zip_longest(*[iter(gradients)] * 2)):
-        val = (forward.data.gradient - backward.data.gradient) / (dh * 2)  # type: ignore # noqa: E501
-        hessian[i] = val.flatten()
+    Params:
+        outputs: Optimizations of the stage that just completed
+        calctype: Calculation type of the following optimizations
+        programs: Programs of the remaining stages. May be empty.
+        program_args: Program arguments of the remaining stages
+        energy_window, max_structures, priority: See algos.parallel_multistep_opt
+        kwargs: Keyword arguments passed to compute
 
-    output = energy_output.model_dump()
-    output["input_data"]["calctype"] = CalcType.hessian
-    output["data"]["hessian"] = hessian
+    Returns:
+        The optimizations of the last stage ordered by energy
+    """
+    outputs = [output for output in outputs if output.success]
+    energies: list[float] = [o.data.final_energy for o in outputs]  # type: ignore
+    survivors = [
+        outputs[i] for i in _energy_window(energies, energy_window, max_structures)
+    ]
+    if not programs or not survivors:
+        return survivors
+    stage = group(
+        compute.s(
+            programs[0],
+            output_to_input(survivor, calctype, program_args[0]),
+            raise_exc=False,
+            **kwargs,
+        )
+        for survivor in survivors
+    )
+    next_barrier = prune_stage.s(
+        calctype,
+        programs[1:],
+        program_args[1:],
+        energy_window,
+        max_structures,
+        priority=priority,
+        **kwargs,
+    )
+    return self.replace(_prioritized(stage | next_barrier, priority))
+
+
+@bigchem.task(bind=True)
+def continue_hessian_opt(
+    self,
+    output: ProgramOutput[DualProgramInput, OptimizationData],
+    calctype: CalcType,
+    program_args: ProgramArgsSub,
+    hessian_every: int,
+    max_steps: int,
+    dh: float,
+    stencil: str = "central",
+    logs: str = "keep",
+    batch_size: Optional[Union[int, str]] = None,
+    priority: Optional[int] = None,
+    previous: Optional[ProgramOutput[DualProgramInput, OptimizationData]] = None,
+    n_hessians: int = 1,
+) -> ProgramOutput[DualProgramInput, OptimizationData]:
+    """Merge an optimization segment of algos.parallel_hessian_opt with the previous
+    segments and start the next segment from a new hessian if it has not converged
+
+    Params:
+        output: Optimization of the segment that just completed
+        calctype, program_args, hessian_every, dh, stencil, logs, batch_size,
+            priority: See algos.parallel_hessian_opt
+        max_steps: Optimization steps left for this and all following segments
+        previous: Output of the previous segments
+        n_hessians: Number of hessians computed so far
+
+    Returns:
+        The final segment with the trajectory of all segments. The number of computed
+            hessians is in .data.extras["n_hessians"].
+    """
+    # Import here since algos imports the tasks
+    from .algos import _hessian_opt_segment
+
+    trajectory = output.data.trajectory
+    if previous is not None:
+        # The last step of the previous segment is the first step of this one
+        trajectory = previous.data.trajectory[:-1] + trajectory
+    extras = {**output.data.extras, "n_hessians": n_hessians}
+    data = output.data.model_copy(update={"trajectory": trajectory, "extras": extras})
+    merged = output.model_copy(update={"data": data})
+
+    steps_left = max_steps - len(output.data.trajectory)
+    converged = _optimization_converged(output, hessian_every)
+    if converged or max_steps <= hessian_every or steps_left <= 0:
+        return merged
+    return self.replace(
+        _hessian_opt_segment(
+            output.data.final_structure,
+            calctype,
+            program_args,
+            hessian_every,
+            steps_left,
+            dh,
+            stencil,
+            logs,
+            batch_size,
+            priority,
+            merged,
+            n_hessians + 1,
+        )
+    )
 
+
+@bigchem.task
+def md_trajectory(
+    program: str,
+    inp_obj: ProgramInput,
+    key: str,
+    n_steps: int,
+    time_step: float = 0.5,
+    velocity: Optional[np.ndarray] = None,
+    temperature: float = 0.0,
+    seed: Optional[int] = None,
+    frame_every: int = 1,
+    reuse_wfn: bool = False,
+    logs: str = "drop",
+    **kwargs,
+) -> ProgramOutput[ProgramInput, SinglePointResults]:
+    """Run a Born-Oppenheimer molecular dynamics trajectory in a single task
+
+    Integrates the NVE equations of motion with velocity Verlet, computing the
+    gradient of every step with compute inside this task so no step requires a
+    broker round trip. Frames are streamed to the accumulator (see
+    accumulator.read_trajectory) as the trajectory runs.
+
+    Params:
+        program: Program to use for the gradients
+        inp_obj: Gradient calculation on the initial structure
+        key: Key the frames are stored under
+        n_steps: Number of time steps
+        time_step: Time step in femtoseconds
+        velocity: Initial (N, 3) velocities in atomic units. If None, velocities are
+            drawn from the Maxwell-Boltzmann distribution at temperature.
+        temperature: Temperature (K) of the initial velocities if velocity is None
+        seed: Seed for the initial velocities
+        frame_every: Store every this many steps. The first and last steps are
+            always stored.
+        reuse_wfn: If True, start the SCF of every step from the wavefunction of the
+            previous step. Requires a program whose qccompute adapter supports
+            wavefunction propagation (e.g., TeraChem).
+        logs: See compute. Logs of all steps but the last are discarded either way.
+        kwargs: Keyword arguments passed to compute
+
+    Returns:
+        The gradient calculation of the last step. .data.extras holds the trajectory
+            "md_key" and the "md_steps".
+    """
+    masses = _atomic_masses(inp_obj.structure.symbols)
+    if velocity is None:
+        rng = np.random.default_rng(seed)
+        velocity = _maxwell_boltzmann_velocities(masses, temperature, rng)
+    velocity = np.array(velocity, dtype=float)
+    geometry = np.array(inp_obj.structure.geometry, dtype=float)
+    dt = time_step * FS_TO_AU
+    accumulator = get_accumulator()
+
+    step_input = inp_obj
+    output = compute(program, step_input, logs=logs, collect_wfn=reuse_wfn, **kwargs)
+    acceleration = -output.data.gradient / masses[:, None]
+    for step in range(n_steps + 1):
+        if step % frame_every == 0 or step == n_steps:
+            kinetic = 0.5 * np.sum(masses[:, None] * velocity**2)
+            frame = _pack_frame(
+                step * time_step, output.data.energy, kinetic, geometry, velocity
+            )
+            accumulator.add(key, step, frame)
+        if step == n_steps:
+            break
+
+        geometry = geometry + velocity * dt + 0.5 * acceleration * dt**2
+        step_input = inp_obj.model_copy(
+            update={
+                "structure": inp_obj.structure.model_copy(update={"geometry": geometry})
+            }
+        )
+        guessed = (
+            _wfn_guess_input(program, output, step_input) if reuse_wfn else step_input
+        )
+        output = compute(program, guessed, logs=logs, collect_wfn=reuse_wfn, **kwargs)
+        new_acceleration = -output.data.gradient / masses[:, None]
+        velocity = velocity + 0.5 * (acceleration + new_acceleration) * dt
+        acceleration = new_acceleration
+
+    extras = {**output.data.extras, "md_key": key, "md_steps": n_steps}
+    data = output.data.model_copy(update={"files": {}, "extras": extras})
+    # Return the input without the wavefunction guess files
+    return output.model_copy(update={"input_data": step_input, "data": data})
+
+
+@bigchem.task
+def assemble_mbe(
+    outputs: list[ProgramOutput[ProgramInput, SinglePointResults]],
+    prog_input: ProgramInput,
+    fragments: list[list[int]],
+    subsystems: list[list[int]],
+    matches: list[int],
+    transforms: np.ndarray,
+    order: int,
+) -> ProgramOutput[ProgramInput, SinglePointResults]:
+    """Sum the many-body expansion energy (and gradient) from subsystem calculations
+
+    Params:
+        outputs: Calculations of the unique subsystems. Lists of outputs from batched
+            tasks (see compute_batch) are flattened.
+        prog_input: Calculation of the full system
+        fragments: Atom indices of every fragment
+        subsystems: Fragment indices of every subsystem
+        matches: Index in outputs of the calculation of every subsystem
+        transforms: Orthogonal transformations from the geometry of the calculation to
+            the geometry of every subsystem. See utils._unique_geometries.
+        order: Truncation order of the expansion
+
+    Returns:
+        Output for prog_input with the order-truncated energy (and gradient).
+            .data.extras["mbe_energies"] holds the energy truncated at every order
+            from 1 to order.
+    """
+    outputs = _flatten_outputs(outputs)
+    unique_energies = np.array([output.data.energy for output in outputs])
+    energies = unique_energies[matches]
+    sizes = np.array([len(subsystem) for subsystem in subsystems])
+    mbe_energies = [
+        float(_mbe_coefficients(sizes, len(fragments), n) @ energies)
+        for n in range(1, order + 1)
+    ]
+    data: dict = {"energy": mbe_energies[-1]}
+
+    if prog_input.calctype == CalcType.gradient:
+        atoms = [
+            [i for fragment in subsystem for i in fragments[fragment]]
+            for subsystem in subsystems
+        ]
+        counts = [len(subsystem_atoms) for subsystem_atoms in atoms]
+        # Rotate all subsystem gradient rows at once and scatter them into the system
+        rows = np.concatenate([outputs[match].data.gradient for match in matches])
+        rows = np.einsum("ai,aij->aj", rows, np.repeat(transforms, counts, axis=0))
+        weights = np.repeat(_mbe_coefficients(sizes, len(fragments), order), counts)
+        gradient = np.zeros((len(prog_input.structure.symbols), 3))
+        np.add.at(gradient, np.concatenate(atoms), weights[:, None] * rows)
+        data["gradient"] = gradient
+
+    data["extras"] = {
+        "mbe_energies": mbe_energies,
+        "mbe_calculations": len(outputs),
+        "mbe_subsystems": len(subsystems),
+    }
+    output: dict[str, Any] = {
+        "input_data": prog_input,
+        "success": True,
+        "data": data,
+        "provenance": outputs[0].provenance,
+    }
     return ProgramOutput[ProgramInput, SinglePointResults](**output)
 
 
+@bigchem.task
+def assemble_scan(
+    outputs: list[ProgramOutput], values: list[np.ndarray]
+) -> dict[str, Any]:
+    """Arrange the calculations of a rigid scan on its grid
+
+    Params:
+        outputs: Calculations of all grid points in C order
+        values: Values of every scanned coordinate
+
+    Returns:
+        The scan grid. See algos.parallel_scan.
+    """
+    return _scan_result(values, dict(enumerate(outputs)))
+
+
+@bigchem.task(bind=True)
+def scan_wavefront(
+    self,
+    outputs: list[ProgramOutput[DualProgramInput, OptimizationData]],
+    program: str,
+    prog_input: DualProgramInput,
+    scans: list[dict[str, Any]],
+    seed: list[int],
+    front: int = 0,
+    previous: Optional[dict[int, ProgramOutput]] = None,
+    priority: Optional[int] = None,
+    **kwargs,
+) -> dict[str, Any]:
+    """Collect a wavefront of a relaxed scan and dispatch the next one
+
+    The grid points of wavefront k are k steps away from the seed point. Each is
+    optimized starting from the lowest energy final structure of its neighbors on
+    wavefront k - 1 (or from prog_input.structure if they all failed), so all points
+    of a wavefront run in parallel. This task is replaced by a group optimizing the
+    next wavefront chained to scan_wavefront until the grid is complete.
+
+    Params:
+        outputs: Constrained optimizations of wavefront front in _wavefront order
+        program: Program to use for the optimizations
+        prog_input: Optimization defining the model, keywords and initial structure
+        scans: See algos.parallel_scan
+        seed: Grid index of the first optimized point
+        front: Number of the wavefront of outputs
+        previous: Optimizations of all earlier wavefronts by flat grid index
+        priority: Priority of the optimizations. See algos.parallel_scan.
+        kwargs: Keyword arguments passed to compute
+
+    Returns:
+        The scan grid. See algos.parallel_scan.
+    """
+    values = _scan_values(scans)
+    shape = tuple(len(axis_values) for axis_values in values)
+    completed = dict(previous or {})
+    for index, output in zip(_wavefront(shape, seed, front), outputs):
+        completed[int(np.ravel_multi_index(index, shape))] = output
+
+    points = _wavefront(shape, seed, front + 1)
+    if not points:
+        return _scan_result(values, completed)
+
+    inputs = []
+    for index in points:
+        neighbors = [
+            completed[int(np.ravel_multi_index(neighbor, shape))]
+            for neighbor in _scan_neighbors(index, seed)
+        ]
+        converged = [output for output in neighbors if output.success]
+        structure = prog_input.structure
+        if converged:
+            best = min(converged, key=lambda output: output.data.final_energy)
+            structure = best.data.final_structure
+        point = [axis_values[i] for axis_values, i in zip(values, index)]
+        inputs.append(_constrained_input(prog_input, structure, scans, point))
+    next_front = scan_wavefront.s(
+        program, prog_input, scans, seed, front + 1, completed, priority, **kwargs
+    )
+    wavefront = group(compute.s(program, inp, **kwargs) for inp in inputs)
+    return self.replace(_prioritized(wavefront | next_front, priority))
+
+
 @bigchem.task
 def frequency_analysis(
-    sp_output: ProgramOutput[ProgramInput, SinglePointResults], **kwargs
+    sp_output: ProgramOutput[ProgramInput, SinglePointResults],
+    active_atoms: Optional[list[int]] = None,
+    **kwargs,
 ) -> ProgramOutput[ProgramInput, SinglePointResults]:
     """Adds geomeTRIC's frequency analysis results to hessian ProgramOutput
 
     Params:
         sp_output: ProgramOutput with .data.hessian value
+        active_atoms: If set, perform a partial hessian vibrational analysis (PHVA)
+            using only the hessian block of these atoms; all other atoms are treated
+            as frozen. Translations and rotations are not projected out and the
+            Gibbs free energy contains only vibrational contributions.
         kwargs: Keywords passed to geomeTRIC's frequency_analysis function
             temperature: float - Temperature passed to the harmonic free energy module;
                 default: 300.0
@@ -147,17 +1104,28 @@ def frequency_analysis(
             gibbs_free_energy: Gibbs free energy in Hartree
 
     """
-    # Import here so client applications don't need to install geomeTRIC
-    from geometric.normal_modes import frequency_analysis as geometric_freqs_analysis
+    if active_atoms is not None:
+        freqs, n_modes, g_tot = _partial_frequency_analysis(
+            sp_output.data.hessian,  # type: ignore
+            sp_output.input_data.structure.symbols,
+            active_atoms,
+            energy=sp_output.data.energy,  # type: ignore
+            **kwargs,
+        )
+    else:
+        # Import here so client applications don't need to install geomeTRIC
+        from geometric.normal_modes import (
+            frequency_analysis as geometric_freqs_analysis,
+        )
 
-    freqs, n_modes, g_tot = geometric_freqs_analysis(
-        sp_output.input_data.structure.geometry.flatten(),  # numpy array
-        sp_output.data.hessian,  # type: ignore
-        elem=sp_output.input_data.structure.symbols,  # regular python list
-        # Electronic energy passed to free energy module
-        energy=sp_output.data.energy,  # type: ignore
-        **kwargs,
-    )
+        freqs, n_modes, g_tot = geometric_freqs_analysis(
+            sp_output.input_data.structure.geometry.flatten(),  # numpy array
+            sp_output.data.hessian,  # type: ignore
+            elem=sp_output.input_data.structure.symbols,  # regular python list
+            # Electronic energy passed to free energy module
+            energy=sp_output.data.energy,  # type: ignore
+            **kwargs,
+        )
     output = sp_output.model_dump()
     output["data"].update(
         {
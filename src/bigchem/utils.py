@@ -1,13 +1,55 @@
 """Helper functions not for end users"""
 
+import io
+import itertools
+from math import ceil, comb, sqrt
+from typing import Any, Optional, Sequence, TypeVar, Union
+
 import numpy as np
-from qcdata import CalcType, ProgramInput
+from qcdata import (
+    CalcType,
+    DualProgramInput,
+    ProgramArgs,
+    ProgramArgsSub,
+    ProgramInput,
+    ProgramOutput,
+    SinglePointResults,
+    Structure,
+)
 
 from .config import settings
 
+LOGS_OPTIONS = ("keep", "drop", "offload")
+STENCILS = ("central", "forward", "five-point")
+# Name of the initial hessian file passed to geomeTRIC optimizations
+INITIAL_HESSIAN_FILE = "initial_hessian.txt"
+# Unit conversions for molecular dynamics
+AMU_TO_AU = 1822.888486209  # Electron masses per atomic mass unit
+FS_TO_AU = 41.341373335  # Atomic time units per femtosecond
+BOLTZMANN_AU = 3.166811563e-6  # Boltzmann constant in Hartree per Kelvin
+BOHR_TO_ANGSTROM = 0.529177210903
+# geomeTRIC's default convergence criteria: energy change (Hartree), rms and max
+# gradient (Hartree/Bohr), and rms and max displacement (Angstrom) of the last step
+GEOMETRIC_CONVERGENCE = {
+    "energy": 1.0e-6,
+    "grms": 3.0e-4,
+    "gmax": 4.5e-4,
+    "drms": 1.2e-3,
+    "dmax": 1.8e-3,
+}
+# Coordinates of parallel_scan by the number of atoms defining them
+SCAN_COORDINATES = {"distance": 2, "angle": 3, "dihedral": 4}
+
+T = TypeVar("T")
+
 
 def _gradient_inputs(
-    prog_input: ProgramInput, dh: float = settings.bigchem_default_hessian_dh
+    prog_input: ProgramInput,
+    dh: float = settings.bigchem_default_hessian_dh,
+    atoms: Optional[Sequence[int]] = None,
+    stencil: str = "central",
+    directions: Optional[np.ndarray] = None,
+    calctype: CalcType = CalcType.gradient,
 ) -> list[ProgramInput]:
     """Create ProgramInput gradient calculations for a numerical hessian
 
@@ -15,32 +57,1234 @@ def _gradient_inputs(
         prog_input: ProgramInput with keywords specific to the gradient computations
             that will comprise the hessian
         dh: Displacement for finite difference
+        atoms: Indices of the atoms to displace. If None, all atoms are displaced.
+        stencil: "central" for forward and backward displacements, "forward" for
+            forward displacements only, or "five-point" for forward and backward
+            displacements by dh and 2 * dh.
+        directions: (n_directions, n_atoms, 3) array of unit displacement vectors.
+            If given, the geometry is displaced along these vectors instead of along
+            each Cartesian coordinate and atoms is ignored.
+        calctype: Calculation type of the displaced inputs, e.g., CalcType.energy for
+            a numerical gradient
 
     Returns:
         Flat list of ProgramInput gradient calculations with dh offset for each geometry
             value. The first ProgramInput represents a "forward" step by dh and the next
-            ProgramInput represents a "backward" step by dh and so on.
+            ProgramInput represents a "backward" step by dh and so on. If stencil is
+            "forward" only the "forward" steps are returned. If stencil is "five-point"
+            each "forward" and "backward" pair by dh is followed by a pair by 2 * dh.
+            All displaced geometries are views into one stacked array and the inputs
+            share every other field with each other, so they should not be modified
+            in place.
+    """
+    if stencil not in STENCILS:
+        raise ValueError(f"Unknown finite difference stencil '{stencil}'")
+
+    geometry = np.asarray(prog_input.structure.geometry, dtype=float)
+
+    if directions is not None:
+        steps = dh * np.asarray(directions, dtype=float)
+    else:
+        # Get all indices in the 2D array as a list of pairs
+        indices = np.indices(geometry.shape).reshape(2, -1).T
+        if atoms is not None:
+            indices = indices[np.isin(indices[:, 0], atoms)]
+        steps = np.zeros((len(indices), *geometry.shape))
+        steps[np.arange(len(indices)), indices[:, 0], indices[:, 1]] = dh
+
+    if stencil == "central":
+        # Interleave forward and backward steps
+        steps = np.stack([steps, -steps], axis=1).reshape(-1, *geometry.shape)
+    elif stencil == "five-point":
+        steps = np.stack([steps, -steps, 2 * steps, -2 * steps], axis=1)
+        steps = steps.reshape(-1, *geometry.shape)
+    return _displaced_inputs(prog_input, geometry + steps, calctype)
+
+
+def _energy_hessian_inputs(
+    prog_input: ProgramInput, dh: float = settings.bigchem_default_hessian_dh
+) -> list[ProgramInput]:
+    """Create ProgramInput energy calculations for a numerical hessian from energies
+
+    Mixed second derivatives are symmetric, so only one pair of displacements is
+    needed for each of the n(n-1)/2 coordinate pairs i < j (n = 3N):
+
+        H_ii = (E(+i) - 2E0 + E(-i)) / dh^2
+        H_ij = (E(+i+j) + E(-i-j) - E(+i) - E(-i) - E(+j) - E(-j) + 2E0) / (2dh^2)
+
+    Params:
+        prog_input: ProgramInput with keywords specific to the energy computations
+        dh: Displacement for finite difference
+
+    Returns:
+        Flat list of n^2 + n ProgramInput energy calculations. The first 2n displace
+            each coordinate i by +dh and -dh (alternating). The remaining n(n-1)
+            displace each pair i < j (in np.triu_indices(n, 1) order) by +dh on both
+            coordinates and then by -dh on both.
+    """
+    geometry = np.asarray(prog_input.structure.geometry, dtype=float)
+    n = geometry.size
+    unit_steps = np.eye(n) * dh
+    rows, cols = np.triu_indices(n, 1)
+    pair_steps = unit_steps[rows] + unit_steps[cols]
+    steps = np.concatenate(
+        [
+            np.stack([unit_steps, -unit_steps], axis=1).reshape(-1, n),
+            np.stack([pair_steps, -pair_steps], axis=1).reshape(-1, n),
+        ]
+    )
+    geometries = (geometry.ravel() + steps).reshape(-1, *geometry.shape)
+    return _displaced_inputs(prog_input, geometries, CalcType.energy)
+
+
+def _displaced_inputs(
+    prog_input: ProgramInput, geometries: np.ndarray, calctype: CalcType
+) -> list[ProgramInput]:
+    """Create inputs for each of a stacked (n_calcs, n_atoms, 3) array of geometries
+
+    The inputs are shallow copies of prog_input sharing every field except the
+    structure, so they should not be modified in place.
+    """
+    base_input = prog_input.model_copy(update={"calctype": calctype})
+    structure = prog_input.structure
+    return [
+        base_input.model_copy(
+            update={"structure": structure.model_copy(update={"geometry": displaced})}
+        )
+        for displaced in geometries
+    ]
+
+
+def _active_atoms(active_atoms: Sequence[int], n_atoms: int) -> list[int]:
+    """Sorted unique indices of the active atoms of a partial hessian
+
+    Raises:
+        ValueError: If no atoms are selected or an index is out of range
+    """
+    atoms = sorted(set(int(atom) for atom in active_atoms))
+    if not atoms:
+        raise ValueError("active_atoms must select at least one atom.")
+    if atoms[0] < 0 or atoms[-1] >= n_atoms:
+        raise ValueError(
+            f"active_atoms must be indices from 0 to {n_atoms - 1}, got {atoms}."
+        )
+    return atoms
+
+
+def _vibrational_basis(geometry: np.ndarray) -> np.ndarray:
+    """Orthonormal Cartesian displacements free of rigid-body motion
+
+    Params:
+        geometry: (n_atoms, 3) array of Cartesian coordinates
+
+    Returns:
+        (3N - 6, n_atoms, 3) array of orthonormal displacement vectors spanning the
+            complement of the translations and rotations of the structure (3N - 5
+            vectors for linear structures).
+    """
+    coords = np.asarray(geometry, dtype=float)
+    coords = coords - coords.mean(axis=0)
+    n_atoms = len(coords)
+
+    rigid = np.zeros((6, n_atoms, 3))
+    for axis in range(3):
+        rigid[axis, :, axis] = 1.0
+        rigid[axis + 3] = np.cross(np.eye(3)[axis], coords)
+
+    # Left singular vectors with zero singular value span the vibrational subspace
+    u, sigma, _ = np.linalg.svd(rigid.reshape(6, -1).T, full_matrices=True)
+    rank = int(np.sum(sigma > 1e-8 * sigma[0]))
+    return u[:, rank:].T.reshape(-1, n_atoms, 3)
+
+
+def _project_hessian(derivatives: np.ndarray, directions: np.ndarray) -> np.ndarray:
+    """Back-transform gradient derivatives along directions to a Cartesian hessian
+
+    Params:
+        derivatives: (n_directions, 3N) array whose rows are the derivative of the
+            gradient along each direction, i.e., H @ direction
+        directions: (n_directions, 3N) array of orthonormal displacement vectors
+
+    Returns:
+        (3N, 3N) symmetric Cartesian hessian projected onto the span of directions
+    """
+    reduced = directions @ derivatives.T
+    reduced = (reduced + reduced.T) / 2
+    return directions.T @ reduced @ directions
+
+
+def _symmetry_operations(
+    structure: Structure, tol: float = settings.bigchem_symmetry_tolerance
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Find the point group operations that map a structure onto itself
+
+    Params:
+        structure: The Structure to analyze
+        tol: Maximum distance (Bohr) an atom may move under an operation and still
+            be considered mapped onto an equivalent atom
+
+    Returns:
+        List of (R, perm) pairs where R is a 3x3 orthogonal matrix and perm is an
+            array such that R @ (x_i - center) + center == x_perm[i] for every atom i.
+            The identity is always the first operation.
+
+    Note:
+        Candidate operations are generated by mapping two reference atoms onto every
+        atom of the same element at the same distance from the center of charge.
+        Because a point group operation is fully determined by its action on two
+        non-collinear vectors (plus its determinant), this enumerates every operation
+        of the group without needing to classify the point group first.
+    """
+    numbers = np.array(structure.atomic_numbers)
+    geometry = np.array(structure.geometry, dtype=float)
+    # The center of charge is fixed by every operation since equivalent atoms share Z
+    coords = geometry - numbers @ geometry / numbers.sum()
+    n_atoms = len(numbers)
+
+    identity = (np.eye(3), np.arange(n_atoms))
+    radii = np.linalg.norm(coords, axis=1)
+    off_center = np.flatnonzero(radii > tol)
+    if len(off_center) == 0:
+        return [identity]
+
+    def _equivalent(i: int) -> np.ndarray:
+        """Atoms that could be images of atom i"""
+        return np.flatnonzero(
+            (numbers == numbers[i]) & (np.abs(radii - radii[i]) < tol)
+        )
+
+    # Reference atom a from the smallest equivalence class keeps candidates few
+    a = min(off_center.tolist(), key=lambda i: len(_equivalent(i)))
+    crosses = np.linalg.norm(np.cross(coords[a], coords), axis=1)
+    non_collinear = np.flatnonzero(crosses > tol * radii[a])
+    if len(non_collinear) > 0:
+        b = min(
+            non_collinear.tolist(), key=lambda i: (len(_equivalent(i)), -crosses[i])
+        )
+        b_vec = coords[b]
+        b_images = coords[_equivalent(b)]
+    else:
+        # Linear structure; pin an arbitrary perpendicular vector to get the finite
+        # subgroup of operations that leave it in place
+        b_vec = np.cross(coords[a], np.eye(3)[np.argmin(np.abs(coords[a]))])
+        b_vec *= radii[a] / np.linalg.norm(b_vec)
+        b_images = b_vec[None, :]
+
+    frame = np.column_stack([coords[a], b_vec, np.cross(coords[a], b_vec)])
+    frame_inv = np.linalg.inv(frame)
+    dot_tol = tol * (radii[a] + np.linalg.norm(b_vec))
+
+    operations = [identity]
+    for a_img in coords[_equivalent(a)]:
+        for b_img in b_images:
+            if abs(a_img @ b_img - coords[a] @ b_vec) > dot_tol:
+                continue
+            for sign in (1.0, -1.0):
+                image = np.column_stack([a_img, b_img, sign * np.cross(a_img, b_img)])
+                # Snap to the nearest orthogonal matrix to remove numerical noise
+                u, _, vt = np.linalg.svd(image @ frame_inv)
+                rot = u @ vt
+                if any(np.allclose(rot, op[0], atol=tol) for op in operations):
+                    continue
+                perm = _atom_permutation(coords, numbers, rot, tol)
+                if perm is not None:
+                    operations.append((rot, perm))
+    return operations
+
+
+def _atom_permutation(
+    coords: np.ndarray, numbers: np.ndarray, rot: np.ndarray, tol: float
+) -> Optional[np.ndarray]:
+    """Atom mapping induced by rot, or None if rot is not a symmetry operation"""
+    rotated = coords @ rot.T
+    distances = np.linalg.norm(rotated[:, None, :] - coords[None, :, :], axis=-1)
+    distances[numbers[:, None] != numbers[None, :]] = np.inf
+    perm = np.argmin(distances, axis=1)
+    if np.any(distances[np.arange(len(perm)), perm] > tol):
+        return None
+    if len(np.unique(perm)) != len(perm):
+        return None
+    return perm
+
+
+def _symmetry_unique_atoms(
+    operations: list[tuple[np.ndarray, np.ndarray]],
+) -> list[int]:
+    """Return one representative atom from each orbit of the symmetry operations"""
+    n_atoms = len(operations[0][1])
+    seen = np.zeros(n_atoms, dtype=bool)
+    unique = []
+    for atom in range(n_atoms):
+        if not seen[atom]:
+            unique.append(atom)
+            seen[[perm[atom] for _, perm in operations]] = True
+    return unique
+
+
+def _symmetrize_hessian_rows(
+    hessian: np.ndarray,
+    unique_atoms: list[int],
+    operations: list[tuple[np.ndarray, np.ndarray]],
+) -> np.ndarray:
+    """Fill in hessian rows of symmetry-equivalent atoms from the unique atoms' rows
+
+    Params:
+        hessian: (3N, 3N) array whose rows for unique_atoms are populated
+        unique_atoms: Atoms whose rows were computed by finite difference
+        operations: Symmetry operations as returned by _symmetry_operations
+
+    Returns:
+        Full (3N, 3N) hessian. Each atom's rows are averaged over every operation that
+            maps its representative onto it, which also enforces the site symmetry of
+            the representative atoms themselves.
+    """
+    n_atoms = len(operations[0][1])
+    rows = hessian.reshape(n_atoms, 3, n_atoms, 3)
+    full = np.zeros_like(rows)
+    counts = np.zeros(n_atoms)
+
+    for rep in unique_atoms:
+        for rot, perm in operations:
+            # Derivatives transform as a vector in both the displaced coordinate (a/b)
+            # and the gradient component (c/d), with gradient atoms permuted
+            transformed = np.einsum("ab,bic,dc->aid", rot, rows[rep], rot)
+            full[perm[rep], :, perm] += transformed.transpose(1, 0, 2)
+            counts[perm[rep]] += 1
+
+    full /= counts[:, None, None, None]
+    return full.reshape(3 * n_atoms, 3 * n_atoms)
+
+
+def _partial_frequency_analysis(
+    hessian: np.ndarray,
+    symbols: list[str],
+    active_atoms: Sequence[int],
+    energy: float = 0.0,
+    temperature: float = 300.0,
+    pressure: float = 1.0,
+) -> tuple[np.ndarray, np.ndarray, float]:
+    """Partial hessian vibrational analysis (PHVA) of the active atoms' block
+
+    Params:
+        hessian: (3N, 3N) hessian in Hartree/Bohr^2. Only the active-active block is
+            used.
+        symbols: Atomic symbols of all N atoms
+        active_atoms: Indices of the atoms free to vibrate. All others are frozen.
+        energy: Electronic energy in Hartree
+        temperature: Temperature in Kelvin for the vibrational free energy
+        pressure: Unused. Accepted for compatibility with geomeTRIC's keywords since
+            the frozen environment has no translational contribution.
+
+    Returns:
+        Tuple of frequencies in wavenumbers (3k,) with imaginary frequencies as
+            negative values, normalized Cartesian normal modes (3k, N, 3) that are zero
+            on frozen atoms, and the electronic energy plus the harmonic vibrational
+            free energy of the real frequencies in Hartree.
+    """
+    # Import here so client applications don't need to install geomeTRIC
+    from geometric.molecule import PeriodicTable
+    from geometric.nifty import au2kj, bohr2ang, c_lightspeed, cm2au, kb
+
+    atoms = sorted(active_atoms)
+    rows = [atom * 3 + axis for atom in atoms for axis in range(3)]
+    invsqrtm3 = 1.0 / np.sqrt(np.repeat([PeriodicTable[symbols[i]] for i in atoms], 3))
+    block = np.asarray(hessian)[np.ix_(rows, rows)]
+    block = (block + block.T) / 2
+    eigvals, eigvecs = np.linalg.eigh(block * np.outer(invsqrtm3, invsqrtm3))
+
+    # Same conversion of mass-weighted eigenvalues to wavenumbers as geomeTRIC
+    mw_hess_wavenumber = (
+        1e10 * np.sqrt(au2kj / (bohr2ang / 10) ** 2) / (2 * np.pi * c_lightspeed)
+    )
+    freqs = mw_hess_wavenumber * np.sqrt(np.abs(eigvals)) * np.sign(eigvals)
+
+    modes = eigvecs.T * invsqrtm3[np.newaxis, :]
+    modes /= np.linalg.norm(modes, axis=1)[:, np.newaxis]
+    normal_modes = np.zeros((len(freqs), len(symbols) * 3))
+    normal_modes[:, rows] = modes
+
+    # Harmonic oscillator free energy of the real vibrational modes
+    kt = kb * temperature / au2kj
+    quanta = freqs[freqs > 0] * cm2au
+    g_vib = np.sum(quanta / 2 + kt * np.log1p(-np.exp(-quanta / kt)))
+
+    return freqs, normal_modes.reshape(len(freqs), -1, 3), energy + g_vib
+
+
+def _check_logs(logs: str) -> None:
+    """Raise a ValueError if logs is not one of LOGS_OPTIONS"""
+    if logs not in LOGS_OPTIONS:
+        raise ValueError(f"Unknown logs option '{logs}'. Use one of {LOGS_OPTIONS}.")
+
+
+def _handle_logs(output: ProgramOutput, logs: str, name: str) -> ProgramOutput:
+    """Keep, drop, or offload the logs of an output
+
+    Params:
+        output: The output of a calculation
+        logs: "keep" to return the output unchanged, "drop" to remove the logs, or
+            "offload" to write them to bigchem_logs_dir and replace them with the path
+            of the file
+        name: Name of the offloaded file (without suffix)
+
+    Returns:
+        The output with logs handled as requested
+    """
+    _check_logs(logs)
+    if logs == "keep" or not output.logs:
+        return output
+    if logs == "drop":
+        return output.model_copy(update={"logs": None})
+    settings.bigchem_logs_dir.mkdir(parents=True, exist_ok=True)
+    path = settings.bigchem_logs_dir / f"{name}.log"
+    path.write_text(output.logs)
+    return output.model_copy(update={"logs": f"Logs offloaded to {path}"})
+
+
+def _batch_size(batch_size: Union[int, str], n_atoms: int, n_calcs: int) -> int:
+    """Number of calculations to run sequentially in each batched task
+
+    Params:
+        batch_size: Number of calculations per task or "auto". "auto" assumes the cost
+            of a calculation grows with the cube of the number of atoms and groups
+            enough calculations that a task on a small molecule costs about as much as
+            one calculation on bigchem_batch_atoms atoms. At least sqrt(n_calcs)
+            tasks are kept so the calculations are still spread over workers.
+        n_atoms: Number of atoms in the structure
+        n_calcs: Total number of calculations
+
+    Returns:
+        Number of calculations per task
+    """
+    if batch_size == "auto":
+        by_cost = (settings.bigchem_batch_atoms / n_atoms) ** 3
+        return max(1, min(int(by_cost), ceil(sqrt(n_calcs))))
+    if isinstance(batch_size, int) and batch_size > 0:
+        return batch_size
+    raise ValueError(f"batch_size must be a positive int or 'auto', got {batch_size}")
+
+
+def _batches(items: Sequence[T], size: int) -> list[list[T]]:
+    """Split items into consecutive lists of at most size items"""
+    return [list(items[i : i + size]) for i in range(0, len(items), size)]
+
+
+def _longest_first(
+    runtimes: Sequence[float], batch_size: Optional[int] = None
+) -> list[list[int]]:
+    """Positions of calculations grouped into tasks, longest task first
+
+    Calculations are sorted by estimated runtime, keeping the order of equal
+    runtimes, and split into consecutive batches of batch_size so a batch holds
+    calculations of similar cost. Batches are sorted by their total runtime.
+
+    Params:
+        runtimes: Estimated runtime of every calculation
+        batch_size: Calculations per task. None for one calculation per task.
+
+    Returns:
+        Positions in runtimes of the calculations of every task
+    """
+    order = sorted(range(len(runtimes)), key=lambda i: -runtimes[i])
+    batches = _batches(order, batch_size or 1)
+    return sorted(batches, key=lambda batch: -sum(runtimes[i] for i in batch))
+
+
+def _flatten_outputs(outputs: Sequence[Any]) -> list[Any]:
+    """Flatten lists of outputs returned by batched tasks (see compute_batch)"""
+    flat = []
+    for output in outputs:
+        if isinstance(output, list):
+            flat.extend(output)
+        else:
+            flat.append(output)
+    return flat
+
+
+def _supports_wfn_reuse(program: str) -> bool:
+    """Check if the qccompute adapter for program can start from a previous
+    wavefunction"""
+    from qccompute.adapters import registry
+
+    return hasattr(registry.get(program), "propagate_wfn")
+
+
+def _wfn_guess_input(program: str, reference: ProgramOutput, inp_obj: T) -> T:
+    """Copy of inp_obj using the wavefunction of reference as the initial guess
+
+    Params:
+        program: Program whose qccompute adapter attaches the wavefunction files and
+            guess keywords (see _supports_wfn_reuse)
+        reference: Output of a calculation run with collect_wfn=True
+        inp_obj: The input to start from the reference wavefunction
+
+    Returns:
+        A new input with the wavefunction files and guess keywords added
+    """
+    from qccompute.adapters import registry
+
+    guessed = inp_obj.model_copy(deep=True)  # type: ignore
+    registry[program]().propagate_wfn(reference, guessed)  # type: ignore
+    return guessed
+
+
+def _without_files(output: ProgramOutput) -> ProgramOutput:
+    """Copy of output without its (wavefunction) files"""
+    no_files = output.data.model_copy(update={"files": {}})  # type: ignore
+    return output.model_copy(update={"data": no_files})
+
+
+def _finite_difference_hessian(
+    grads: np.ndarray,
+    geoms: np.ndarray,
+    reference: ProgramOutput,
+    dh: float,
+    symmetry_tol: Optional[float] = None,
+    stencil: str = "central",
+    projected: bool = False,
+    active_atoms: Optional[list[int]] = None,
+    symmetrize: bool = False,
+) -> tuple[np.ndarray, dict[str, float]]:
+    """Hessian from stacked gradients of displaced geometries
+
+    Params:
+        grads: (n_calcs, n_atoms, 3) gradients in the order of _gradient_inputs
+        geoms: (n_calcs, n_atoms, 3) geometries the gradients were computed at
+        reference: Calculation of the original geometry. Its gradient is the reference
+            for the "forward" stencil.
+        dh, symmetry_tol, stencil, projected, active_atoms, symmetrize: See
+            assemble_hessian
+
+    Returns:
+        The (3N, 3N) hessian and extras with the largest asymmetry of its computed
+            block (and the Richardson error estimate for the "five-point" stencil)
+    """
+    structure = reference.input_data.structure
+    n_atoms = len(structure.symbols)
+    hessian = np.zeros((n_atoms * 3, n_atoms * 3), dtype=float)
+
+    if symmetry_tol is not None:
+        operations = _symmetry_operations(structure, symmetry_tol)
+        atoms = _symmetry_unique_atoms(operations)
+    elif active_atoms is not None:
+        atoms = sorted(active_atoms)
+    else:
+        atoms = list(range(n_atoms))
+    rows = [atom * 3 + axis for atom in atoms for axis in range(3)]
+
+    # Difference all gradients (and geometries) in one operation
+    grads = np.reshape(grads, (len(grads), -1))
+    geoms = np.reshape(geoms, (len(geoms), -1))
+    derivatives, error = _stencil_derivatives(
+        grads, np.ravel(reference.data.gradient), dh, stencil
+    )
+    extras = {} if error is None else {"hessian_richardson_error": error}
+
+    # Finite differences aren't exactly symmetric. The largest deviation (Hartree/Bohr^2)
+    # in the computed block grows with numerical noise in the gradients.
+    if projected:
+        directions, _ = _stencil_derivatives(
+            geoms, np.ravel(structure.geometry), dh, stencil
+        )
+        # Measured before _project_hessian symmetrizes the reduced hessian
+        computed = directions @ derivatives.T
+        hessian = _project_hessian(derivatives, directions)
+    else:
+        hessian[rows] = derivatives
+        computed = hessian[np.ix_(rows, rows)]
+    extras["hessian_asymmetry"] = float(np.abs(computed - computed.T).max())
+
+    if symmetry_tol is not None:
+        hessian = _symmetrize_hessian_rows(hessian, atoms, operations)
+    elif active_atoms is not None:
+        # Mirror the active rows into the active columns and symmetrize their block
+        hessian[:, rows] = hessian[rows].T
+        block = hessian[np.ix_(rows, rows)]
+        hessian[np.ix_(rows, rows)] = (block + block.T) / 2
+    if symmetrize:
+        hessian = (hessian + hessian.T) / 2
+
+    return hessian, extras
+
+
+def _stencil_derivatives(
+    values: np.ndarray, reference: Any, dh: float, stencil: str
+) -> tuple[np.ndarray, Optional[float]]:
+    """First derivatives along each displacement of a finite difference stencil
+
+    Params:
+        values: (n_calcs, ...) values (e.g., energies or gradients) in the order of
+            the displacements created by _gradient_inputs
+        reference: Value at the original geometry. Only used by the "forward" stencil.
+        dh: Displacement of the finite differences
+        stencil: "central", "forward", or "five-point". "five-point" is the Richardson
+            extrapolation of the O(dh^2) central differences with dh and 2 * dh, which
+            is O(dh^4).
+
+    Returns:
+        (n_displacements, ...) derivatives and, for "five-point", the largest change
+            made by the extrapolation as an estimate of the central difference error
+    """
+    if stencil == "central":
+        return (values[0::2] - values[1::2]) / (dh * 2), None
+    if stencil == "forward":
+        return (values - reference) / dh, None
+    if stencil == "five-point":
+        near = (values[0::4] - values[1::4]) / (dh * 2)
+        far = (values[2::4] - values[3::4]) / (dh * 4)
+        derivatives = (4 * near - far) / 3
+        return derivatives, float(np.abs(derivatives - near).max())
+    raise ValueError(f"Unknown finite difference stencil '{stencil}'")
+
+
+def _derived_output(
+    reference: ProgramOutput,
+    calctype: CalcType,
+    data: dict[str, Any],
+    extras: Optional[dict[str, Any]] = None,
+) -> ProgramOutput[ProgramInput, SinglePointResults]:
+    """Output of a finite difference calculation built from the calculation of the
+    original geometry
+
+    Params:
+        reference: Calculation of the original geometry
+        calctype: Calculation type of the returned output
+        data: Values added to (or replaced in) the reference .data
+        extras: Values added to .data.extras
+    """
+    output = reference.model_dump()
+    output["input_data"]["calctype"] = calctype
+    output["data"].update(data)
+    output["data"]["extras"].update(extras or {})
+    return ProgramOutput[ProgramInput, SinglePointResults](**output)
+
+
+def _interpolate_path(
+    structures: Sequence[Structure], n_images: int
+) -> list[Structure]:
+    """Linearly interpolate n_images structures between the first and last structure
+
+    The first and last returned structures are copies of the given endpoints.
+    """
+    if n_images < 3:
+        raise ValueError("A path needs at least 3 images including the endpoints.")
+    start = np.asarray(structures[0].geometry, dtype=float)
+    end = np.asarray(structures[-1].geometry, dtype=float)
+    fractions = np.linspace(0.0, 1.0, n_images)[:, None, None]
+    geometries = start + fractions * (end - start)
+    return [
+        structures[0].model_copy(update={"geometry": geometry})
+        for geometry in geometries
+    ]
+
+
+def _neb_forces(
+    geometries: np.ndarray,
+    energies: np.ndarray,
+    gradients: np.ndarray,
+    spring_constant: float,
+    climbing_image: Optional[int] = None,
+) -> np.ndarray:
+    """Nudged elastic band forces on the interior images of a path
+
+    Uses the energy-weighted tangent of Henkelman and Jónsson (J. Chem. Phys. 113,
+    9978 (2000)): the component of the true force perpendicular to the path plus the
+    spring force along the path.
+
+    Params:
+        geometries: (n_images, n_atoms, 3) array of the path including endpoints
+        energies: (n_images,) energies of the images
+        gradients: (n_images - 2, n_atoms, 3) energy gradients of the interior images
+        spring_constant: Spring constant between neighboring images (Hartree/Bohr^2)
+        climbing_image: Index of an image that feels no spring force and climbs
+            uphill along the path instead (climbing image NEB)
+
+    Returns:
+        (n_images - 2, n_atoms, 3) array of forces on the interior images
+    """
+    n_images = len(geometries)
+    flat = geometries.reshape(n_images, -1)
+    prev_diff, next_diff = flat[1:-1] - flat[:-2], flat[2:] - flat[1:-1]
+    e_prev, e_image, e_next = energies[:-2], energies[1:-1], energies[2:]
+
+    # Tangent toward the higher energy neighbor, mixed at energy extrema
+    upward = (e_next > e_image) & (e_image > e_prev)
+    downward = (e_next < e_image) & (e_image < e_prev)
+    d_next, d_prev = np.abs(e_next - e_image), np.abs(e_prev - e_image)
+    d_max, d_min = np.maximum(d_next, d_prev), np.minimum(d_next, d_prev)
+    next_weight = np.where(e_next > e_prev, d_max, d_min)
+    prev_weight = np.where(e_next > e_prev, d_min, d_max)
+    next_weight = np.where(upward, 1.0, np.where(downward, 0.0, next_weight))
+    prev_weight = np.where(upward, 0.0, np.where(downward, 1.0, prev_weight))
+    tangents = next_weight[:, None] * next_diff + prev_weight[:, None] * prev_diff
+    # Flat energy profiles weight both neighbors equally
+    flat_profile = (next_weight + prev_weight) == 0
+    tangents[flat_profile] = next_diff[flat_profile] + prev_diff[flat_profile]
+    tangents /= np.linalg.norm(tangents, axis=1, keepdims=True)
+
+    true_forces = -gradients.reshape(n_images - 2, -1)
+    parallel = np.sum(true_forces * tangents, axis=1, keepdims=True) * tangents
+    spring = spring_constant * (
+        np.linalg.norm(next_diff, axis=1) - np.linalg.norm(prev_diff, axis=1)
+    )
+    forces = true_forces - parallel + spring[:, None] * tangents
+    if climbing_image is not None:
+        i = climbing_image - 1
+        forces[i] = true_forces[i] - 2 * parallel[i]
+    return forces.reshape(n_images - 2, *geometries.shape[1:])
+
+
+def _fire_step(
+    positions: np.ndarray,
+    forces: np.ndarray,
+    state: Optional[dict[str, Any]],
+    time_step: float,
+    max_step: float,
+) -> tuple[np.ndarray, dict[str, Any]]:
+    """Take one step of the FIRE minimizer (Bitzek et al., Phys. Rev. Lett. 97,
+    170201 (2006)) with unit masses
+
+    Params:
+        positions: Array of coordinates to move
+        forces: Forces on positions, same shape
+        state: State returned by the previous step or None for the first step
+        time_step: Initial time step. The time step grows to at most 10 * time_step
+            while the forces keep pointing along the velocity.
+        max_step: Largest displacement (Bohr) of any atom in one step
+
+    Returns:
+        The new positions and the state to pass to the next step
+    """
+    if state is None:
+        state = {
+            "velocity": np.zeros_like(forces),
+            "time_step": time_step,
+            "alpha": 0.1,
+            "n_positive": 0,
+        }
+    velocity, dt = state["velocity"], state["time_step"]
+    alpha, n_positive = state["alpha"], state["n_positive"]
+
+    if np.vdot(forces, velocity) > 0:
+        force_norm = np.linalg.norm(forces)
+        velocity = (1 - alpha) * velocity + alpha * np.linalg.norm(velocity) * (
+            forces / force_norm if force_norm > 0 else forces
+        )
+        if n_positive > 5:
+            dt, alpha = min(dt * 1.1, 10 * time_step), alpha * 0.99
+        n_positive += 1
+    else:
+        # Moved uphill: stop and restart more carefully
+        velocity = np.zeros_like(forces)
+        dt, alpha, n_positive = dt * 0.5, 0.1, 0
+
+    velocity = velocity + dt * forces
+    step = dt * velocity
+    longest = np.max(np.linalg.norm(step.reshape(-1, 3), axis=1))
+    if longest > max_step:
+        step *= max_step / longest
+    new_state = {
+        "velocity": velocity,
+        "time_step": dt,
+        "alpha": alpha,
+        "n_positive": n_positive,
+    }
+    return positions + step, new_state
+
+
+def _program_input(
+    structure: Structure,
+    calctype: CalcType,
+    program_args: Union[ProgramArgs, ProgramArgsSub],
+) -> Union[ProgramInput, DualProgramInput]:
+    """ProgramInput (DualProgramInput for ProgramArgsSub) for structure"""
+    input_model = (
+        ProgramInput if isinstance(program_args, ProgramArgs) else DualProgramInput
+    )
+    return input_model(
+        structure=structure, calctype=calctype, **program_args.model_dump()
+    )
+
+
+def _hessian_file(hessian: np.ndarray) -> str:
+    """Hessian as a text file readable by geomeTRIC's hessian="file:<path>" option"""
+    buffer = io.StringIO()
+    np.savetxt(buffer, np.asarray(hessian, dtype=float))
+    return buffer.getvalue()
+
+
+def _optimization_converged(output: ProgramOutput, maxiter: int) -> bool:
+    """Check if a geomeTRIC optimization converged instead of stopping at maxiter
+
+    Optimizations that took fewer than maxiter steps converged. Otherwise the last step
+    is checked against geomeTRIC's default criteria, updated with the criterion and
+    value pairs of the input's "converge" keyword (e.g., ["gmax", "1e-4"]).
+
+    Params:
+        output: Output of the optimization with its trajectory
+        maxiter: The maxiter keyword of the optimization
+    """
+    trajectory = output.data.trajectory  # type: ignore
+    if len(trajectory) - 1 < maxiter:
+        return True
+    if len(trajectory) < 2:
+        return False
+
+    criteria = dict(GEOMETRIC_CONVERGENCE)
+    keywords = output.input_data.keywords  # type: ignore
+    converge = [str(value).lower() for value in keywords.get("converge", [])]
+    for name, value in zip(converge, converge[1:]):
+        if name in criteria:
+            criteria[name] = float(value)
+
+    last, before = trajectory[-1], trajectory[-2]
+    gradient = np.linalg.norm(np.reshape(last.data.gradient, (-1, 3)), axis=1)
+    step = np.linalg.norm(
+        np.asarray(last.input_data.structure.geometry)
+        - np.asarray(before.input_data.structure.geometry),
+        axis=1,
+    )
+    step *= BOHR_TO_ANGSTROM
+    values = {
+        "energy": abs(last.data.energy - before.data.energy),
+        "grms": np.sqrt(np.mean(gradient**2)),
+        "gmax": gradient.max(),
+        "drms": np.sqrt(np.mean(step**2)),
+        "dmax": step.max(),
+    }
+    return all(values[name] < criteria[name] for name in criteria)
+
+
+def _aligned_rmsd(geometry: np.ndarray, reference: np.ndarray) -> float:
+    """RMSD between two geometries after optimal superposition (Kabsch algorithm)
+
+    Atoms are matched by index; permutations of equivalent atoms are not considered.
     """
-    as_dict = prog_input.model_dump()
-    as_dict["calctype"] = CalcType.gradient
-    grad_input = ProgramInput(**as_dict)
+    a = geometry - geometry.mean(axis=0)
+    b = reference - reference.mean(axis=0)
+    u, singular, vt = np.linalg.svd(a.T @ b)
+    # Reflections are not allowed, so enantiomers remain distinct
+    if np.linalg.det(u @ vt) < 0:
+        singular[-1] *= -1
+    squared = (np.sum(a**2) + np.sum(b**2) - 2 * np.sum(singular)) / len(a)
+    return float(np.sqrt(max(squared, 0.0)))
 
-    gradients = []
-    geometry = np.array(prog_input.structure.geometry)
-    # Get all indices in the 2D array as a list of pairs
-    indices = np.indices(geometry.shape).reshape(2, -1).T
 
-    for index in indices:
-        # Need two new objects
-        forward, backward = (
-            grad_input.model_copy(deep=True),
-            grad_input.model_copy(deep=True),
+def _unique_conformers(
+    structures: Sequence[Structure],
+    energies: Sequence[float],
+    rmsd_tol: float,
+    energy_tol: float,
+) -> list[int]:
+    """Indices of the unique structures ordered by increasing energy
+
+    A structure is a duplicate of a lower energy structure if their energies differ
+    by less than energy_tol (Hartree) and their aligned RMSD is below rmsd_tol (Bohr).
+    """
+    order = np.argsort(energies, kind="stable")
+    unique: list[int] = []
+    for i in order:
+        geometry = np.asarray(structures[i].geometry)
+        if not any(
+            abs(energies[i] - energies[j]) < energy_tol
+            and _aligned_rmsd(geometry, np.asarray(structures[j].geometry)) < rmsd_tol
+            for j in unique
+        ):
+            unique.append(int(i))
+    return unique
+
+
+def _energy_window(
+    energies: Sequence[float],
+    energy_window: Optional[float] = None,
+    max_count: Optional[int] = None,
+) -> list[int]:
+    """Indices of the lowest energies ordered by increasing energy
+
+    Params:
+        energies: Energies to select from
+        energy_window: If set, only select energies at most this much (Hartree)
+            above the lowest energy
+        max_count: If set, select at most this many energies
+    """
+    order = [int(i) for i in np.argsort(energies, kind="stable")]
+    if energy_window is not None and order:
+        lowest = energies[order[0]]
+        order = [i for i in order if energies[i] - lowest <= energy_window]
+    return order[:max_count]
+
+
+def _atomic_masses(symbols: Sequence[str]) -> np.ndarray:
+    """Masses of the atoms in electron masses (atomic units)"""
+    # Import here so client applications don't need to install geomeTRIC
+    from geometric.molecule import PeriodicTable
+
+    return np.array([PeriodicTable[symbol] for symbol in symbols]) * AMU_TO_AU
+
+
+def _maxwell_boltzmann_velocities(
+    masses: np.ndarray, temperature: float, rng: np.random.Generator
+) -> np.ndarray:
+    """Random (N, 3) velocities for temperature (K) without center of mass motion"""
+    velocities = rng.normal(size=(len(masses), 3))
+    velocities *= np.sqrt(BOLTZMANN_AU * temperature / masses)[:, None]
+    momentum = np.sum(masses[:, None] * velocities, axis=0)
+    return velocities - momentum / np.sum(masses)
+
+
+def _scan_values(scans: Sequence[dict[str, Any]]) -> list[np.ndarray]:
+    """Values of every scanned coordinate from geomeTRIC style scan definitions
+
+    Params:
+        scans: Dicts with "type" (see SCAN_COORDINATES), "indices", "start", "stop",
+            and "steps". Distances in Bohr, angles and dihedrals in degrees.
+    """
+    values = []
+    for scan in scans:
+        n_atoms = SCAN_COORDINATES.get(scan["type"])
+        if n_atoms is None:
+            raise ValueError(
+                f"Unknown scan type '{scan['type']}'. Use one of "
+                f"{tuple(SCAN_COORDINATES)}."
+            )
+        if len(scan["indices"]) != n_atoms:
+            raise ValueError(
+                f"A {scan['type']} is defined by {n_atoms} atoms, got "
+                f"{scan['indices']}."
+            )
+        if scan["steps"] < 1:
+            raise ValueError("A scan needs at least one step.")
+        values.append(np.linspace(scan["start"], scan["stop"], scan["steps"]))
+    return values
+
+
+def _coordinate_value(geometry: np.ndarray, kind: str, indices: Sequence[int]) -> float:
+    """Distance (Bohr), angle, or dihedral (degrees) between the atoms of geometry"""
+    points = geometry[list(indices)]
+    if kind == "distance":
+        return float(np.linalg.norm(points[1] - points[0]))
+    if kind == "angle":
+        u, v = points[0] - points[1], points[2] - points[1]
+        cosine = np.dot(u, v) / (np.linalg.norm(u) * np.linalg.norm(v))
+        return float(np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0))))
+    b0, b1, b2 = np.diff(points, axis=0)
+    n0, n1 = np.cross(b0, b1), np.cross(b1, b2)
+    x = np.dot(n0, n1)
+    y = np.dot(np.cross(n0, n1), b1) / np.linalg.norm(b1)
+    return float(np.degrees(np.arctan2(y, x)))
+
+
+def _bonds(structure: Structure) -> list[list[int]]:
+    """Bonded neighbors of every atom
+
+    Uses structure.connectivity if set, otherwise atoms closer than 1.2 times the sum
+    of their covalent radii are bonded.
+    """
+    neighbors: list[list[int]] = [[] for _ in structure.symbols]
+    if structure.connectivity:
+        pairs = [(i, j) for i, j, _ in structure.connectivity]
+    else:
+        # Import here so client applications don't need to install geomeTRIC
+        from geometric.molecule import Elements, Radii
+        from geometric.nifty import bohr2ang
+
+        radii = np.array([Radii[Elements.index(s) - 1] for s in structure.symbols])
+        geometry = np.asarray(structure.geometry) * bohr2ang
+        distances = np.linalg.norm(geometry[:, None] - geometry[None], axis=-1)
+        bonded = distances < 1.2 * (radii[:, None] + radii[None])
+        pairs = [(int(i), int(j)) for i, j in zip(*np.nonzero(np.triu(bonded, 1)))]
+    for i, j in pairs:
+        neighbors[i].append(j)
+        neighbors[j].append(i)
+    return neighbors
+
+
+def _moving_atoms(
+    neighbors: Sequence[Sequence[int]], fixed: int, pivot: int, last: int
+) -> list[int]:
+    """Atoms moved with pivot when setting a coordinate of a rigid scan
+
+    These are the atoms still connected to pivot if its bond to fixed is cut. If pivot
+    and fixed are in a ring, only the last atom of the coordinate is moved.
+    """
+    moving, stack = {pivot}, [pivot]
+    while stack:
+        atom = stack.pop()
+        for neighbor in neighbors[atom]:
+            if atom == pivot and neighbor == fixed:
+                continue
+            if neighbor == fixed:
+                return [last]
+            if neighbor not in moving:
+                moving.add(neighbor)
+                stack.append(neighbor)
+    return sorted(moving)
+
+
+def _rotation(axis: np.ndarray, degrees: float) -> np.ndarray:
+    """Matrix rotating column vectors by degrees around axis (right-hand rule)"""
+    axis = axis / np.linalg.norm(axis)
+    angle = np.radians(degrees)
+    cross = np.array(
+        [[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]]
+    )
+    return np.eye(3) + np.sin(angle) * cross + (1 - np.cos(angle)) * cross @ cross
+
+
+def _set_coordinates(
+    structure: Structure, scans: Sequence[dict[str, Any]], point: Sequence[float]
+) -> Structure:
+    """Rigidly move the atoms of structure so the scanned coordinates take the values
+    of point
+
+    The coordinates are set in order by moving the fragment on the side of their last
+    atom (see _moving_atoms), so a later coordinate that moves the atoms of an earlier
+    one changes its value.
+    """
+    geometry = np.array(structure.geometry, dtype=float)
+    neighbors = _bonds(structure)
+    for scan, value in zip(scans, point):
+        kind, indices = scan["type"], scan["indices"]
+        change = value - _coordinate_value(geometry, kind, indices)
+        # Move the atoms bonded to pivot away from fixed
+        if kind == "dihedral":
+            fixed, pivot = indices[1], indices[2]
+        else:
+            fixed, pivot = indices[-2], indices[-1]
+        moving = _moving_atoms(neighbors, fixed, pivot, indices[-1])
+        if kind == "distance":
+            bond = geometry[pivot] - geometry[fixed]
+            geometry[moving] += change * bond / np.linalg.norm(bond)
+            continue
+        if kind == "angle":
+            first, vertex, last = geometry[list(indices)]
+            axis = np.cross(first - vertex, last - vertex)
+            if np.linalg.norm(axis) < 1e-8:
+                # Linear angle: bend in any plane containing the atoms
+                axis = np.cross(first - vertex, [1.0, 0.0, 0.0])
+                if np.linalg.norm(axis) < 1e-8:
+                    axis = np.cross(first - vertex, [0.0, 1.0, 0.0])
+            origin = vertex
+        else:
+            axis, origin = geometry[pivot] - geometry[fixed], geometry[pivot]
+            # Take the shorter way around
+            change = (change + 180.0) % 360.0 - 180.0
+        rotation = _rotation(axis, change)
+        geometry[moving] = (geometry[moving] - origin) @ rotation.T + origin
+    return structure.model_copy(update={"geometry": geometry})
+
+
+def _scan_seed(
+    structure: Structure, scans: Sequence[dict[str, Any]], values: list[np.ndarray]
+) -> tuple[int, ...]:
+    """Index of the grid point closest to the coordinates of structure"""
+    geometry = np.asarray(structure.geometry)
+    seed = []
+    for scan, axis_values in zip(scans, values):
+        difference = axis_values - _coordinate_value(
+            geometry, scan["type"], scan["indices"]
+        )
+        if scan["type"] == "dihedral":
+            difference = (difference + 180.0) % 360.0 - 180.0
+        seed.append(int(np.argmin(np.abs(difference))))
+    return tuple(seed)
+
+
+def _wavefront(
+    shape: Sequence[int], seed: Sequence[int], front: int
+) -> list[tuple[int, ...]]:
+    """Grid points front steps (along the grid axes) away from the seed point"""
+    return [
+        index
+        for index in np.ndindex(*shape)
+        if sum(abs(i - j) for i, j in zip(index, seed)) == front
+    ]
+
+
+def _scan_neighbors(index: Sequence[int], seed: Sequence[int]) -> list[tuple[int, ...]]:
+    """Neighbors of a grid point one step closer to the seed point"""
+    neighbors = []
+    for axis, (i, j) in enumerate(zip(index, seed)):
+        if i != j:
+            neighbor = list(index)
+            neighbor[axis] += 1 if j > i else -1
+            neighbors.append(tuple(neighbor))
+    return neighbors
+
+
+def _constrained_input(
+    prog_input: DualProgramInput,
+    structure: Structure,
+    scans: Sequence[dict[str, Any]],
+    point: Sequence[float],
+) -> DualProgramInput:
+    """Optimization of structure with the scanned coordinates constrained to point
+
+    The constraints are added to the "set" constraints of geomeTRIC, keeping any
+    constraints already in prog_input.keywords.
+    """
+    constraints = prog_input.keywords.get("constraints", {})
+    fixed = [
+        {"type": scan["type"], "indices": list(scan["indices"]), "value": float(value)}
+        for scan, value in zip(scans, point)
+    ]
+    keywords = {
+        **prog_input.keywords,
+        "constraints": {**constraints, "set": [*constraints.get("set", []), *fixed]},
+    }
+    return prog_input.model_copy(update={"structure": structure, "keywords": keywords})
+
+
+def _scan_result(
+    values: list[np.ndarray], outputs: dict[int, ProgramOutput]
+) -> dict[str, Any]:
+    """Grid of the outputs of a scan by their flat (C order) grid index. See
+    algos.parallel_scan for the returned keys."""
+    shape = tuple(len(axis_values) for axis_values in values)
+    n_atoms = len(next(iter(outputs.values())).input_data.structure.symbols)
+    energies = np.full(shape, np.nan)
+    geometries = np.full((*shape, n_atoms, 3), np.nan)
+    grid_outputs = np.empty(shape, dtype=object)
+    for flat_index, output in outputs.items():
+        index = np.unravel_index(flat_index, shape)
+        grid_outputs[index] = output
+        if not output.success:
+            continue
+        if output.input_data.calctype == CalcType.optimization:
+            energy, structure = output.data.final_energy, output.data.final_structure
+        else:
+            energy, structure = output.data.energy, output.input_data.structure
+        energies[index] = energy
+        geometries[index] = structure.geometry
+    return {
+        "values": values,
+        "energies": energies,
+        "geometries": geometries,
+        "outputs": grid_outputs,
+    }
+
+
+def _fragments(structure: Structure) -> list[list[int]]:
+    """Atom indices of the covalently bonded molecules of structure (see _bonds)"""
+    neighbors = _bonds(structure)
+    fragment_of = [-1] * len(neighbors)
+    fragments: list[list[int]] = []
+    for start in range(len(neighbors)):
+        if fragment_of[start] >= 0:
+            continue
+        fragment_of[start] = len(fragments)
+        fragment, stack = [], [start]
+        while stack:
+            atom = stack.pop()
+            fragment.append(atom)
+            for neighbor in neighbors[atom]:
+                if fragment_of[neighbor] < 0:
+                    fragment_of[neighbor] = len(fragments)
+                    stack.append(neighbor)
+        fragments.append(sorted(fragment))
+    return fragments
+
+
+def _mbe_subsystems(
+    structure: Structure,
+    fragments: Sequence[Sequence[int]],
+    order: int,
+    charges: Optional[Sequence[int]] = None,
+) -> tuple[list[tuple[int, ...]], list[Structure]]:
+    """All subsystems of up to order fragments of structure
+
+    Params:
+        structure: The full system
+        fragments: Atom indices of every fragment
+        order: Largest number of fragments in a subsystem
+        charges: Charge of every fragment. Defaults to neutral fragments.
+
+    Returns:
+        The fragment indices and structure of every subsystem. Subsystems have the
+            lowest multiplicity allowed by their number of electrons.
+    """
+    if charges is None:
+        if structure.charge != 0:
+            raise ValueError("Give the fragment charges of a charged structure.")
+        charges = [0] * len(fragments)
+    if len(charges) != len(fragments):
+        raise ValueError("Give one charge for every fragment.")
+    if sorted(i for fragment in fragments for i in fragment) != list(
+        range(len(structure.symbols))
+    ):
+        raise ValueError("Every atom must be in exactly one fragment.")
+    geometry = np.asarray(structure.geometry)
+    numbers = np.asarray(structure.atomic_numbers)
+    subsystems, structures = [], []
+    for size in range(1, order + 1):
+        for subsystem in itertools.combinations(range(len(fragments)), size):
+            atoms = [i for fragment in subsystem for i in fragments[fragment]]
+            charge = sum(charges[fragment] for fragment in subsystem)
+            electrons = int(numbers[atoms].sum()) - charge
+            subsystems.append(subsystem)
+            structures.append(
+                Structure(
+                    symbols=[structure.symbols[i] for i in atoms],
+                    geometry=geometry[atoms],
+                    charge=charge,
+                    multiplicity=1 + electrons % 2,
+                )
+            )
+    return subsystems, structures
+
+
+def _mbe_coefficients(sizes: np.ndarray, n_fragments: int, order: int) -> np.ndarray:
+    """Coefficients of subsystems in the order-truncated many-body expansion
+
+    With all subsystems of up to order fragments included, a subsystem of k fragments
+    contributes with (-1)^(order - k) * binom(n_fragments - k - 1, order - k).
+    """
+    coefficients = np.ones(len(sizes))
+    for k in range(1, order):
+        coefficients[sizes == k] = (-1) ** (order - k) * comb(
+            n_fragments - k - 1, order - k
         )
+    coefficients[sizes > order] = 0.0
+    return coefficients
 
-        forward.structure.geometry[tuple(index)] += dh
-        backward.structure.geometry[tuple(index)] -= dh
 
-        gradients.append(forward)
-        gradients.append(backward)
+def _unique_geometries(
+    structures: Sequence[Structure],
+    decimals: int = settings.bigchem_cache_geometry_decimals,
+) -> tuple[list[int], list[int], np.ndarray]:
+    """Find structures that are identical up to translation, rotation and reflection
 
-    return gradients
+    Structures are identical if their symbols, charge, multiplicity and interatomic
+    distances (rounded to decimals) match, atoms matched by index.
+
+    Returns:
+        The indices of the unique structures, the position in that list of the unique
+            structure matching each structure, and the (n_structures, 3, 3) orthogonal
+            transformations Q with the (centered) geometry of each structure being its
+            unique geometry @ Q. Gradients transform the same way.
+    """
+    unique: list[int] = []
+    keys: dict[tuple, int] = {}
+    matches = []
+    transforms = np.empty((len(structures), 3, 3))
+    for i, structure in enumerate(structures):
+        geometry = np.asarray(structure.geometry)
+        distances = np.linalg.norm(geometry[:, None] - geometry[None], axis=-1)
+        key = (
+            tuple(structure.symbols),
+            structure.charge,
+            structure.multiplicity,
+            np.round(distances, decimals).tobytes(),
+        )
+        if key not in keys:
+            keys[key] = len(unique)
+            unique.append(i)
+        match = keys[key]
+        matches.append(match)
+        # Orthogonal Procrustes superposition of the unique geometry onto this one
+        reference = np.asarray(structures[unique[match]].geometry)
+        a = reference - reference.mean(axis=0)
+        b = geometry - geometry.mean(axis=0)
+        u, _, vt = np.linalg.svd(a.T @ b)
+        transforms[i] = u @ vt
+    return unique, matches, transforms
@@ -2,8 +2,12 @@ from pathlib import Path
 
 import numpy as np
 import pytest
+from celery.backends.base import DisabledBackend
 from qcdata import ProgramInput, ProgramOutput, Structure
 
+from bigchem import tasks
+from bigchem.app import bigchem
+
 
 @pytest.fixture
 def hydrogen():
@@ -30,6 +34,16 @@ def water():
     )
 
 
+@pytest.fixture
+def methane():
+    """Methane Structure with exact Td symmetry"""
+    a = 1.185
+    return Structure(
+        symbols=["C", "H", "H", "H", "H"],
+        geometry=[[0.0, 0.0, 0.0], [a, a, a], [a, -a, -a], [-a, a, -a], [-a, -a, a]],
+    )
+
+
 @pytest.fixture(scope="function")
 def prog_inp(hydrogen):
     """Create a function that returns a ProgramInput object with a specified
@@ -78,3 +92,88 @@ def prog_output(prog_inp):
 def test_data_dir():
     """Test data directory Path"""
     return Path(__file__).parent / "test_data"
+
+
+@pytest.fixture
+def harmonic_outputs():
+    """Create a function that "computes" a list of ProgramInputs with a pairwise
+    harmonic potential so finite difference algorithms can be tested without running
+    a QC program. Optimizations are performed by steepest descent."""
+
+    def harmonic(structure):
+        coords = np.asarray(structure.geometry)
+        numbers = np.asarray(structure.atomic_numbers, dtype=float)
+        diffs = coords[:, None, :] - coords[None, :, :]
+        dists = np.linalg.norm(diffs, axis=-1)
+        np.fill_diagonal(dists, 1.0)
+        force_consts = 0.1 * np.outer(numbers, numbers)
+        stretch = dists - 2.0
+        np.fill_diagonal(stretch, 0.0)
+        energy = 0.25 * np.sum(force_consts * stretch**2)
+        gradient = np.einsum("ij,ijk->ik", force_consts * stretch / dists, diffs)
+        return energy, gradient
+
+    def optimize(structure):
+        """Steepest descent to a minimum of the harmonic potential"""
+        start = ProgramInput(
+            structure=structure, calctype="gradient", model={"method": "harmonic"}
+        )
+        geometry = np.array(structure.geometry, dtype=float)
+        for _ in range(5000):
+            _, gradient = harmonic(structure.model_copy(update={"geometry": geometry}))
+            if np.abs(gradient).max() < 1e-8:
+                break
+            geometry = geometry - 0.1 * gradient
+        final = start.model_copy(
+            update={"structure": structure.model_copy(update={"geometry": geometry})}
+        )
+        return {"trajectory": create_outputs([start, final])}
+
+    def create_outputs(prog_inputs):
+        outputs = []
+        for prog_input in prog_inputs:
+            if prog_input.calctype in {"optimization", "transition_state"}:
+                outputs.append(
+                    ProgramOutput(
+                        input_data=prog_input,
+                        success=True,
+                        data=optimize(prog_input.structure),
+                        provenance={"program": "harmonic"},
+                    )
+                )
+                continue
+            energy, gradient = harmonic(prog_input.structure)
+            data = {"energy": energy}
+            if prog_input.calctype != "energy":
+                data["gradient"] = gradient
+            outputs.append(
+                ProgramOutput(
+                    input_data=prog_input,
+                    success=True,
+                    logs=f"Harmonic energy: {energy}",
+                    data=data,
+                    provenance={"program": "harmonic"},
+                )
+            )
+        return outputs
+
+    return create_outputs
+
+
+@pytest.fixture
+def harmonic_bigchem(monkeypatch, harmonic_outputs):
+    """Run BigChem tasks eagerly in this process with qccompute replaced by the
+    harmonic potential. Returns the list of inputs passed to qccompute so tests can
+    count the calculations performed."""
+    calls = []
+
+    def fake_compute(program, inp_obj, **kwargs):
+        calls.append(inp_obj)
+        return harmonic_outputs([inp_obj])[0]
+
+    monkeypatch.setattr(bigchem.conf, "task_always_eager", True)
+    # Eager results don't need a backend, but tasks replaced with a group (e.g.,
+    # neb_step) freeze their results, which would subscribe to the Redis backend
+    monkeypatch.setattr(bigchem, "_backend_cache", DisabledBackend(bigchem))
+    monkeypatch.setattr(tasks, "qccompute_compute", fake_compute)
+    return calls
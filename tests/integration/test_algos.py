@@ -24,6 +24,43 @@ def test_parallel_hessian(hydrogen):
     assert_allclose(output.data.hessian, psi4_result.data.hessian, atol=1e-4)
 
 
+@pytest.mark.timeout(450)
+def test_parallel_hessian_symmetry(hydrogen):
+    prog_input = ProgramInput(
+        structure=hydrogen,
+        calctype="hessian",
+        model={"method": "HF", "basis": "sto-3g"},
+    )
+    fr = parallel_hessian("psi4", prog_input, symmetry=True).delay()
+    output = fr.get()
+    # Only the 6 displacements of the first H atom plus the energy calculation
+    assert len(fr.parent.results) == 7
+    fr.forget()
+    full_fr = parallel_hessian("psi4", prog_input).delay()
+    full_output = full_fr.get()
+    full_fr.forget()
+
+    assert_allclose(output.data.hessian, full_output.data.hessian, atol=1e-6)
+
+
+@pytest.mark.timeout(450)
+def test_parallel_hessian_forward_stencil(hydrogen):
+    prog_input = ProgramInput(
+        structure=hydrogen,
+        calctype="hessian",
+        model={"method": "HF", "basis": "sto-3g"},
+    )
+    fr = parallel_hessian("psi4", prog_input, stencil="forward").delay()
+    output = fr.get()
+    fr.forget()
+    psi4_fr = compute.delay("psi4", prog_input)
+    psi4_result = psi4_fr.get()
+    psi4_fr.forget()
+
+    assert_allclose(output.data.hessian, psi4_result.data.hessian, atol=1e-2)
+    assert output.data.energy == pytest.approx(psi4_result.data.energy)
+
+
 @pytest.mark.timeout(450)
 def test_parallel_frequency_analysis(water):
     # Must use water or some other non-linear structure
@@ -45,6 +82,39 @@ def test_parallel_frequency_analysis(water):
     )
 
 
+@pytest.mark.timeout(450)
+def test_parallel_frequency_analysis_projected(water):
+    prog_input = ProgramInput(
+        structure=water,
+        calctype="hessian",
+        model={"method": "b3lyp", "basis": "6-31g"},
+    )
+    fr = parallel_frequency_analysis("psi4", prog_input, projected=True).delay()
+    output = fr.get()
+    # 3N - 6 directions displaced forward and backward plus the energy calculation
+    assert len(fr.parent.parent.results) == 7
+    fr.forget()
+    assert_allclose(
+        [1619.135, 3615.209, 3780.138],
+        output.data.freqs_wavenumber,
+        atol=1,
+    )
+
+
+@pytest.mark.timeout(450)
+def test_parallel_frequency_analysis_active_atoms(water):
+    prog_input = ProgramInput(
+        structure=water,
+        calctype="hessian",
+        model={"method": "b3lyp", "basis": "6-31g"},
+    )
+    fr = parallel_frequency_analysis("psi4", prog_input, active_atoms=[1, 2]).delay()
+    output = fr.get()
+    fr.forget()
+    assert len(output.data.freqs_wavenumber) == 6
+    assert not output.data.hessian[:3, :3].any()
+
+
 @pytest.mark.timeout(65)
 def test_multistep_opt(hydrogen):
     """See note in test_compute re: timeout"""
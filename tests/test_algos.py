@@ -0,0 +1,632 @@
+"""Algorithms run eagerly with a harmonic potential; no workers or QC programs."""
+
+import io
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+from qccompute.adapters import registry
+from qcdata import (
+    CalcType,
+    DualProgramInput,
+    ProgramArgsSub,
+    ProgramInput,
+    Structure,
+)
+
+from bigchem import algos, tasks
+from bigchem.accumulator import DiskAccumulator, read_trajectory
+from bigchem.algos import (
+    ensemble_opt,
+    parallel_compute,
+    parallel_gradient,
+    parallel_hessian,
+    parallel_hessian_from_energies,
+    parallel_hessian_opt,
+    parallel_mbe,
+    parallel_md,
+    parallel_multistep_opt,
+    parallel_neb,
+    parallel_scan,
+)
+from bigchem.cache import DiskCache
+from bigchem.canvas import group
+from bigchem.config import settings
+from bigchem.tasks import assemble_accumulated_hessian
+from bigchem.utils import _aligned_rmsd, _coordinate_value
+
+
+@pytest.fixture
+def hessian_inp(water):
+    return ProgramInput(
+        structure=water, calctype="hessian", model={"method": "harmonic"}
+    )
+
+
+def test_parallel_hessian_checkpoint(
+    tmp_path, monkeypatch, harmonic_bigchem, hessian_inp
+):
+    store = DiskCache(tmp_path)
+    monkeypatch.setattr(algos, "get_checkpoint_store", lambda: store)
+    monkeypatch.setattr(tasks, "get_checkpoint_store", lambda: store)
+    answer = parallel_hessian("harmonic", hessian_inp).apply().get()
+    harmonic_bigchem.clear()
+
+    # Simulate a worker failing one displacement
+    working_compute = tasks.qccompute_compute
+
+    def flaky_compute(program, inp_obj, **kwargs):
+        if len(harmonic_bigchem) == 4:
+            harmonic_bigchem.append(inp_obj)
+            raise RuntimeError("Node failure")
+        return working_compute(program, inp_obj, **kwargs)
+
+    monkeypatch.setattr(tasks, "qccompute_compute", flaky_compute)
+    with pytest.raises(RuntimeError):
+        parallel_hessian("harmonic", hessian_inp, checkpoint=True).apply().get()
+    assert len(harmonic_bigchem) == 19
+    assert len(list(tmp_path.glob("*.pkl"))) == 18
+
+    # Resubmission only computes the failed displacement
+    monkeypatch.setattr(tasks, "qccompute_compute", working_compute)
+    harmonic_bigchem.clear()
+    output = parallel_hessian("harmonic", hessian_inp, checkpoint=True).apply().get()
+    assert len(harmonic_bigchem) == 1
+    np.testing.assert_allclose(output.data.hessian, answer.data.hessian)
+
+    # Nothing left to compute
+    harmonic_bigchem.clear()
+    output = parallel_hessian("harmonic", hessian_inp, checkpoint=True).apply().get()
+    assert harmonic_bigchem == []
+    np.testing.assert_allclose(output.data.hessian, answer.data.hessian)
+
+
+@pytest.mark.parametrize("logs", ["drop", "offload"])
+def test_parallel_hessian_logs(
+    tmp_path, monkeypatch, harmonic_bigchem, hessian_inp, logs
+):
+    monkeypatch.setattr(settings, "bigchem_logs_dir", tmp_path)
+    answer = parallel_hessian("harmonic", hessian_inp).apply().get()
+    output = parallel_hessian("harmonic", hessian_inp, logs=logs).apply().get()
+
+    np.testing.assert_allclose(output.data.hessian, answer.data.hessian)
+    offloaded = list(tmp_path.glob("*.log"))
+    if logs == "drop":
+        assert output.logs is None
+        assert offloaded == []
+    else:
+        # One file per gradient plus the energy calculation
+        assert len(offloaded) == len(harmonic_bigchem) // 2
+        path = Path(output.logs.removeprefix("Logs offloaded to "))
+        assert path.read_text() == answer.logs
+
+
+def test_parallel_hessian_unknown_logs_option(hessian_inp):
+    with pytest.raises(ValueError):
+        parallel_hessian("harmonic", hessian_inp, logs="compress")
+
+
+@pytest.mark.parametrize("batch_size", [4, "auto"])
+def test_parallel_hessian_batched(
+    tmp_path, monkeypatch, harmonic_bigchem, hessian_inp, batch_size
+):
+    answer = parallel_hessian("harmonic", hessian_inp).apply().get()
+    n_calcs = len(harmonic_bigchem)
+    sig = parallel_hessian("harmonic", hessian_inp, batch_size=batch_size)
+    # 19 calculations in batches of 4 or 5 (sqrt(19) rounded up for "auto")
+    assert len(sig.tasks) == (5 if batch_size == 4 else 4)
+    output = sig.apply().get()
+    assert len(harmonic_bigchem) == 2 * n_calcs
+    np.testing.assert_allclose(output.data.hessian, answer.data.hessian)
+
+    # Batches of checkpointed calculations
+    store = DiskCache(tmp_path)
+    monkeypatch.setattr(algos, "get_checkpoint_store", lambda: store)
+    monkeypatch.setattr(tasks, "get_checkpoint_store", lambda: store)
+    output = (
+        parallel_hessian(
+            "harmonic", hessian_inp, checkpoint=True, batch_size=batch_size
+        )
+        .apply()
+        .get()
+    )
+    assert len(list(tmp_path.glob("*.pkl"))) == n_calcs
+    np.testing.assert_allclose(output.data.hessian, answer.data.hessian)
+
+
+class GuessAdapter:
+    """Stand-in for a qccompute adapter that supports wavefunction propagation"""
+
+    def propagate_wfn(self, output, program_input):
+        program_input.files["c0"] = output.data.files["c0"]
+        program_input.keywords["guess"] = "c0"
+
+
+@pytest.mark.parametrize("batch_size", [None, 4])
+def test_parallel_hessian_reuse_wfn(
+    tmp_path, monkeypatch, harmonic_bigchem, hessian_inp, batch_size
+):
+    store = DiskCache(tmp_path)
+    monkeypatch.setattr(tasks, "get_checkpoint_store", lambda: store)
+    answer = parallel_hessian("harmonic", hessian_inp).apply().get()
+    harmonic_bigchem.clear()
+
+    harmonic_compute = tasks.qccompute_compute
+
+    def compute_with_wfn(program, inp_obj, collect_wfn=False, **kwargs):
+        output = harmonic_compute(program, inp_obj, **kwargs)
+        if collect_wfn:
+            files = {"c0": b"orbitals"}
+            output = output.model_copy(
+                update={"data": output.data.model_copy(update={"files": files})}
+            )
+        return output
+
+    monkeypatch.setattr(tasks, "qccompute_compute", compute_with_wfn)
+    monkeypatch.setitem(registry, "harmonic", GuessAdapter)
+    output = (
+        parallel_hessian("harmonic", hessian_inp, reuse_wfn=True, batch_size=batch_size)
+        .apply()
+        .get()
+    )
+
+    reference, *displaced = harmonic_bigchem
+    assert "guess" not in reference.keywords
+    assert all(inp.keywords["guess"] == "c0" for inp in displaced)
+    assert all(inp.files["c0"] == b"orbitals" for inp in displaced)
+    assert output.data.files == {}
+    np.testing.assert_allclose(output.data.hessian, answer.data.hessian)
+    # The wavefunction was stored once instead of sent with every task
+    (path,) = tmp_path.glob("*-wfn.pkl")
+    assert store.get(path.stem).data.files == {"c0": b"orbitals"}
+
+
+def test_parallel_hessian_reuse_wfn_unsupported(hessian_inp):
+    with pytest.raises(ValueError):
+        parallel_hessian("xtb", hessian_inp, reuse_wfn=True)
+    with pytest.raises(ValueError):
+        parallel_hessian("terachem", hessian_inp, reuse_wfn=True, checkpoint=True)
+
+
+def test_parallel_hessian_accumulator(
+    tmp_path, monkeypatch, harmonic_bigchem, hessian_inp
+):
+    accumulator = DiskAccumulator(tmp_path)
+    monkeypatch.setattr(tasks, "get_accumulator", lambda: accumulator)
+    answer = parallel_hessian("harmonic", hessian_inp).apply().get()
+
+    progress = []
+
+    def assemble(*args, **kwargs):
+        progress.append(accumulator.progress("job"))
+        return assemble_accumulated_hessian(*args, **kwargs)
+
+    sig = parallel_hessian("harmonic", hessian_inp, accumulator_key="job")
+    # Gradient tasks return nothing so only the energy calculation reaches the reducer
+    outputs = group(*sig.tasks).apply().get()
+    assert outputs[:-1] == [None] * 18
+    output = assemble(outputs, *sig.body.args, **sig.body.kwargs)
+
+    assert progress == [18]
+    assert accumulator.progress("job") == 0
+    np.testing.assert_allclose(output.data.hessian, answer.data.hessian)
+
+    # Complete signature
+    output = (
+        parallel_hessian("harmonic", hessian_inp, accumulator_key="job").apply().get()
+    )
+    np.testing.assert_allclose(output.data.hessian, answer.data.hessian)
+    with pytest.raises(ValueError):
+        parallel_hessian("harmonic", hessian_inp, accumulator_key="job", batch_size=2)
+
+
+def test_disk_accumulator_ttl(tmp_path):
+    accumulator = DiskAccumulator(tmp_path, ttl=60)
+    accumulator.add("abandoned", 0, np.zeros(3))
+    accumulator.add("running", 0, np.zeros(3))
+    assert accumulator.progress("abandoned") == 1
+
+    # Last written two minutes ago
+    old = time.time() - 120
+    os.utime(tmp_path / "abandoned", (old, old))
+    os.utime(tmp_path / "running", (old, old))
+    assert accumulator.progress("abandoned") == 0
+    # Writes remove all expired jobs
+    accumulator.add("new", 0, np.zeros(3))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["new"]
+
+
+@pytest.mark.parametrize("batch_size", [None, 2])
+def test_parallel_compute_longest_first(harmonic_bigchem, batch_size):
+    prog_inputs = [
+        ProgramInput(
+            structure=Structure(
+                symbols=["H"] * n_atoms,
+                geometry=[[0.0, 0.0, 1.4 * i] for i in range(n_atoms)],
+            ),
+            calctype="energy",
+            model={"method": "harmonic"},
+        )
+        for n_atoms in [2, 6, 3, 5]
+    ]
+
+    signature = parallel_compute("harmonic", prog_inputs, batch_size=batch_size)
+    outputs = signature.apply().get()
+
+    assert [len(inp.structure.symbols) for inp in harmonic_bigchem] == [6, 5, 3, 2]
+    assert [output.input_data for output in outputs] == prog_inputs
+    # Only the order changes, priorities are left to route_task
+    assert all("priority" not in task.options for task in signature.tasks)
+
+
+@pytest.mark.parametrize(
+    "stencil, n_calcs, atol",
+    [("central", 19, 1e-5), ("forward", 10, 1e-2), ("five-point", 37, 1e-8)],
+)
+def test_parallel_gradient(
+    harmonic_bigchem, harmonic_outputs, water, stencil, n_calcs, atol
+):
+    prog_input = ProgramInput(
+        structure=water, calctype="gradient", model={"method": "harmonic"}
+    )
+    answer = harmonic_outputs([prog_input])[0]
+
+    output = parallel_gradient("harmonic", prog_input, stencil=stencil).apply().get()
+
+    assert len(harmonic_bigchem) == n_calcs
+    assert all(inp.calctype == "energy" for inp in harmonic_bigchem)
+    assert output.input_data.calctype == "gradient"
+    assert output.data.energy == answer.data.energy
+    np.testing.assert_allclose(output.data.gradient, answer.data.gradient, atol=atol)
+
+
+def test_parallel_hessian_from_energies(
+    harmonic_bigchem, harmonic_outputs, hessian_inp
+):
+    answer = parallel_hessian("harmonic", hessian_inp).apply().get()
+    harmonic_bigchem.clear()
+
+    output = parallel_hessian_from_energies("harmonic", hessian_inp).apply().get()
+
+    # 9N^2 + 3N + 1 energies
+    assert len(harmonic_bigchem) == 91
+    assert all(inp.calctype == "energy" for inp in harmonic_bigchem)
+    assert output.input_data.calctype == "hessian"
+    np.testing.assert_allclose(output.data.hessian, output.data.hessian.T)
+    np.testing.assert_allclose(output.data.hessian, answer.data.hessian, atol=1e-4)
+    gradient_inp = hessian_inp.model_copy(update={"calctype": CalcType.gradient})
+    gradient = harmonic_outputs([gradient_inp])[0].data.gradient
+    np.testing.assert_allclose(output.data.gradient, gradient, atol=1e-5)
+
+
+def test_parallel_hessian_five_point(harmonic_bigchem, hessian_inp):
+    central = parallel_hessian("harmonic", hessian_inp, dh=0.02).apply().get()
+    harmonic_bigchem.clear()
+    five_point = (
+        parallel_hessian("harmonic", hessian_inp, dh=0.02, stencil="five-point")
+        .apply()
+        .get()
+    )
+    # Reference is a small step central difference hessian
+    reference = parallel_hessian("harmonic", hessian_inp, dh=1e-4).apply().get()
+
+    assert len(harmonic_bigchem) == 4 * 9 + 1 + 19
+    central_error = np.abs(central.data.hessian - reference.data.hessian).max()
+    five_point_error = np.abs(five_point.data.hessian - reference.data.hessian).max()
+    assert five_point_error < central_error / 100
+    richardson_error = five_point.data.extras["hessian_richardson_error"]
+    assert richardson_error == pytest.approx(central_error, rel=0.2)
+
+
+def test_parallel_neb(harmonic_bigchem, hessian_inp):
+    # Enantiomers of a tetrahedron of distinct atoms, inverted through a planar saddle
+    corners = np.array([[1, 1, 1], [1, -1, -1], [-1, 1, -1], [-1, -1, 1]]) / np.sqrt(2)
+    reactant = Structure(symbols=["H", "He", "Li", "Be"], geometry=corners)
+    product = reactant.model_copy(update={"geometry": corners * [1, 1, -1]})
+    gradient_inp = hessian_inp.model_copy(
+        update={"calctype": CalcType.gradient, "structure": reactant}
+    )
+
+    path = (
+        parallel_neb("harmonic", gradient_inp, [reactant, product], n_images=5)
+        .apply()
+        .get()
+    )
+
+    assert len(path) == 5
+    extras = path[2].data.extras
+    assert extras["neb_converged"] and extras["neb_climbing"]
+    assert extras["neb_max_force"] < 1e-3
+    # Endpoints are fixed and only computed once
+    np.testing.assert_array_equal(path[0].input_data.structure.geometry, corners)
+    assert [inp.calctype for inp in harmonic_bigchem].count("energy") == 2
+    assert len(harmonic_bigchem) == 2 + 3 * extras["neb_iterations"]
+    # Climbing image is the planar saddle point
+    saddle = path[2]
+    assert saddle.data.energy == max(output.data.energy for output in path)
+    np.testing.assert_allclose(saddle.input_data.structure.geometry[:, 2], 0, atol=1e-8)
+    assert np.linalg.norm(saddle.data.gradient, axis=1).max() < 1e-3
+
+
+def test_parallel_neb_too_few_images(hessian_inp):
+    gradient_inp = hessian_inp.model_copy(update={"calctype": CalcType.gradient})
+    with pytest.raises(ValueError):
+        parallel_neb("harmonic", gradient_inp, [hessian_inp.structure] * 2)
+
+
+@pytest.mark.parametrize("max_conformers", [None, 1])
+def test_ensemble_opt(harmonic_bigchem, max_conformers):
+    # Perturbed copies of both enantiomers of a tetrahedron of distinct atoms
+    rng = np.random.default_rng(0)
+    corners = np.array([[1, 1, 1], [1, -1, -1], [-1, 1, -1], [-1, -1, 1]]) / np.sqrt(2)
+    structures = [
+        Structure(
+            symbols=["H", "He", "Li", "Be"],
+            geometry=corners * mirror + rng.normal(scale=0.1, size=(4, 3)),
+        )
+        for mirror in [[1, 1, 1]] * 3 + [[1, 1, -1]] * 2
+    ]
+    args = ProgramArgsSub(
+        subprogram="harmonic", subprogram_args={"model": {"method": "harmonic"}}
+    )
+
+    outputs = (
+        ensemble_opt(
+            structures,
+            CalcType.optimization,
+            ["geometric", "geometric"],
+            [args, args],
+            max_conformers=max_conformers,
+        )
+        .apply()
+        .get()
+    )
+
+    n_unique = 2 if max_conformers is None else 1
+    assert len(outputs) == n_unique
+    # Only the unique conformers are optimized again
+    assert len(harmonic_bigchem) == len(structures) + n_unique
+    if max_conformers is None:
+        # One of each enantiomer
+        first, second = (output.data.final_structure.geometry for output in outputs)
+        assert _aligned_rmsd(first, second) > 0.25
+
+
+@pytest.mark.parametrize(
+    "energy_window,max_structures,n_survivors",
+    [(None, None, 3), (None, 2, 2), (1e-6, None, 1)],
+)
+def test_parallel_multistep_opt(
+    harmonic_bigchem, hydrogen, energy_window, max_structures, n_survivors
+):
+    # Five atoms can't all be at the equilibrium distance, so their minima are higher
+    # in energy than the one of hydrogen
+    rng = np.random.default_rng(0)
+    structures = [hydrogen] + [
+        Structure(symbols=["H"] * 5, geometry=rng.normal(scale=2.0, size=(5, 3)))
+        for _ in range(2)
+    ]
+    args = ProgramArgsSub(
+        subprogram="harmonic", subprogram_args={"model": {"method": "harmonic"}}
+    )
+
+    outputs = (
+        parallel_multistep_opt(
+            structures,
+            CalcType.optimization,
+            ["geometric"] * 3,
+            [args] * 3,
+            energy_window=energy_window,
+            max_structures=max_structures,
+        )
+        .apply()
+        .get()
+    )
+
+    assert len(outputs) == n_survivors
+    # Every stage after the first only optimizes the survivors
+    assert len(harmonic_bigchem) == len(structures) + 2 * n_survivors
+    energies = [output.data.final_energy for output in outputs]
+    assert energies == sorted(energies)
+    assert outputs[0].input_data.structure.symbols == hydrogen.symbols
+
+
+@pytest.mark.parametrize("hessian_every", [None, 5])
+def test_parallel_hessian_opt(monkeypatch, harmonic_bigchem, water, hessian_every):
+    harmonic_compute = tasks.qccompute_compute
+    optimizations = []
+
+    def compute_segment(program, inp_obj, **kwargs):
+        output = harmonic_compute(program, inp_obj, **kwargs)
+        if inp_obj.calctype == "transition_state":
+            optimizations.append(inp_obj)
+            # The first two segments stop at maxiter before their last step converged
+            if len(optimizations) < 3 and "maxiter" in inp_obj.keywords["converge"]:
+                start, final = output.data.trajectory
+                energy = final.data.energy + 1e-3  # Still changing in the last step
+                final = final.model_copy(
+                    update={"data": final.data.model_copy(update={"energy": energy})}
+                )
+                trajectory = [start] * inp_obj.keywords["maxiter"] + [final]
+                data = output.data.model_copy(update={"trajectory": trajectory})
+                output = output.model_copy(update={"data": data, "logs": None})
+        return output
+
+    monkeypatch.setattr(tasks, "qccompute_compute", compute_segment)
+    prog_input = DualProgramInput(
+        structure=water,
+        calctype="transition_state",
+        keywords={"maxiter": 20, "converge": ["gmax", "1e-4"]},
+        subprogram="harmonic",
+        subprogram_args={"model": {"method": "harmonic"}},
+    )
+
+    output = parallel_hessian_opt(prog_input, hessian_every=hessian_every).apply().get()
+
+    n_segments = 1 if hessian_every is None else 3
+    assert len(optimizations) == n_segments
+    # Every segment computes a hessian (18 gradients + 1 energy) to start from
+    assert len(harmonic_bigchem) == n_segments * (19 + 1)
+    for i, inp in enumerate(optimizations):
+        assert inp.keywords["hessian"] == "file:initial_hessian.txt"
+        assert np.loadtxt(io.StringIO(inp.files["initial_hessian.txt"])).shape == (9, 9)
+        if hessian_every is not None:
+            assert inp.keywords["maxiter"] == 5
+            assert inp.keywords["converge"] == ["gmax", "1e-4", "maxiter"]
+    if hessian_every is None:
+        assert optimizations[0].keywords["maxiter"] == 20
+        assert optimizations[0].keywords["converge"] == ["gmax", "1e-4"]
+    else:
+        # Segments start from the final structure of the previous one and their
+        # trajectories are merged
+        start = optimizations[1].structure.geometry
+        assert not np.allclose(start, water.geometry)
+        assert len(output.data.trajectory) == 2 * hessian_every + 2
+        assert output.data.trajectory[0].input_data.structure == water
+        assert output.data.extras["n_hessians"] == 3
+    assert prog_input.keywords == {"maxiter": 20, "converge": ["gmax", "1e-4"]}
+
+
+def test_parallel_md(tmp_path, monkeypatch, harmonic_bigchem, prog_inp):
+    accumulator = DiskAccumulator(tmp_path)
+    monkeypatch.setattr(tasks, "get_accumulator", lambda: accumulator)
+    prog_input = prog_inp("gradient")
+
+    outputs = (
+        parallel_md(
+            "harmonic",
+            prog_input,
+            "md",
+            n_steps=50,
+            time_step=0.1,
+            n_replicas=2,
+            temperature=300,
+            seed=0,
+            frame_every=20,
+        )
+        .apply()
+        .get()
+    )
+
+    # One gradient per step and replica
+    assert len(harmonic_bigchem) == 2 * 51
+    assert [output.data.extras["md_key"] for output in outputs] == ["md-0", "md-1"]
+    first, second = (read_trajectory(f"md-{i}", accumulator) for i in range(2))
+    np.testing.assert_allclose(first["time"], [0, 2, 4, 5])
+    assert first["geometry"].shape == first["velocity"].shape == (4, 2, 3)
+    np.testing.assert_allclose(first["geometry"][0], prog_input.structure.geometry)
+    np.testing.assert_allclose(
+        first["geometry"][-1], outputs[0].input_data.structure.geometry
+    )
+    assert not np.allclose(first["geometry"][-1], second["geometry"][-1])
+    # Velocity Verlet conserves the total energy
+    total = first["potential_energy"] + first["kinetic_energy"]
+    assert np.ptp(total) < 1e-3 * total[0]
+
+
+def test_parallel_scan_rigid(harmonic_bigchem, water):
+    prog_input = ProgramInput(
+        structure=water, calctype="energy", model={"method": "harmonic"}
+    )
+    scans = [
+        {"type": "distance", "indices": [0, 1], "start": 1.5, "stop": 2.5, "steps": 3},
+        {"type": "angle", "indices": [1, 0, 2], "start": 90, "stop": 120, "steps": 4},
+    ]
+
+    result = parallel_scan("harmonic", prog_input, scans).apply().get()
+
+    assert len(harmonic_bigchem) == 12
+    assert result["energies"].shape == result["outputs"].shape == (3, 4)
+    assert result["geometries"].shape == (3, 4, 3, 3)
+    np.testing.assert_allclose(result["values"][1], [90, 100, 110, 120])
+    for i, j in np.ndindex(3, 4):
+        geometry = result["geometries"][i, j]
+        assert _coordinate_value(geometry, "distance", [0, 1]) == pytest.approx(
+            result["values"][0][i]
+        )
+        assert _coordinate_value(geometry, "angle", [1, 0, 2]) == pytest.approx(
+            result["values"][1][j]
+        )
+        # The other O-H bond is not changed
+        assert _coordinate_value(geometry, "distance", [0, 2]) == pytest.approx(
+            _coordinate_value(np.asarray(water.geometry), "distance", [0, 2])
+        )
+        assert result["energies"][i, j] == result["outputs"][i, j].data.energy
+
+
+def test_parallel_scan_relaxed(monkeypatch, harmonic_bigchem, water):
+    monkeypatch.setattr(settings, "bigchem_priorities", True)
+    prog_input = DualProgramInput(
+        structure=water,
+        calctype="optimization",
+        keywords={"constraints": {"freeze": [{"type": "xyz", "indices": [0]}]}},
+        subprogram="harmonic",
+        subprogram_args={"model": {"method": "harmonic"}},
+    )
+    # The water structure is closest to the center of the grid
+    scans = [
+        {"type": "distance", "indices": [0, 1], "start": 1.6, "stop": 2.0, "steps": 3},
+        {"type": "angle", "indices": [1, 0, 2], "start": 94, "stop": 114, "steps": 3},
+    ]
+
+    result = parallel_scan("geometric", prog_input, scans, priority=8).apply().get()
+
+    assert len(harmonic_bigchem) == 9
+    assert np.isfinite(result["energies"]).all()
+    for n_calls, inp in enumerate(harmonic_bigchem):
+        constraints = inp.keywords["constraints"]
+        assert constraints["freeze"] == [{"type": "xyz", "indices": [0]}]
+        distance, angle = (c["value"] for c in constraints["set"])
+        i = int(np.argmin(np.abs(result["values"][0] - distance)))
+        j = int(np.argmin(np.abs(result["values"][1] - angle)))
+        # Wavefronts of increasing distance from the center
+        front = abs(i - 1) + abs(j - 1)
+        assert front == (0 if n_calls == 0 else 1 if n_calls < 5 else 2)
+        if front == 0:
+            assert inp.structure == water
+        else:
+            # Started from the final structure of a neighbor
+            assert not np.allclose(inp.structure.geometry, water.geometry)
+        assert result["outputs"][i, j].input_data == inp
+    assert "set" not in prog_input.keywords["constraints"]
+
+
+@pytest.mark.parametrize("order,n_calcs", [(1, 1), (2, 3), (3, 4)])
+def test_parallel_mbe(harmonic_bigchem, harmonic_outputs, order, n_calcs):
+    # Three parallel hydrogen molecules. The third is the second rotated around the
+    # first, so all monomers and the dimers with the first molecule are duplicates.
+    molecule = np.array([[0.0, 0.0, -0.65], [0.0, 0.0, 0.65]])
+    structure = Structure(
+        symbols=["H"] * 6,
+        geometry=np.concatenate(
+            [molecule, molecule + [3.0, 0.0, 0.0], molecule + [0.0, 3.0, 0.0]]
+        ),
+    )
+    prog_input = ProgramInput(
+        structure=structure, calctype="gradient", model={"method": "harmonic"}
+    )
+
+    output = parallel_mbe("harmonic", prog_input, order=order).apply().get()
+
+    assert len(harmonic_bigchem) == n_calcs
+    assert output.input_data == prog_input
+    assert len(output.data.extras["mbe_energies"]) == order
+    if order == 1:
+        monomer = harmonic_outputs([harmonic_bigchem[0]])[0]
+        assert output.data.energy == pytest.approx(3 * monomer.data.energy)
+    else:
+        # The harmonic potential is pairwise additive, so dimers are exact
+        reference = harmonic_outputs([prog_input])[0]
+        assert output.data.energy == pytest.approx(reference.data.energy)
+        np.testing.assert_allclose(
+            output.data.gradient, reference.data.gradient, atol=1e-12
+        )
+
+
+def test_parallel_mbe_charged_structure(prog_inp):
+    prog_input = prog_inp("energy")
+    charged = prog_input.structure.model_copy(update={"charge": 1, "multiplicity": 2})
+    with pytest.raises(ValueError):
+        parallel_mbe("harmonic", prog_input.model_copy(update={"structure": charged}))
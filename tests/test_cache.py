@@ -0,0 +1,106 @@
+import time
+
+import pytest
+from qcdata import ProgramInput
+
+from bigchem import tasks
+from bigchem.cache import DiskCache, input_hash
+from bigchem.tasks import compute
+
+
+@pytest.fixture
+def energy_inp(water):
+    return ProgramInput(
+        structure=water, calctype="energy", model={"method": "hf", "basis": "sto-3g"}
+    )
+
+
+def test_input_hash_geometry_rounding(energy_inp):
+    key = input_hash("psi4", energy_inp)
+
+    nearby = energy_inp.model_copy(deep=True)
+    nearby.structure.geometry[0, 0] += 1e-12
+    assert input_hash("psi4", nearby) == key
+
+    displaced = energy_inp.model_copy(deep=True)
+    displaced.structure.geometry[0, 0] += 1e-4
+    assert input_hash("psi4", displaced) != key
+
+
+def test_input_hash_program_keywords_and_kwargs(energy_inp):
+    key = input_hash("psi4", energy_inp)
+    assert input_hash("terachem", energy_inp) != key
+    assert input_hash("psi4", energy_inp, collect_wfn=True) != key
+    # Scratch directory options don't change the output
+    assert (
+        input_hash("psi4", energy_inp, scratch_dir="/tmp/x", rm_scratch_dir=False)
+        == key
+    )
+
+    new_keywords = energy_inp.model_copy(update={"keywords": {"maxiter": 10}})
+    assert input_hash("psi4", new_keywords) != key
+
+
+def test_disk_cache_get_set(tmp_path, prog_output):
+    cache = DiskCache(tmp_path)
+    assert cache.get("key") is None
+    cache.set("key", prog_output)
+    assert cache.get("key") == prog_output
+    assert cache.stats == {"hits": 1, "misses": 1}
+    # Counters are shared by all processes using the directory
+    assert DiskCache(tmp_path).stats == {"hits": 1, "misses": 1}
+
+    cache.clear()
+    assert cache.stats == {"hits": 0, "misses": 0}
+    assert cache.get("key") is None
+
+
+def test_disk_cache_ttl(tmp_path, prog_output):
+    cache = DiskCache(tmp_path, ttl=60)
+    cache.set("key", prog_output)
+    assert cache.get("key") is not None
+
+    cache.ttl = -1
+    assert cache.get("key") is None
+    assert not (tmp_path / "key.pkl").exists()
+
+
+def test_disk_cache_max_size_evicts_least_recently_used(tmp_path, prog_output):
+    cache = DiskCache(tmp_path)
+    cache.set("first", prog_output)
+    entry_size = (tmp_path / "first.pkl").stat().st_size
+    cache.max_size = 2 * entry_size
+
+    cache.set("second", prog_output)
+    time.sleep(0.01)
+    # Reading "first" makes "second" the least recently used entry
+    cache.get("first")
+    cache.set("third", prog_output)
+
+    assert sorted(p.stem for p in tmp_path.glob("*.pkl")) == ["first", "third"]
+
+
+def test_compute_uses_cache(tmp_path, monkeypatch, energy_inp, prog_output):
+    calls = []
+
+    def fake_compute(program, inp_obj, **kwargs):
+        calls.append(program)
+        return prog_output.model_copy(update={"input_data": inp_obj})
+
+    cache = DiskCache(tmp_path)
+    monkeypatch.setattr(tasks, "get_cache", lambda: cache)
+    monkeypatch.setattr(tasks, "qccompute_compute", fake_compute)
+
+    first = compute("psi4", energy_inp)
+    nearby = energy_inp.model_copy(deep=True)
+    nearby.structure.geometry[0, 0] += 1e-12
+    second = compute("psi4", nearby)
+
+    assert calls == ["psi4"]
+    assert cache.stats == {"hits": 1, "misses": 1}
+    assert second.data == first.data
+    # The cached output reports the input that was actually requested
+    assert second.input_data is nearby
+
+    compute("xtb", energy_inp)
+    assert calls == ["psi4", "xtb"]
@@ -0,0 +1,64 @@
+import pytest
+from qcdata import DualProgramInput, ProgramInput
+
+from bigchem import cost
+from bigchem.config import settings
+from bigchem.cost import (
+    DiskRuntimeHistory,
+    basis_functions,
+    estimated_cost,
+    estimated_runtime,
+)
+
+
+@pytest.fixture
+def energy_inp(water):
+    return ProgramInput(
+        structure=water, calctype="energy", model={"method": "b3lyp", "basis": "sto-3g"}
+    )
+
+
+def with_model(prog_input, model):
+    return ProgramInput(**{**prog_input.model_dump(), "model": model})
+
+
+def test_basis_functions():
+    assert basis_functions(["O", "H", "H"], "sto-3g") == 7
+    assert basis_functions(["O", "H", "H"], "6-31G(d,p)") == 25
+    assert basis_functions(["Cl"], "cc-pVDZ") == 18
+    # Minimal basis without a basis set, double zeta polarized for unknown ones
+    assert basis_functions(["O", "H", "H"], None) == 7
+    assert basis_functions(["O", "H", "H"], "my-basis") == 24
+
+
+def test_estimated_cost(energy_inp, water):
+    assert estimated_cost(energy_inp) == 7**3
+    mp2 = with_model(energy_inp, {"method": "mp2", "basis": "cc-pvdz"})
+    assert estimated_cost(mp2) == 24**5
+    optimization = DualProgramInput(
+        structure=water,
+        calctype="optimization",
+        subprogram="psi4",
+        subprogram_args={"model": {"method": "mp2"}},
+    )
+    assert estimated_cost(optimization) == 40 * 7**5
+
+
+def test_runtime_history(monkeypatch, tmp_path, energy_inp):
+    history = DiskRuntimeHistory(tmp_path / "runtimes.json", refresh=0)
+    monkeypatch.setattr(cost, "get_runtime_history", lambda: history)
+    default = estimated_cost(energy_inp) * settings.bigchem_seconds_per_cost
+    assert estimated_runtime("psi4", energy_inp) == pytest.approx(default)
+
+    history.record("psi4", energy_inp, 1.0)
+    history.record("psi4", energy_inp, 4.0)
+    history.record("psi4", energy_inp, None)
+    # Geometric mean of the recorded runtimes, only for the recorded program
+    assert estimated_runtime("psi4", energy_inp) == pytest.approx(2.0)
+    larger = with_model(energy_inp, {"method": "b3lyp", "basis": "cc-pvdz"})
+    assert estimated_runtime("psi4", larger) == pytest.approx(2.0 * (24 / 7) ** 3)
+    assert estimated_runtime("terachem", energy_inp) == pytest.approx(default)
+    assert estimated_runtime(None, energy_inp) == pytest.approx(default)
+
+    history.clear()
+    assert history.seconds_per_cost("psi4") is None
@@ -1,6 +1,31 @@
-from qcdata import CalcType, ProgramInput
+import numpy as np
+import pytest
+from qcdata import CalcType, ProgramInput, Structure
 
-from bigchem.utils import _gradient_inputs
+from bigchem.config import settings
+from bigchem.utils import (
+    _active_atoms,
+    _aligned_rmsd,
+    _batch_size,
+    _batches,
+    _check_logs,
+    _coordinate_value,
+    _energy_window,
+    _flatten_outputs,
+    _fragments,
+    _gradient_inputs,
+    _longest_first,
+    _mbe_coefficients,
+    _optimization_converged,
+    _scan_neighbors,
+    _scan_values,
+    _set_coordinates,
+    _symmetry_operations,
+    _symmetry_unique_atoms,
+    _unique_conformers,
+    _vibrational_basis,
+    _wavefront,
+)
 
 
 def test_gradient_inputs(water):
@@ -25,3 +50,257 @@ def test_gradient_inputs(water):
     for i, geom in enumerate(geoms):
         assert gradients[i].calctype == CalcType.gradient
         assert (gradients[i].structure.geometry.flatten() == geom).all()
+
+
+def test_gradient_inputs_subset_of_atoms(water):
+    gradients = _gradient_inputs(
+        ProgramInput(
+            structure=water, model={"method": "fake"}, calctype=CalcType.hessian
+        ),
+        1,
+        atoms=[1],
+    )
+
+    assert len(gradients) == 6
+    for i, gradient in enumerate(gradients):
+        diff = gradient.structure.geometry - water.geometry
+        assert np.isclose(diff[1, i // 2], 1 if i % 2 == 0 else -1)
+        assert np.count_nonzero(diff) == 1
+
+
+def test_gradient_inputs_forward(water):
+    dh = 1
+
+    gradients = _gradient_inputs(
+        ProgramInput(
+            structure=water, model={"method": "fake"}, calctype=CalcType.hessian
+        ),
+        dh,
+        stencil="forward",
+    )
+
+    assert len(gradients) == 3 * len(water.symbols)
+    for i, gradient in enumerate(gradients):
+        modified_geom = water.geometry.flatten()
+        modified_geom[i] += dh
+        assert (gradient.structure.geometry.flatten() == modified_geom).all()
+
+
+def test_gradient_inputs_unknown_stencil(water):
+    with pytest.raises(ValueError):
+        _gradient_inputs(
+            ProgramInput(
+                structure=water, model={"method": "fake"}, calctype=CalcType.hessian
+            ),
+            stencil="sideways",
+        )
+
+
+def test_symmetry_operations_methane(methane):
+    operations = _symmetry_operations(methane)
+    # Td point group
+    assert len(operations) == 24
+    geometry = methane.geometry
+    for rot, perm in operations:
+        np.testing.assert_allclose(rot @ rot.T, np.eye(3), atol=1e-10)
+        np.testing.assert_allclose(geometry @ rot.T, geometry[perm], atol=1e-10)
+    assert _symmetry_unique_atoms(operations) == [0, 1]
+
+
+def test_symmetry_operations_linear(hydrogen):
+    operations = _symmetry_operations(hydrogen)
+    assert len(operations) > 1
+    assert _symmetry_unique_atoms(operations) == [0]
+
+
+def test_symmetry_operations_planar(water):
+    # Every planar structure has at least the molecular plane as a mirror
+    water.geometry[1, 0] += 0.1
+    operations = _symmetry_operations(water)
+    assert len(operations) == 2
+    assert _symmetry_unique_atoms(operations) == [0, 1, 2]
+
+
+def test_symmetry_operations_asymmetric(methane):
+    # Perturb methane so that it has no symmetry beyond the identity
+    methane.geometry[1] += [0.1, 0.2, 0.0]
+    methane.geometry[2, 0] += 0.15
+    operations = _symmetry_operations(methane)
+    assert len(operations) == 1
+    assert _symmetry_unique_atoms(operations) == [0, 1, 2, 3, 4]
+
+
+def test_vibrational_basis(water, hydrogen):
+    basis = _vibrational_basis(water.geometry)
+    assert basis.shape == (3, 3, 3)
+    flat = basis.reshape(3, -1)
+    np.testing.assert_allclose(flat @ flat.T, np.eye(3), atol=1e-12)
+    # Orthogonal to translations and rotations
+    np.testing.assert_allclose(basis.sum(axis=1), 0, atol=1e-12)
+    coords = water.geometry - water.geometry.mean(axis=0)
+    np.testing.assert_allclose(np.cross(coords, basis).sum(axis=1), 0, atol=1e-12)
+
+    # Linear structures have 3N - 5 vibrational directions
+    assert _vibrational_basis(hydrogen.geometry).shape == (1, 2, 3)
+
+
+def test_gradient_inputs_directions(water):
+    directions = _vibrational_basis(water.geometry)
+    gradients = _gradient_inputs(
+        ProgramInput(
+            structure=water, model={"method": "fake"}, calctype=CalcType.hessian
+        ),
+        0.1,
+        directions=directions,
+    )
+    assert len(gradients) == 2 * len(directions)
+    for i, gradient in enumerate(gradients):
+        sign = 1 if i % 2 == 0 else -1
+        np.testing.assert_allclose(
+            gradient.structure.geometry,
+            water.geometry + sign * 0.1 * directions[i // 2],
+        )
+
+
+def test_active_atoms():
+    assert _active_atoms([2, 0, 2], 3) == [0, 2]
+
+    for active_atoms in ([], [0, 3], [-1]):
+        with pytest.raises(ValueError):
+            _active_atoms(active_atoms, 3)
+
+
+def test_batch_size(monkeypatch):
+    monkeypatch.setattr(settings, "bigchem_batch_atoms", 20)
+    # Small molecules are limited by keeping sqrt(n_calcs) tasks
+    assert _batch_size("auto", 3, 19) == 5
+    # Cost based batch size
+    assert _batch_size("auto", 10, 121) == 8
+    # Large molecules run one calculation per task
+    assert _batch_size("auto", 40, 481) == 1
+    assert _batch_size(7, 40, 481) == 7
+    with pytest.raises(ValueError):
+        _batch_size(0, 3, 19)
+    with pytest.raises(ValueError):
+        _batch_size("large", 3, 19)
+
+
+def test_batches_and_flatten_outputs():
+    batches = _batches(list(range(7)), 3)
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+    assert _flatten_outputs(batches) == list(range(7))
+    assert _flatten_outputs([[0, 1], 2]) == [0, 1, 2]
+
+
+def test_longest_first():
+    runtimes = [1.0, 5.0, 1.0, 3.0, 4.0]
+    assert _longest_first(runtimes) == [[1], [4], [3], [0], [2]]
+    # Batches of similar runtimes, the batch of the two longest calculations first
+    assert _longest_first(runtimes, 2) == [[1, 4], [3, 0], [2]]
+    assert _longest_first([2.0] * 5, 2) == [[0, 1], [2, 3], [4]]
+
+
+def test_unique_conformers(water):
+    geometry = np.asarray(water.geometry)
+    angle = 0.7
+    rotation = np.array(
+        [
+            [np.cos(angle), -np.sin(angle), 0],
+            [np.sin(angle), np.cos(angle), 0],
+            [0, 0, 1],
+        ]
+    )
+    rotated = geometry @ rotation.T + 1.0
+    assert _aligned_rmsd(rotated, geometry) == pytest.approx(0, abs=1e-8)
+
+    stretched = geometry.copy()
+    stretched[1] *= 1.5
+    structures = [
+        water.model_copy(update={"geometry": g}) for g in (stretched, rotated, geometry)
+    ]
+    # Rotated copy is a duplicate unless its energy differs
+    assert _unique_conformers(structures, [0.5, 0.0, 0.0], 0.1, 1e-4) == [1, 0]
+    assert _unique_conformers(structures, [0.5, 0.0, 0.1], 0.1, 1e-4) == [1, 2, 0]
+
+
+def test_energy_window():
+    energies = [0.3, 0.0, 0.1, 0.05]
+    assert _energy_window(energies) == [1, 3, 2, 0]
+    assert _energy_window(energies, energy_window=0.1) == [1, 3, 2]
+    assert _energy_window(energies, energy_window=0.1, max_count=2) == [1, 3]
+
+
+def test_set_coordinates_dihedral():
+    # Hydrogen peroxide
+    structure = Structure(
+        symbols=["H", "O", "O", "H"],
+        geometry=[[1.5, 1.2, 0.3], [0, 1.3, 0], [0, -1.3, 0], [1.5, -1.2, -0.5]],
+    )
+    scans = [{"type": "dihedral", "indices": [0, 1, 2, 3]}]
+    for value in (-170.0, 0.0, 120.0):
+        geometry = np.asarray(_set_coordinates(structure, scans, [value]).geometry)
+        assert _coordinate_value(geometry, "dihedral", [0, 1, 2, 3]) == pytest.approx(
+            value
+        )
+        # Only the hydrogen on the far side of the O-O bond moves
+        np.testing.assert_allclose(geometry[:3], structure.geometry[:3])
+        assert _coordinate_value(geometry, "distance", [2, 3]) == pytest.approx(
+            _coordinate_value(np.asarray(structure.geometry), "distance", [2, 3])
+        )
+
+
+def test_scan_values_unknown_type():
+    with pytest.raises(ValueError):
+        _scan_values([{"type": "torsion", "indices": [0, 1, 2, 3]}])
+
+
+def test_wavefront():
+    assert _wavefront((3, 3), (0, 1), 0) == [(0, 1)]
+    assert _wavefront((3, 3), (0, 1), 1) == [(0, 0), (0, 2), (1, 1)]
+    assert _wavefront((3, 3), (0, 1), 3) == [(2, 0), (2, 2)]
+    assert _wavefront((3, 3), (0, 1), 4) == []
+    assert _scan_neighbors((2, 2), (0, 1)) == [(1, 2), (2, 1)]
+
+
+def test_fragments(water):
+    shifted = np.asarray(water.geometry) + [10.0, 0.0, 0.0]
+    dimer = Structure(
+        symbols=water.symbols * 2,
+        geometry=np.concatenate([shifted, np.asarray(water.geometry)]),
+    )
+    assert _fragments(dimer) == [[0, 1, 2], [3, 4, 5]]
+
+
+def test_mbe_coefficients():
+    sizes = np.array([1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 3])
+    # E2 = sum(E_ij) - (n - 2) * sum(E_i) for 4 fragments
+    np.testing.assert_allclose(_mbe_coefficients(sizes, 4, 2), [-2] * 4 + [1] * 6 + [0])
+    np.testing.assert_allclose(_mbe_coefficients(sizes, 4, 1), [1] * 4 + [0] * 7)
+    np.testing.assert_allclose(_mbe_coefficients(sizes, 4, 3), [1] * 4 + [-1] * 6 + [1])
+
+
+def test_optimization_converged(harmonic_outputs, water):
+    optimization = ProgramInput(
+        structure=water, calctype="optimization", model={"method": "harmonic"}
+    )
+    (output,) = harmonic_outputs([optimization])
+
+    # Stopped before maxiter
+    assert _optimization_converged(output, 5)
+    # Stopped at maxiter with a large last step
+    assert not _optimization_converged(output, 1)
+    loose = optimization.model_copy(
+        update={"keywords": {"converge": ["energy", "1", "drms", "10", "dmax", "10"]}}
+    )
+    (output,) = harmonic_outputs([loose])
+    assert _optimization_converged(output, 1)
+
+
+@pytest.mark.parametrize("logs", ["keep", "drop", "offload"])
+def test_check_logs(logs):
+    _check_logs(logs)
+
+
+def test_check_logs_unknown_option():
+    with pytest.raises(ValueError, match="Unknown logs option 'compress'"):
+        _check_logs("compress")
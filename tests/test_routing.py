@@ -0,0 +1,101 @@
+import pytest
+from celery.app.routes import Router
+from qcdata import CalcType, ProgramInput
+
+from bigchem.algos import parallel_hessian
+from bigchem.app import bigchem
+from bigchem.config import settings
+from bigchem.routing import _prioritized, route_task
+
+
+@pytest.fixture
+def energy_inp(water):
+    return ProgramInput(
+        structure=water, calctype="energy", model={"method": "b3lyp", "basis": "sto-3g"}
+    )
+
+
+@pytest.fixture
+def priorities(monkeypatch):
+    monkeypatch.setattr(settings, "bigchem_priorities", True)
+    monkeypatch.setattr(settings, "bigchem_reducer_queue", "bigchem.reducers")
+
+
+def with_method(prog_input, method):
+    return ProgramInput(**{**prog_input.model_dump(), "model": {"method": method}})
+
+
+def test_route_task_single_queue_by_default(energy_inp):
+    assert route_task("bigchem.tasks.assemble_hessian", ([],), {}, {}) == {
+        "queue": "celery"
+    }
+    assert route_task("bigchem.tasks.compute", ("psi4", energy_inp), {}, {}) == {
+        "queue": "celery"
+    }
+    # The app keeps Celery's default queue without priorities
+    assert bigchem.conf.task_routes is None
+    assert bigchem.conf.task_queue_max_priority is None
+    with pytest.raises(ValueError):
+        parallel_hessian(
+            "psi4", energy_inp.model_copy(update={"calctype": "hessian"}), priority=8
+        )
+
+
+def test_route_task_reducers_first(monkeypatch, priorities, energy_inp):
+    # About 3.4 seconds for the energy
+    monkeypatch.setattr(settings, "bigchem_seconds_per_cost", 0.01)
+    reducer = route_task("bigchem.tasks.assemble_hessian", ([],), {}, {})
+    assert reducer == {
+        "queue": "bigchem.reducers",
+        "priority": settings.bigchem_max_priority,
+    }
+    calculation = route_task("bigchem.tasks.compute", ("psi4", energy_inp), {}, {})
+    assert calculation["queue"] == settings.bigchem_queue
+    assert calculation["priority"] < reducer["priority"]
+    # Shorter calculations run first, also in batches and with reversed arguments
+    expensive = with_method(energy_inp, "ccsd(t)")
+    assert (
+        route_task("bigchem.tasks.compute", (expensive, "psi4"), {}, {})["priority"]
+        < calculation["priority"]
+    )
+    batch = route_task(
+        "bigchem.tasks.compute_batch", ("psi4", [energy_inp] * 10), {}, {}
+    )
+    assert batch["priority"] == calculation["priority"] - 1
+    # Unknown cost
+    assert (
+        route_task("bigchem.tasks.compute_with_guess", ("psi4",), {}, {})["priority"]
+        == settings.bigchem_default_priority
+    )
+
+
+def test_route_task_large_queue_and_redis(monkeypatch, priorities, energy_inp):
+    monkeypatch.setattr(settings, "bigchem_large_cost", 1000.0)
+    expensive = energy_inp.model_copy(update={"calctype": CalcType.hessian})
+    large = route_task("bigchem.tasks.compute", ("psi4", expensive), {}, {})
+    assert large["queue"] == settings.bigchem_large_queue
+    small = route_task("bigchem.tasks.compute", ("psi4", energy_inp), {}, {})
+    assert small["queue"] == settings.bigchem_queue
+
+    # Redis serves lower values first
+    monkeypatch.setattr(settings, "bigchem_broker_url", "redis://localhost/0")
+    assert route_task("bigchem.tasks.task_sum", ([],), {}, {})["priority"] == 0
+
+
+def test_submission_priority(priorities, water):
+    hessian_inp = ProgramInput(
+        structure=water, calctype="hessian", model={"method": "b3lyp"}
+    )
+    signature = parallel_hessian("psi4", hessian_inp, priority=8)
+
+    gradients = list(signature.tasks)
+    assert {task.options["priority"] for task in gradients} == {8}
+    assert "priority" not in signature.body.options
+    # Explicit priorities take precedence over the router
+    router = Router([route_task], bigchem.amqp.queues, create_missing=True, app=bigchem)
+    route = router.route(gradients[0].options, gradients[0].task, gradients[0].args)
+    assert route["priority"] == 8
+    assert route["queue"].name == settings.bigchem_queue
+
+    with pytest.raises(ValueError):
+        _prioritized(signature, settings.bigchem_max_priority + 1)
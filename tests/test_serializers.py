@@ -0,0 +1,76 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pytest
+from qccompute.exceptions import QCComputeBaseError
+
+pytest.importorskip("msgpack")
+
+from bigchem.serializers import (  # noqa: E402
+    SERIALIZER_NAME,
+    dumps,
+    loads,
+    register_serializer,
+)
+from bigchem.utils import _gradient_inputs  # noqa: E402
+
+
+def test_program_input_round_trip(prog_inp):
+    prog_input = prog_inp("gradient")
+    loaded = loads(dumps(prog_input))
+    assert loaded == prog_input
+    assert isinstance(loaded.structure.geometry, np.ndarray)
+
+
+def test_program_output_round_trip(prog_output):
+    loaded = loads(dumps(prog_output))
+    assert type(loaded) is type(prog_output)
+    assert loaded == prog_output
+    assert loaded.model_fields_set == prog_output.model_fields_set
+
+
+def test_arrays_paths_and_containers_round_trip():
+    value = {
+        "float": np.arange(6, dtype=">f8").reshape(2, 3),
+        "int": np.arange(4, dtype=np.int32),
+        "scalar": np.float64(1.5),
+        "path": Path("/tmp/scratch"),
+        "bytes": b"\x00\x01",
+        1: [1, "two", None],
+    }
+    loaded = loads(dumps(value))
+    assert np.array_equal(loaded["float"], value["float"])
+    assert loaded["int"].dtype == np.int32
+    assert loaded["scalar"] == 1.5
+    assert loaded["path"] == value["path"]
+    assert loaded["bytes"] == value["bytes"]
+    assert loaded[1] == [1, "two", None]
+
+
+def test_exception_keeps_program_output(prog_output):
+    exc = QCComputeBaseError("failed", prog_output=prog_output)
+    loaded = loads(dumps(exc))
+    assert isinstance(loaded, QCComputeBaseError)
+    assert loaded.prog_output == prog_output
+
+
+def test_result_backend_keeps_program_output(prog_output):
+    """Fails if Celery stops storing exceptions as objects for registered codecs"""
+    from celery.backends import base
+
+    from bigchem.app import bigchem
+
+    register_serializer()
+    assert SERIALIZER_NAME in base.EXCEPTION_ABLE_CODECS
+
+    backend = base.Backend(app=bigchem, serializer=SERIALIZER_NAME)
+    exc = QCComputeBaseError("failed", prog_output=prog_output)
+    stored = loads(dumps(backend.prepare_exception(exc)))
+    assert backend.exception_to_python(stored).prog_output == prog_output
+
+
+def test_messages_smaller_than_pickle(prog_inp):
+    # Each displaced input is sent as its own task message
+    for message in _gradient_inputs(prog_inp("gradient"), 5.0e-3):
+        assert len(dumps(message)) < len(pickle.dumps(message))
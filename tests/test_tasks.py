@@ -1,3 +1,4 @@
+import io
 import json
 
 import numpy as np
@@ -5,6 +6,7 @@ import pytest
 from qccompute.exceptions import QCComputeBaseError
 from qcdata import (
     CalcType,
+    ProgramArgs,
     ProgramArgsSub,
     ProgramInput,
     ProgramOutput,
@@ -12,6 +14,12 @@ from qcdata import (
 
 from bigchem.canvas import group  # type:ignore
 from bigchem.tasks import assemble_hessian, compute, frequency_analysis, output_to_input
+from bigchem.utils import (
+    _gradient_inputs,
+    _symmetry_operations,
+    _symmetry_unique_atoms,
+    _vibrational_basis,
+)
 
 
 def test_hessian_task(test_data_dir, water):
@@ -34,6 +42,122 @@ def test_hessian_task(test_data_dir, water):
     assert prog_output.input_data.calctype == "hessian"
 
 
+def test_hessian_task_symmetrize(test_data_dir):
+    with open(test_data_dir / "hessian_gradients.json") as f:
+        gradients = [ProgramOutput(**g) for g in json.load(f)]
+
+    raw = assemble_hessian(list(gradients), 5.0e-3)
+    prog_output = assemble_hessian(gradients, 5.0e-3, symmetrize=True)
+
+    hessian = prog_output.data.hessian
+    asymmetry = prog_output.data.extras["hessian_asymmetry"]
+    assert asymmetry == raw.data.extras["hessian_asymmetry"]
+    assert asymmetry == pytest.approx(
+        np.abs(raw.data.hessian - raw.data.hessian.T).max()
+    )
+    assert 0 < asymmetry < 1e-4
+    np.testing.assert_allclose(hessian, hessian.T)
+    np.testing.assert_allclose(hessian, raw.data.hessian, atol=asymmetry)
+
+
+def test_hessian_task_symmetry(methane, harmonic_outputs):
+    """Hessian from symmetry-unique displacements matches the full hessian"""
+    prog_input = ProgramInput(
+        structure=methane, calctype="hessian", model={"method": "harmonic"}
+    )
+    energy_input = ProgramInput(
+        structure=methane, calctype="energy", model={"method": "harmonic"}
+    )
+    dh = 5.0e-3
+    full = assemble_hessian(
+        harmonic_outputs(_gradient_inputs(prog_input, dh) + [energy_input]), dh
+    )
+
+    atoms = _symmetry_unique_atoms(_symmetry_operations(methane))
+    inputs = _gradient_inputs(prog_input, dh, atoms) + [energy_input]
+    assert len(inputs) == 13
+    reduced = assemble_hessian(harmonic_outputs(inputs), dh, symmetry_tol=1e-3)
+
+    np.testing.assert_allclose(reduced.data.hessian, full.data.hessian, atol=1e-8)
+    assert reduced.data.energy == full.data.energy
+
+
+def test_hessian_task_forward_stencil(water, harmonic_outputs):
+    """Forward differences approximate central differences and reuse the reference
+    gradient's energy"""
+    prog_input = ProgramInput(
+        structure=water, calctype="hessian", model={"method": "harmonic"}
+    )
+    dh = 1.0e-4
+    central = assemble_hessian(
+        harmonic_outputs(
+            _gradient_inputs(prog_input, dh)
+            + [prog_input.model_copy(update={"calctype": CalcType.energy})]
+        ),
+        dh,
+    )
+    reference = prog_input.model_copy(update={"calctype": CalcType.gradient})
+    inputs = _gradient_inputs(prog_input, dh, stencil="forward") + [reference]
+    assert len(inputs) == 3 * len(water.symbols) + 1
+    forward = assemble_hessian(harmonic_outputs(inputs), dh, stencil="forward")
+
+    np.testing.assert_allclose(forward.data.hessian, central.data.hessian, atol=1e-3)
+    assert forward.data.energy == central.data.energy
+    assert forward.input_data.calctype == "hessian"
+
+
+@pytest.mark.parametrize("stencil", ("central", "forward"))
+def test_hessian_task_projected(water, harmonic_outputs, stencil):
+    """Hessian from vibrational displacements is the projected Cartesian hessian"""
+    prog_input = ProgramInput(
+        structure=water, calctype="hessian", model={"method": "harmonic"}
+    )
+    reference = prog_input.model_copy(update={"calctype": CalcType.gradient})
+    dh = 1.0e-4
+    full = assemble_hessian(
+        harmonic_outputs(_gradient_inputs(prog_input, dh) + [reference]), dh
+    ).data.hessian
+
+    directions = _vibrational_basis(water.geometry)
+    inputs = _gradient_inputs(prog_input, dh, stencil=stencil, directions=directions)
+    output = assemble_hessian(
+        harmonic_outputs(inputs + [reference]), dh, stencil=stencil, projected=True
+    )
+    projected = output.data.hessian
+    # Asymmetry of the finite differences before projection symmetrizes them
+    assert 0 < output.data.extras["hessian_asymmetry"] < 1e-3
+
+    flat = directions.reshape(len(directions), -1)
+    projector = flat.T @ flat
+    np.testing.assert_allclose(projected, projected.T, atol=1e-12)
+    np.testing.assert_allclose(
+        projected, projector @ ((full + full.T) / 2) @ projector, atol=1e-3
+    )
+
+
+def test_hessian_task_active_atoms(water, harmonic_outputs):
+    prog_input = ProgramInput(
+        structure=water, calctype="hessian", model={"method": "harmonic"}
+    )
+    energy_input = prog_input.model_copy(update={"calctype": CalcType.energy})
+    dh = 1.0e-4
+    full = assemble_hessian(
+        harmonic_outputs(_gradient_inputs(prog_input, dh) + [energy_input]), dh
+    ).data.hessian
+
+    inputs = _gradient_inputs(prog_input, dh, atoms=[1, 2]) + [energy_input]
+    assert len(inputs) == 13
+    partial = assemble_hessian(
+        harmonic_outputs(inputs), dh, active_atoms=[1, 2]
+    ).data.hessian
+
+    active = slice(3, 9)
+    np.testing.assert_allclose(partial, partial.T, atol=1e-12)
+    np.testing.assert_allclose(partial[active], full[active], atol=1e-6)
+    np.testing.assert_allclose(partial[:, active], full[:, active], atol=1e-6)
+    np.testing.assert_array_equal(partial[:3, :3], 0)
+
+
 def compare_eigenvector_arrays(arr1, arr2, decimal=6):
     for i, (vec1, vec2) in enumerate(
         zip(arr1.reshape(-1, arr1.shape[-1]), arr2.reshape(-1, arr2.shape[-1]))
@@ -105,6 +229,30 @@ def test_frequency_analysis_task_kwargs(test_data_dir):
     )
 
 
+def test_frequency_analysis_task_active_atoms(test_data_dir):
+    hessian_ar = ProgramOutput.model_validate_json(
+        (test_data_dir / "hessian_answer.json").read_text()
+    )
+    answer = ProgramOutput.model_validate_json(
+        (test_data_dir / "frequency_analysis_answer.json").read_text()
+    )
+
+    # With every atom active the vibrations match the regular analysis plus six
+    # near-zero rigid-body modes
+    output = frequency_analysis(hessian_ar, active_atoms=[0, 1, 2])
+    assert len(output.data.freqs_wavenumber) == 9
+    np.testing.assert_allclose(
+        output.data.freqs_wavenumber[-3:], answer.data.freqs_wavenumber, atol=1
+    )
+
+    # Freezing the oxygen leaves only hydrogen motion
+    output = frequency_analysis(hessian_ar, active_atoms=[1, 2])
+    assert len(output.data.freqs_wavenumber) == 6
+    assert output.data.normal_modes_cartesian.shape == (6, 3, 3)
+    np.testing.assert_array_equal(output.data.normal_modes_cartesian[:, 0], 0)
+    assert output.data.gibbs_free_energy > hessian_ar.data.energy
+
+
 @pytest.mark.parametrize(
     "program,model,keywords,batch",
     (
@@ -176,6 +324,62 @@ def test_result_to_input_optimization_result(water, prog_output):
     assert new_input.extras == program_args_sub.extras
 
 
+def test_output_to_input_single_point_hessian(prog_output, hydrogen):
+    program_args_sub = ProgramArgsSub(
+        subprogram="psi4", subprogram_args={"model": {"method": "b3lyp"}}
+    )
+    new_input = output_to_input(
+        prog_output, CalcType.transition_state, program_args_sub
+    )
+    assert new_input.structure == hydrogen
+    assert new_input.keywords["hessian"] == "file:initial_hessian.txt"
+    hessian = np.loadtxt(io.StringIO(new_input.files["initial_hessian.txt"]))
+    np.testing.assert_allclose(hessian, prog_output.data.hessian)
+
+    # The hessian isn't passed if disabled or to single point calculations
+    new_input = output_to_input(
+        prog_output, CalcType.optimization, program_args_sub, initial_hessian=False
+    )
+    assert new_input.files == {} and "hessian" not in new_input.keywords
+    new_input = output_to_input(
+        prog_output, CalcType.gradient, ProgramArgs(model={"method": "b3lyp"})
+    )
+    assert new_input.calctype == CalcType.gradient
+    assert new_input.files == {}
+
+
+def test_output_to_input_wavefunction(prog_output):
+    files = {"scr/c0": b"orbitals"}
+    output = prog_output.model_copy(
+        update={"data": prog_output.data.model_copy(update={"files": files})}
+    )
+    new_input = output_to_input(
+        output,
+        CalcType.energy,
+        ProgramArgs(model={"method": "b3lyp"}),
+        wfn_program="terachem",
+    )
+    assert new_input.files == {"c0": b"orbitals"}
+    assert new_input.keywords["guess"] == "c0"
+    assert "guess" not in output.input_data.keywords
+
+    new_input = output_to_input(
+        output,
+        CalcType.optimization,
+        ProgramArgsSub(
+            subprogram="terachem", subprogram_args={"model": {"method": "hf"}}
+        ),
+        wfn_program="terachem",
+    )
+    assert new_input.subprogram_args.files == {"c0": b"orbitals"}
+    assert new_input.subprogram_args.keywords["guess"] == "c0"
+
+    with pytest.raises(ValueError):
+        output_to_input(
+            output, CalcType.energy, ProgramArgs(model={"method": "hf"}), "psi4"
+        )
+
+
 def test_prog_output_serialized_when_raised_in_worker(hydrogen):
     # fake basis to trigger failure
     prog_input = ProgramInput(